@@ -0,0 +1,223 @@
+"""
+Автодополнение адресов по префиксному дереву (trie).
+
+Дерево строится в памяти процесса из геокодированных адресов (Address) и
+прямых ответов кэша геокодирования (GeocodeCacheEntry). Ключи приводятся к
+единой латинской "свертке" (api.text.transliterate), так что "Ляби-Хауз",
+"Lyabi Khauz" и "lyabi xauz" дают один ключ. Служебные слова (ул, д, г, ...)
+из ключей убираются.
+
+В каждом узле хранится готовый список лучших подсказок (по числу адресов с
+этим ключом), поэтому ответ - это проход по префиксу без обхода поддерева.
+Новые и обновленные адреса досчитываются в дерево по updated_at не чаще раза
+в ADDRESS_AUTOCOMPLETE_REFRESH_INTERVAL секунд (измененный адрес заменяет свою
+прежнюю подсказку); полная пересборка - раз в ADDRESS_AUTOCOMPLETE_REBUILD_INTERVAL
+секунд (убирает удаленные адреса).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .text import ADDRESS_ABBREVIATIONS, transliterate
+
+logger = logging.getLogger('api')
+
+MAX_KEY_LENGTH = 64
+
+# Служебные слова адреса в свертке: "ул", "улица", "ko'chasi", "д", ...
+_STOP_WORDS = {
+    transliterate(word)
+    for word in list(ADDRESS_ABBREVIATIONS.values()) + list(ADDRESS_ABBREVIATIONS) + ['кўчаси', 'кучаси', 'мфй']
+    if ' ' not in transliterate(word)
+}
+
+
+def fold(text):
+    """Свертка строки для ключа дерева: транслитерация, без служебных слов"""
+    words = [word for word in transliterate(text).split() if word not in _STOP_WORDS]
+    return ' '.join(words)[:MAX_KEY_LENGTH]
+
+
+class AddressTrie:
+    """Префиксное дерево подсказок с топ-K списком в каждом узле"""
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        # Узел: (дети, топ-K подсказок поддерева, подсказка с ключом, оканчивающимся в узле)
+        self.root = ({}, [], [])
+        # entries[i] = [вес, текст подсказки, широта, долгота]; вес 0 - подсказка снята
+        self.entries = []
+        self._entry_by_key = {}
+        # Источник -> ключ его подсказки
+        self._sources = {}
+
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry[0] > 0)
+
+    def insert(self, key, display, latitude, longitude, source=None):
+        """
+        Добавляет подсказку. Повторный ключ от нового источника (другой адрес в том же доме)
+        увеличивает ее вес; повторная вставка источника (адрес изменили) сначала снимает
+        его прежнюю подсказку
+        """
+        key = fold(key)
+        if source is not None:
+            previous_key = self._sources.pop(source, None)
+            if previous_key is not None:
+                self._remove(previous_key)
+        if not key:
+            return
+        if source is not None:
+            self._sources[source] = key
+
+        node = self.root
+        path = [node]
+        for ch in key:
+            child = node[0].get(ch)
+            if child is None:
+                child = node[0][ch] = ({}, [], [])
+            node = child
+            path.append(node)
+
+        entry_id = self._entry_by_key.get(key)
+        if entry_id is None:
+            entry_id = len(self.entries)
+            self.entries.append([0, display, float(latitude), float(longitude)])
+            self._entry_by_key[key] = entry_id
+        entry = self.entries[entry_id]
+        if entry[0] == 0:
+            entry[1] = display
+            node[2].append(entry_id)
+        entry[0] += 1
+        entry[2], entry[3] = float(latitude), float(longitude)
+
+        # Вес только вырос - достаточно поднять подсказку в топах по пути
+        for node in path:
+            self._update_top(node[1], entry_id)
+
+    def _remove(self, key):
+        """Снимает один источник с подсказки key и пересчитывает топы по ее пути"""
+        entry_id = self._entry_by_key[key]
+        entry = self.entries[entry_id]
+        entry[0] -= 1
+
+        path = [self.root]
+        for ch in key:
+            path.append(path[-1][0][ch])
+        if entry[0] == 0:
+            path[-1][2].remove(entry_id)
+
+        # Вес упал - в топ может войти подсказка, которой в нем не было: топ узла
+        # собирается заново из его подсказки и топов детей, от листа к корню
+        for node in reversed(path):
+            candidates = set(node[2])
+            for child in node[0].values():
+                candidates.update(child[1])
+            node[1][:] = sorted(candidates, key=self._rank)[:self.top_k]
+
+    def _rank(self, entry_id):
+        entry = self.entries[entry_id]
+        return -entry[0], len(entry[1])
+
+    def _update_top(self, top, entry_id):
+        if entry_id not in top:
+            top.append(entry_id)
+        top.sort(key=self._rank)
+        del top[self.top_k:]
+
+    def suggest(self, query, limit=10):
+        """Подсказки для префикса: [{'address', 'lat', 'lon'}]"""
+        key = fold(query)
+        if not key:
+            return []
+        node = self.root
+        for ch in key:
+            node = node[0].get(ch)
+            if node is None:
+                return []
+
+        suggestions = []
+        seen = set()
+        for entry_id in node[1]:
+            _, display, lat, lon = self.entries[entry_id]
+            if display in seen:
+                continue
+            seen.add(display)
+            suggestions.append({'address': display, 'lat': lat, 'lon': lon})
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+def _load_into(trie, since=None):
+    """Добавляет в дерево адреса и ответы кэша, измененные после since"""
+    from .geocode_store import KIND_FORWARD
+    from .models import Address, GeocodeCacheEntry
+
+    addresses = Address.objects.filter(
+        geocode_status=Address.GEOCODE_OK, latitude__isnull=False, longitude__isnull=False
+    )
+    entries = GeocodeCacheEntry.objects.filter(
+        kind=KIND_FORWARD, latitude__isnull=False, longitude__isnull=False
+    )
+    if since is not None:
+        addresses = addresses.filter(updated_at__gte=since)
+        entries = entries.filter(updated_at__gte=since)
+
+    rows = addresses.values_list('id', 'street', 'house_number', 'city', 'latitude', 'longitude')
+    for address_id, street, house_number, city, lat, lon in rows.iterator(chunk_size=2000):
+        display = f'{street}, {house_number}, {city}'
+        source = ('address', address_id)
+        # Улица первой - так набирают чаще; город первым - для "Бухара, ..."
+        trie.insert(f'{street} {house_number} {city}', display, lat, lon, source)
+        trie.insert(f'{city} {street} {house_number}', display, lat, lon, source + ('city',))
+
+    rows = entries.values_list('id', 'latitude', 'longitude', 'result')
+    for entry_id, lat, lon, result in rows.iterator(chunk_size=2000):
+        components = result.get('components') or {}
+        if result.get('precision') not in (None, 'exact') or not components.get('street') or not components.get('house'):
+            continue
+        display = ', '.join(filter(None, (components['street'], components['house'], components.get('locality'))))
+        trie.insert(display, display, lat, lon, ('geocode', entry_id))
+
+
+_lock = threading.Lock()
+_state = {'trie': None, 'built_at': 0.0, 'refreshed_at': 0.0, 'watermark': None}
+
+
+def get_address_trie():
+    """Дерево подсказок процесса: строится при первом обращении и досчитывается по updated_at"""
+    from django.utils import timezone
+
+    now = time.monotonic()
+    refresh_interval = getattr(settings, 'ADDRESS_AUTOCOMPLETE_REFRESH_INTERVAL', 5)
+    if _state['trie'] is not None and now - _state['refreshed_at'] < refresh_interval:
+        return _state['trie']
+
+    with _lock:
+        if _state['trie'] is not None and now - _state['refreshed_at'] < refresh_interval:
+            return _state['trie']
+
+        started = time.perf_counter()
+        watermark = timezone.now()
+        rebuild_interval = getattr(settings, 'ADDRESS_AUTOCOMPLETE_REBUILD_INTERVAL', 3600)
+        if _state['trie'] is None or now - _state['built_at'] >= rebuild_interval:
+            trie = AddressTrie(top_k=getattr(settings, 'ADDRESS_AUTOCOMPLETE_TOP_K', 10))
+            _load_into(trie)
+            _state.update(trie=trie, built_at=now)
+            logger.info(
+                f"Address autocomplete trie built: {len(trie)} suggestions "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+        else:
+            # Пересекающееся окно по времени безопасно: повтор источника заменяет его подсказку
+            _load_into(_state['trie'], since=_state['watermark'])
+        _state.update(refreshed_at=now, watermark=watermark)
+        return _state['trie']
+
+
+def reset_address_trie():
+    with _lock:
+        _state.update(trie=None, built_at=0.0, refreshed_at=0.0, watermark=None)
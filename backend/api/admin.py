@@ -3,7 +3,7 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Sum, Count
-from .models import User, MenuItem, Order, OrderItem, Category, Address, AddOn, SizeOption, Promotion, DeliveryZone, Favorite
+from .models import User, MenuItem, Order, OrderItem, Category, Address, AddOn, SizeOption, Promotion, DeliveryZone, Favorite, GeocodeCacheEntry
 
 
 @admin.register(Category)
@@ -77,7 +77,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('user__first_name', 'user__username', 'notes')
     ordering = ['-created_at']
     list_editable = ['status']
-    readonly_fields = ['total_price', 'created_at']
+    readonly_fields = ['total_price', 'created_at', 'delivery_zone']
     
     inlines = [OrderItemInline]
     
@@ -86,7 +86,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('user', 'status', 'total_price', 'created_at')
         }),
         ('Доставка', {
-            'fields': ('address', 'delivery_fee', 'delivery_time', 'notes')
+            'fields': ('address', 'delivery_zone', 'delivery_fee', 'delivery_time', 'notes')
         }),
         ('Акции', {
             'fields': ('promotion', 'discounted_total'),
@@ -178,12 +178,12 @@ class OrderItemAdmin(admin.ModelAdmin):
 
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
-    list_display = ['user_info', 'full_address_display', 'city', 'is_primary', 'phone_number', 'coordinates_display', 'created_at']
-    list_filter = ['is_primary', 'city', 'created_at']
+    list_display = ['user_info', 'full_address_display', 'city', 'is_primary', 'phone_number', 'coordinates_display', 'geocode_status', 'created_at']
+    list_filter = ['is_primary', 'city', 'geocode_status', 'created_at']
     search_fields = ['user__first_name', 'user__username', 'street', 'city', 'phone_number']
     ordering = ['-is_primary', '-created_at']
     list_editable = ['is_primary']
-    readonly_fields = ['created_at', 'updated_at', 'full_address', 'coordinates']
+    readonly_fields = ['created_at', 'updated_at', 'full_address', 'coordinates', 'geocode_status', 'delivery_zone']
     
     fieldsets = (
         ('Основная информация', {
@@ -193,7 +193,7 @@ class AddressAdmin(admin.ModelAdmin):
             'fields': ('street', 'house_number', 'apartment', 'city')
         }),
         ('Координаты', {
-            'fields': ('latitude', 'longitude', 'coordinates'),
+            'fields': ('latitude', 'longitude', 'coordinates', 'geocode_status', 'delivery_zone'),
             'classes': ('collapse',)
         }),
         ('Дополнительно', {
@@ -232,13 +232,14 @@ class DeliveryZoneAdmin(admin.ModelAdmin):
     search_fields = ('name', 'city')
     ordering = ['city', 'name']
     list_editable = ['delivery_fee', 'min_order_amount', 'is_active']
+    readonly_fields = ['polygon_vertices']
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'city', 'is_active')
         }),
         ('География', {
-            'fields': ('polygon_coordinates',),
+            'fields': ('polygon_coordinates', 'polygon_vertices'),
             'description': 'Задайте координаты полигона для точных границ зоны'
         }),
         ('Стилизация полигона', {
@@ -260,9 +261,24 @@ class DeliveryZoneAdmin(admin.ModelAdmin):
                 'Введите координаты в формате: [[широта, долгота], [широта, долгота], ...]'
             )
         return form
+    
+    def polygon_vertices(self, obj):
+        original = len(obj.polygon_coordinates or [])
+        compact = len(obj.polygon_compact or [])
+        return f"{original} → {compact}"
+    polygon_vertices.short_description = 'Вершин (исходный → упрощенный)'
 
 
 # Настройка админ-панели
 admin.site.site_header = "StreetBurger Админ-панель"
 admin.site.site_title = "StreetBurger"
 admin.site.index_title = "Управление рестораном"
+
+
+@admin.register(GeocodeCacheEntry)
+class GeocodeCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'kind', 'latitude', 'longitude', 'updated_at')
+    list_filter = ('kind',)
+    search_fields = ('key',)
+    ordering = ['-updated_at']
+    readonly_fields = ['created_at', 'updated_at']
@@ -1,6 +1,5 @@
-import requests
 import logging
-from django.conf import settings
+from . import http_client
 from .tasks import send_telegram_notification
 
 logger = logging.getLogger('api')
@@ -42,7 +41,6 @@ def send_notification_sync(telegram_id, message, parse_mode='HTML'):
         dict: Результат отправки
     """
     try:
-        url = f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage"
         payload = {
             'chat_id': telegram_id,
             'text': message,
@@ -50,7 +48,7 @@ def send_notification_sync(telegram_id, message, parse_mode='HTML'):
             'disable_web_page_preview': True,
         }
         
-        response = requests.post(url, json=payload, timeout=10)
+        response = http_client.telegram_request('sendMessage', payload)
         response.raise_for_status()
         
         result = response.json()
@@ -0,0 +1,173 @@
+"""
+Версионированный кэш каталога (меню и его синхронизация, категории, хиты, новинки, рекомендуемые).
+
+Все ключи каталога включают номер поколения из кэша. Любое изменение модели
+каталога увеличивает поколение одним INCR (сигналы в api.signals), после
+чего старые ключи просто перестают читаться и вытесняются по TTL - искать
+и удалять их по именам не нужно.
+
+Ответы каталога хранятся уже готовыми: байты JSON, их gzip- и brotli-варианты
+и ETag по хэшу содержимого. Запрос с попаданием в кэш отдает байты без
+сериализации и рендеринга, а клиент с актуальной копией получает 304.
+"""
+import gzip
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .single_flight import single_flight
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен - без него отдаем gzip
+    brotli = None
+
+logger = logging.getLogger('api')
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+
+
+def _initial_generation():
+    # Поколение после потери ключа не должно совпасть с одним из прежних
+    return int(time.time() * 1000)
+
+
+def get_catalog_generation():
+    """Текущее поколение каталога"""
+    try:
+        generation = cache.get(CATALOG_GENERATION_KEY)
+        if generation is None:
+            cache.add(CATALOG_GENERATION_KEY, _initial_generation(), None)
+            generation = cache.get(CATALOG_GENERATION_KEY)
+        if generation is not None:
+            return generation
+    except Exception as e:
+        logger.warning(f"Cache error reading catalog generation: {str(e)}")
+    return 0
+
+
+def catalog_cache_key(name, *parts):
+    """Ключ кэша каталога текущего поколения, например 'catalog:1731:menu'"""
+    return ':'.join(['catalog', str(get_catalog_generation()), name, *map(str, parts)])
+
+
+def _bump():
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        # Ключа нет (сброс кэша) - начинаем новое поколение
+        cache.set(CATALOG_GENERATION_KEY, _initial_generation(), None)
+    except Exception as e:
+        logger.warning(f"Cache error bumping catalog generation: {str(e)}")
+
+
+def bump_catalog_generation():
+    """Инвалидирует весь кэш каталога"""
+    _bump()
+    # Повторяем после коммита, чтобы не закэшировать данные до фиксации транзакции
+    transaction.on_commit(_bump)
+
+
+def get_or_build(name, build, timeout):
+    """
+    Данные каталога из кэша текущего поколения; при промахе build() и сохранение.
+    Ошибки кэша не ломают ответ - данные просто строятся заново
+    """
+    key = catalog_cache_key(name)
+    try:
+        data = cache.get(key)
+        if data is not None:
+            logger.info(f"Catalog '{name}' served from cache")
+            return data
+    except Exception as e:
+        logger.warning(f"Cache error: {str(e)}")
+
+    data = build()
+    try:
+        cache.set(key, data, timeout)
+    except Exception as e:
+        logger.warning(f"Failed to cache catalog '{name}': {str(e)}")
+    return data
+
+
+def render_payload(data):
+    """Готовый ответ: байты JSON, сжатые варианты и ETag"""
+    body = JSONRenderer().render(data)
+    payload = {
+        'etag': '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(),
+        'identity': body,
+    }
+    # Маленькие ответы сжимать невыгодно - заголовки и CPU дороже экономии
+    if len(body) >= getattr(settings, 'CATALOG_COMPRESS_MIN_BYTES', 512):
+        payload['gzip'] = gzip.compress(body, compresslevel=getattr(settings, 'CATALOG_GZIP_LEVEL', 9), mtime=0)
+        if brotli is not None:
+            payload['br'] = brotli.compress(body, quality=getattr(settings, 'CATALOG_BROTLI_QUALITY', 11))
+    return payload
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        # Суффикс кодировки (как у nginx/Apache) не меняет содержимое
+        if tag.split('-', 1)[0].rstrip('"') == etag.rstrip('"'):
+            return True
+    return False
+
+
+def payload_response(request, payload):
+    """HTTP-ответ из готового payload с учетом If-None-Match и Accept-Encoding"""
+    if _etag_matches(request, payload['etag']):
+        response = HttpResponseNotModified()
+        response['ETag'] = payload['etag']
+    else:
+        accepted = _accepted_encodings(request)
+        encoding = next((name for name in ('br', 'gzip') if name in payload and name in accepted), None)
+        response = HttpResponse(payload[encoding or 'identity'], content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+            response['ETag'] = '%s-%s"' % (payload['etag'][:-1], encoding)
+        else:
+            response['ETag'] = payload['etag']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def catalog_response(request, name, build, timeout):
+    """
+    Ответ каталога из готовых байтов кэша текущего поколения; при промахе
+    build() рендерится и сжимается один раз. Сжатие на максимальных уровнях
+    дорогое, поэтому одновременные промахи (в том числе в других процессах)
+    ждут первого через single_flight, а не сжимают каждый сам
+    """
+    # Отдельный ключ: готовые байты не путаются с данными, закэшированными как dict
+    name = f'{name}:payload'
+    payload = get_or_build(
+        name,
+        lambda: single_flight(catalog_cache_key(name), lambda: render_payload(build())),
+        timeout,
+    )
+    return payload_response(request, payload)
@@ -0,0 +1,88 @@
+"""
+Журнал изменений каталога и дельта-синхронизация меню.
+
+Каждое изменение товара или категории пишется строкой CatalogChange
+(сигналы в api.signals); id последней строки - версия каталога. Клиент
+хранит версию из прошлого ответа и запрашивает только изменения после нее.
+Если нужная часть журнала уже удалена compact_catalog_changes, версия
+неизвестна или записей после нее слишком много, клиент получает полный
+снимок - один общий для всех таких версий.
+"""
+import logging
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+logger = logging.getLogger('api')
+
+
+def record_changes(kind, object_ids, action):
+    """Записывает в журнал изменение объектов каталога"""
+    from .models import CatalogChange
+
+    object_ids = {object_id for object_id in object_ids if object_id is not None}
+    if not object_ids:
+        return
+    CatalogChange.objects.bulk_create(
+        CatalogChange(kind=kind, object_id=object_id, action=action) for object_id in sorted(object_ids)
+    )
+
+
+def get_catalog_version():
+    """Текущая версия каталога (0, пока журнал пуст)"""
+    from .models import CatalogChange
+
+    return CatalogChange.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def delta_available(since, version):
+    """
+    Можно ли построить дельту (since, version] по журналу. Проверка дешевая
+    (агрегат по первичному ключу), поэтому делается до обращения к кэшу:
+    все случаи "нужен снимок" сводятся к одному общему ответу
+    """
+    from .models import CatalogChange
+
+    if since is None or since < 0 or since > version:
+        # Версия не из этого журнала (например, после пересоздания базы)
+        return False
+    if since == version:
+        return True
+    if version - since > getattr(settings, 'CATALOG_SYNC_MAX_CHANGES', 500):
+        # Записей больше лимита - дельта почти как весь каталог, снимок не дороже
+        return False
+    oldest = CatalogChange.objects.aggregate(oldest=Min('id'))['oldest']
+    # Строки после since могли быть удалены при сжатии журнала
+    return oldest is not None and since >= oldest - 1
+
+
+def changes_since(since, version):
+    """
+    Изменения в интервале (since, version]: (id измененных товаров, менялись ли категории).
+    Вызывается только после delta_available()
+    """
+    from .models import CatalogChange
+
+    rows = CatalogChange.objects.filter(id__gt=since, id__lte=version).values_list('kind', 'object_id')
+    item_ids = set()
+    categories_changed = False
+    for kind, object_id in rows.iterator(chunk_size=2000):
+        if kind == CatalogChange.KIND_ITEM:
+            item_ids.add(object_id)
+        else:
+            categories_changed = True
+    return item_ids, categories_changed
+
+
+def compact_catalog_changes(before):
+    """
+    Удаляет записи журнала старше before, оставляя последнюю - по ней
+    определяется текущая версия. Возвращает число удаленных записей
+    """
+    from .models import CatalogChange
+
+    version = get_catalog_version()
+    deleted, _ = CatalogChange.objects.filter(created_at__lt=before, id__lt=version).delete()
+    if deleted:
+        logger.info(f"Catalog change log compacted: {deleted} entries removed, version={version}")
+    return deleted
@@ -0,0 +1,123 @@
+"""
+Быстрая read-only сериализация товаров для горячих эндпоинтов каталога.
+
+serialize_menu_items() дает тот же результат, что MenuItemSerializer(many=True).data,
+но без полей DRF на каждый объект: товары читаются через .values(), размеры
+и дополнения - тремя запросами на весь список и раскладываются по id товара.
+Форматирование десятичных чисел и дат делегируется полям DRF, поэтому после
+JSONRenderer вывод совпадает побайтно (проверяется в тестах и в
+benchmark_serializers).
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .models import AddOn, MenuItem, SizeOption
+
+MENU_ITEM_FIELDS = ('id', 'name', 'description', 'price', 'category', 'image', 'created_at', 'is_hit', 'is_new', 'priority')
+SIZE_OPTION_FIELDS = ('id', 'name', 'price_modifier', 'description', 'menu_item', 'is_active')
+ADD_ON_FIELDS = ('id', 'name', 'price', 'category', 'is_active')
+
+
+def _decimal_field(model, name):
+    field = model._meta.get_field(name)
+    return serializers.DecimalField(max_digits=field.max_digits, decimal_places=field.decimal_places)
+
+
+_item_price = _decimal_field(MenuItem, 'price')
+_size_price = _decimal_field(SizeOption, 'price_modifier')
+_add_on_price = _decimal_field(AddOn, 'price')
+_datetime = serializers.DateTimeField()
+_image_storage = MenuItem._meta.get_field('image').storage
+
+
+def _size_options_by_item(item_ids, active_only):
+    sizes = SizeOption.objects.filter(menuitem__in=item_ids)
+    if active_only:
+        sizes = sizes.filter(is_active=True)
+    by_item = defaultdict(list)
+    # Порядок - Meta.ordering SizeOption, как у item.size_options.all()
+    for row in sizes.values('menuitem', *SIZE_OPTION_FIELDS):
+        by_item[row['menuitem']].append({
+            'id': row['id'],
+            'name': row['name'],
+            'price_modifier': _size_price.to_representation(row['price_modifier']),
+            'description': row['description'],
+            'menu_item': row['menu_item'],
+            'is_active': row['is_active'],
+        })
+    return by_item
+
+
+def _add_ons_by_item(item_ids, active_only):
+    add_ons = AddOn.objects.filter(menuitem__in=item_ids)
+    if active_only:
+        add_ons = add_ons.filter(is_active=True)
+    rows = list(add_ons.values('menuitem', *ADD_ON_FIELDS))
+
+    categories = defaultdict(list)
+    links = AddOn.available_for_categories.through.objects.filter(
+        addon_id__in={row['id'] for row in rows}
+    ).order_by('addon_id', 'category_id')
+    for add_on_id, category_id in links.values_list('addon_id', 'category_id'):
+        categories[add_on_id].append(category_id)
+
+    by_item = defaultdict(list)
+    for row in rows:
+        by_item[row['menuitem']].append({
+            'id': row['id'],
+            'name': row['name'],
+            'price': _add_on_price.to_representation(row['price']),
+            'category': row['category'],
+            'available_for_categories': categories[row['id']],
+            'is_active': row['is_active'],
+        })
+    return by_item
+
+
+def serialize_menu_items(queryset, active_options=False):
+    """
+    Список товаров в формате MenuItemSerializer. active_options - только
+    активные размеры и дополнения (как у меню с Prefetch по is_active)
+    """
+    items = list(queryset.values(*MENU_ITEM_FIELDS))
+    item_ids = [row['id'] for row in items]
+    if not item_ids:
+        return []
+    sizes = _size_options_by_item(item_ids, active_options)
+    add_ons = _add_ons_by_item(item_ids, active_options)
+
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'price': _item_price.to_representation(row['price']),
+            'category': row['category'],
+            'image': _image_storage.url(row['image']) if row['image'] else None,
+            'created_at': _datetime.to_representation(row['created_at']),
+            'is_hit': row['is_hit'],
+            'is_new': row['is_new'],
+            'priority': row['priority'],
+            'size_options': sizes.get(row['id'], []),
+            'add_on_options': add_ons.get(row['id'], []),
+        }
+        for row in items
+    ]
+
+
+def serialize_favorites(queryset):
+    """Список избранного в формате FavoriteSerializer"""
+    favorites = list(queryset.values('id', 'menu_item', 'created_at'))
+    items = {
+        item['id']: item
+        for item in serialize_menu_items(MenuItem.objects.filter(id__in={row['menu_item'] for row in favorites}))
+    }
+    return [
+        {
+            'id': row['id'],
+            'menu_item': items[row['menu_item']],
+            'created_at': _datetime.to_representation(row['created_at']),
+        }
+        for row in favorites
+    ]
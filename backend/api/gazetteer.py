@@ -0,0 +1,184 @@
+"""
+Локальный справочник адресов (газеттир): нормализованный адрес -> координаты.
+
+Строится командой build_gazetteer из уже геокодированных адресов и хранится в
+компактном файле, который процессы открывают через mmap и делят между собой
+через страничный кэш ОС. Формат файла:
+
+    заголовок   MAGIC (8 байт), количество записей (uint32), резерв (uint32)
+    записи      смещение ключа (uint32), длина ключа (uint16), выравнивание (2 байта),
+                широта и долгота в микроградусах (int32, int32) - 16 байт на запись
+    ключи       UTF-8 ключи подряд, записи отсортированы по байтам ключа
+
+Поиск - двоичный по отсортированным ключам, поэтому и точное совпадение, и
+выборка по префиксу стоят O(log n) без загрузки файла в память.
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+from .text import normalize_address
+
+logger = logging.getLogger('api')
+
+MAGIC = b'BBGAZ\x00\x01\x00'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<IHxxii')
+MICRODEGREES = 1_000_000
+
+# Квартира не влияет на координаты дома
+_APARTMENT_RE = re.compile(r'(?:^| )кв \S+')
+
+
+def gazetteer_key(text):
+    """Ключ газеттира: нормализованный адрес без квартиры"""
+    key = _APARTMENT_RE.sub('', normalize_address(text))
+    return ' '.join(key.split())
+
+
+def address_keys(street, house_number, city):
+    """Варианты ключа адреса: город в конце (как Address.full_address) и в начале"""
+    return {
+        gazetteer_key(f'{street}, {house_number}, {city}'),
+        gazetteer_key(f'{city}, {street}, {house_number}'),
+    }
+
+
+def write_gazetteer(path, entries):
+    """
+    Записывает газеттир в файл атомарно.
+    entries: {ключ: (широта, долгота)}
+    """
+    items = sorted((key.encode('utf-8'), point) for key, point in entries.items() if key)
+    blob = bytearray()
+    records = bytearray()
+    for key, (lat, lon) in items:
+        records += RECORD.pack(
+            len(blob), len(key),
+            round(float(lat) * MICRODEGREES), round(float(lon) * MICRODEGREES)
+        )
+        blob += key
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(items), 0))
+        f.write(records)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(items)
+
+
+class Gazetteer:
+    """Газеттир, открытый через mmap только для чтения"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f'{path} is not a gazetteer file')
+        self._keys_base = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._mm.close()
+
+    def _record(self, i):
+        offset, length, lat, lon = RECORD.unpack_from(self._mm, HEADER.size + i * RECORD.size)
+        start = self._keys_base + offset
+        return self._mm[start:start + length], lat / MICRODEGREES, lon / MICRODEGREES
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, text):
+        """Координаты адреса (широта, долгота) или None"""
+        key = gazetteer_key(text).encode('utf-8')
+        if not key:
+            return None
+        i = self._lower_bound(key)
+        if i < self.count:
+            found, lat, lon = self._record(i)
+            if found == key:
+                return lat, lon
+        return None
+
+    def prefix(self, text, limit=10):
+        """Адреса, ключ которых начинается с нормализованного text: [(ключ, широта, долгота)]"""
+        key = gazetteer_key(text).encode('utf-8')
+        results = []
+        i = self._lower_bound(key)
+        while i < self.count and len(results) < limit:
+            found, lat, lon = self._record(i)
+            if not found.startswith(key):
+                break
+            results.append((found.decode('utf-8'), lat, lon))
+            i += 1
+        return results
+
+
+_lock = threading.Lock()
+_state = {'gazetteer': None, 'mtime': None, 'checked_at': 0.0}
+
+
+def get_gazetteer():
+    """
+    Газеттир процесса или None, если файл не построен.
+    Изменение файла подхватывается не чаще раза в GAZETTEER_CHECK_INTERVAL секунд
+    """
+    now = time.monotonic()
+    if now - _state['checked_at'] < getattr(settings, 'GAZETTEER_CHECK_INTERVAL', 30):
+        return _state['gazetteer']
+
+    with _lock:
+        _state['checked_at'] = now
+        path = getattr(settings, 'GAZETTEER_PATH', None)
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            mtime = None
+
+        if mtime != _state['mtime']:
+            # Старый mmap не закрываем явно: его может читать другой поток, закроет сборщик мусора
+            gazetteer = None
+            if mtime is not None:
+                try:
+                    gazetteer = Gazetteer(path)
+                    logger.info(f"Gazetteer loaded: {len(gazetteer)} addresses from {path}")
+                except (OSError, ValueError, struct.error) as e:
+                    logger.error(f"Error loading gazetteer {path}: {str(e)}")
+            _state['gazetteer'], _state['mtime'] = gazetteer, mtime
+    return _state['gazetteer']
+
+
+def reset_gazetteer():
+    """Сбрасывает газеттир процесса; следующий get_gazetteer перечитает файл"""
+    with _lock:
+        _state.update(gazetteer=None, mtime=None, checked_at=0.0)
+
+
+def lookup_address(text):
+    """Координаты адреса из газеттира или None"""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.lookup(text)
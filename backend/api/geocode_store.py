@@ -0,0 +1,367 @@
+"""
+Трехуровневое хранилище ответов геокодера.
+
+1. memory - LRU с TTL в памяти процесса;
+2. cache  - кэш Django (Redis);
+3. db     - таблица GeocodeCacheEntry, переживающая сброс Redis и работу на LocMemCache.
+
+Перед ними прямое геокодирование проверяет локальный газеттир (api.gazetteer).
+
+Поиск идет сверху вниз, найденное на нижнем уровне поднимается на верхние.
+Ключи: нормализованная строка адреса для прямого геокодирования и ячейка
+сетки с шагом GEOCODE_REVERSE_GRID_M для обратного, так что два касания карты
+в метре друг от друга дают один ключ. При промахе по ячейке обратный поиск
+может взять ответ ближайшей сохраненной точки в радиусе
+GEOCODE_REVERSE_NEIGHBOUR_M. По каждому уровню считаются попадания и промахи.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError
+
+from .gazetteer import lookup_address
+from .geometry import KM_PER_DEGREE
+from .text import normalize_address
+
+try:
+    from prometheus_client import Counter
+except ImportError:  # prometheus_client не установлен - остаются только счетчики в процессе
+    Counter = None
+
+logger = logging.getLogger('api')
+
+KIND_FORWARD = 'forward'
+KIND_REVERSE = 'reverse'
+TIERS = ('gazetteer', 'memory', 'cache', 'db', 'neighbour')
+
+METERS_PER_DEGREE = KM_PER_DEGREE * 1000
+
+if Counter is not None:
+    LOOKUPS = Counter(
+        'babay_geocode_cache_lookups_total',
+        'Обращения к уровням кэша геокодирования',
+        ['tier', 'result'],
+    )
+else:
+    LOOKUPS = None
+
+
+def make_record(lat, lon, address=None, precision=None, kind=None, components=None):
+    """
+    Компактная запись геокодирования - то, что кэшируется и отдается клиентам.
+    precision и kind - точность и тип объекта по классификации Яндекса ('exact', 'street', 'house', ...)
+    """
+    return {
+        'lat': lat,
+        'lon': lon,
+        'address': address,
+        'precision': precision,
+        'kind': kind,
+        'components': components or {},
+    }
+
+
+def compact_geocode_record(feature, include_raw=None):
+    """
+    Компактная запись из GeoObject Яндекса. Полный GeoObject добавляется в поле 'raw'
+    только при GEOCODE_INCLUDE_RAW (отладка)
+    """
+    lon, lat = feature['Point']['pos'].split()
+    meta = feature.get('metaDataProperty', {}).get('GeocoderMetaData', {})
+    address = meta.get('Address', {})
+    # Компонент одного типа может повторяться (province) - оставляем самый точный, он последний
+    components = {item['kind']: item['name'] for item in address.get('Components', []) if 'kind' in item}
+    record = make_record(
+        float(lat), float(lon),
+        address=address.get('formatted') or meta.get('text'),
+        precision=meta.get('precision'),
+        kind=meta.get('kind'),
+        components=components,
+    )
+    if include_raw is None:
+        include_raw = getattr(settings, 'GEOCODE_INCLUDE_RAW', False)
+    if include_raw:
+        record['raw'] = feature
+    return record
+
+
+def forward_key(address):
+    """Ключ прямого геокодирования: нормализованный адрес"""
+    return normalize_address(address)[:255]
+
+
+def store_key(kind, key):
+    """Ключ записи в кэше Django; хэшируется, так как адреса содержат пробелы и кириллицу"""
+    return f"geocode:{kind}:{hashlib.md5(key.encode('utf-8')).hexdigest()}"
+
+
+def _reverse_grid_m():
+    return max(float(getattr(settings, 'GEOCODE_REVERSE_GRID_M', 10)), 0.1)
+
+
+def reverse_cell(latitude, longitude, grid_m=None):
+    """
+    Ячейка сетки обратного геокодирования: (строка, столбец).
+    Шаг по долготе растянут на 1/cos(широты строки), чтобы ячейки были близки к квадратам
+    """
+    grid_m = grid_m or _reverse_grid_m()
+    lat_step = grid_m / METERS_PER_DEGREE
+    row = math.floor(float(latitude) / lat_step)
+    lon_step = lat_step / max(math.cos(math.radians((row + 0.5) * lat_step)), 0.01)
+    return row, math.floor(float(longitude) / lon_step)
+
+
+def reverse_key(latitude, longitude):
+    """Ключ обратного геокодирования: шаг сетки и ячейка, например '10m:441234:703210'"""
+    grid_m = _reverse_grid_m()
+    row, col = reverse_cell(latitude, longitude, grid_m)
+    return f'{grid_m:g}m:{row}:{col}'
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Расстояние в метрах в локальной равнопромежуточной проекции"""
+    dy = (lat2 - lat1) * METERS_PER_DEGREE
+    dx = (lon2 - lon1) * METERS_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
+
+
+def neighbour_reverse_keys(latitude, longitude, radius_m):
+    """Ключи соседних ячеек, центры которых ближе radius_m к точке, от ближних к дальним"""
+    grid_m = _reverse_grid_m()
+    latitude, longitude = float(latitude), float(longitude)
+    own_row, own_col = reverse_cell(latitude, longitude, grid_m)
+    lat_step = grid_m / METERS_PER_DEGREE
+    rings = math.ceil(radius_m / grid_m)
+
+    candidates = []
+    for row in range(own_row - rings, own_row + rings + 1):
+        lon_step = lat_step / max(math.cos(math.radians((row + 0.5) * lat_step)), 0.01)
+        # Соседние строки могут иметь чуть другой шаг по долготе - столбцы считаем по строке
+        center_col = math.floor(longitude / lon_step)
+        for col in range(center_col - rings, center_col + rings + 1):
+            if (row, col) == (own_row, own_col):
+                continue
+            distance = distance_m(latitude, longitude, (row + 0.5) * lat_step, (col + 0.5) * lon_step)
+            if distance <= radius_m:
+                candidates.append((distance, f'{grid_m:g}m:{row}:{col}'))
+    candidates.sort()
+    return [key for _, key in candidates]
+
+
+class GeocodeStore:
+    """Хранилище ответов геокодера с уровнями memory -> cache -> db"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {tier: {'hits': 0, 'misses': 0} for tier in TIERS}
+
+    def _count(self, tier, hit):
+        with self._lock:
+            self._stats[tier]['hits' if hit else 'misses'] += 1
+        if LOOKUPS is not None:
+            LOOKUPS.labels(tier, 'hit' if hit else 'miss').inc()
+
+    # Уровень memory
+
+    def _memory_get(self, kind, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._memory.get((kind, key))
+            if item is None:
+                return None
+            expires_at, result = item
+            if expires_at < now:
+                del self._memory[(kind, key)]
+                return None
+            self._memory.move_to_end((kind, key))
+            return result
+
+    def _memory_set(self, kind, key, result):
+        maxsize = getattr(settings, 'GEOCODE_MEMORY_CACHE_SIZE', 2048)
+        if maxsize <= 0:
+            return
+        expires_at = time.monotonic() + getattr(settings, 'GEOCODE_MEMORY_CACHE_TTL', 3600)
+        with self._lock:
+            self._memory[(kind, key)] = (expires_at, result)
+            self._memory.move_to_end((kind, key))
+            while len(self._memory) > maxsize:
+                self._memory.popitem(last=False)
+
+    # Уровень cache
+
+    def _cache_get(self, kind, key):
+        try:
+            return cache.get(store_key(kind, key))
+        except Exception as e:
+            logger.warning(f"Cache error reading geocode entry: {str(e)}")
+            return None
+
+    def _cache_set(self, kind, key, result):
+        try:
+            cache.set(store_key(kind, key), result, getattr(settings, 'GEOCODE_CACHE_TTL', 60 * 60 * 24))
+        except Exception as e:
+            logger.warning(f"Cache error storing geocode entry: {str(e)}")
+
+    # Уровень db
+
+    def _db_get(self, kind, key):
+        from .models import GeocodeCacheEntry
+
+        try:
+            return GeocodeCacheEntry.objects.filter(kind=kind, key=key).values_list('result', flat=True).first()
+        except DatabaseError as e:
+            logger.warning(f"Database error reading geocode entry: {str(e)}")
+            return None
+
+    def _db_set(self, kind, key, result, latitude, longitude):
+        from .models import GeocodeCacheEntry
+
+        defaults = {'result': result}
+        if latitude is not None and longitude is not None:
+            defaults['latitude'] = round(float(latitude), 6)
+            defaults['longitude'] = round(float(longitude), 6)
+        try:
+            GeocodeCacheEntry.objects.update_or_create(kind=kind, key=key, defaults=defaults)
+        except IntegrityError:
+            # Параллельный запрос уже сохранил этот ключ
+            pass
+        except DatabaseError as e:
+            logger.warning(f"Database error storing geocode entry: {str(e)}")
+
+    # Публичный интерфейс
+
+    def get(self, kind, key, count=True):
+        """
+        Ищет ответ по уровням; возвращает (результат, уровень) или (None, None).
+        count=False - повторная проверка, не учитывается в статистике
+        """
+        result = self._memory_get(kind, key)
+        if count:
+            self._count('memory', result is not None)
+        if result is not None:
+            return result, 'memory'
+
+        result = self._cache_get(kind, key)
+        if count:
+            self._count('cache', result is not None)
+        if result is not None:
+            self._memory_set(kind, key, result)
+            return result, 'cache'
+
+        result = self._db_get(kind, key)
+        if count:
+            self._count('db', result is not None)
+        if result is not None:
+            self._memory_set(kind, key, result)
+            self._cache_set(kind, key, result)
+            return result, 'db'
+        return None, None
+
+    def set(self, kind, key, result, latitude=None, longitude=None):
+        """Сохраняет ответ геокодера на всех уровнях"""
+        self._db_set(kind, key, result, latitude, longitude)
+        self._cache_set(kind, key, result)
+        self._memory_set(kind, key, result)
+
+    def _nearest_db_point(self, latitude, longitude, radius_m):
+        """Ответ ближайшей сохраненной точки обратного геокодирования в радиусе radius_m"""
+        from .models import GeocodeCacheEntry
+
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(latitude)), 0.01)
+        try:
+            rows = GeocodeCacheEntry.objects.filter(
+                kind=KIND_REVERSE,
+                latitude__range=(latitude - dlat, latitude + dlat),
+                longitude__range=(longitude - dlon, longitude + dlon),
+            ).values_list('latitude', 'longitude', 'result')[:50]
+            rows = list(rows)
+        except DatabaseError as e:
+            logger.warning(f"Database error reading nearby geocode entries: {str(e)}")
+            return None
+
+        best, best_distance = None, radius_m
+        for lat, lon, result in rows:
+            distance = distance_m(latitude, longitude, float(lat), float(lon))
+            if distance <= best_distance:
+                best, best_distance = result, distance
+        return best
+
+    def _get_neighbour(self, latitude, longitude, radius_m):
+        keys = neighbour_reverse_keys(latitude, longitude, radius_m)
+        for key in keys:
+            result = self._memory_get(KIND_REVERSE, key)
+            if result is not None:
+                return result
+
+        if keys:
+            cache_keys = {store_key(KIND_REVERSE, key): key for key in keys}
+            try:
+                found = cache.get_many(list(cache_keys))
+            except Exception as e:
+                logger.warning(f"Cache error reading nearby geocode entries: {str(e)}")
+                found = {}
+            for cache_key in cache_keys:
+                if found.get(cache_key) is not None:
+                    return found[cache_key]
+
+        return self._nearest_db_point(latitude, longitude, radius_m)
+
+    def get_forward(self, address):
+        """
+        Прямое геокодирование из хранилища: сначала локальный газеттир (без сети и Redis),
+        затем уровни memory -> cache -> db. Возвращает (результат, уровень) или (None, None)
+        """
+        point = lookup_address(address)
+        self._count('gazetteer', point is not None)
+        if point is not None:
+            return make_record(point[0], point[1], precision='exact'), 'gazetteer'
+        return self.get(KIND_FORWARD, forward_key(address))
+
+    def get_reverse(self, latitude, longitude):
+        """
+        Обратное геокодирование из хранилища: сначала ячейка точки на всех уровнях,
+        затем ближайший сохраненный ответ в радиусе GEOCODE_REVERSE_NEIGHBOUR_M.
+        Возвращает (результат, уровень) или (None, None)
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        key = reverse_key(latitude, longitude)
+        result, tier = self.get(KIND_REVERSE, key)
+        if result is not None:
+            return result, tier
+
+        radius_m = getattr(settings, 'GEOCODE_REVERSE_NEIGHBOUR_M', 15)
+        if radius_m <= 0:
+            return None, None
+        result = self._get_neighbour(latitude, longitude, radius_m)
+        self._count('neighbour', result is not None)
+        if result is None:
+            return None, None
+        # Следующее обращение к этой ячейке попадет в память или Redis без поиска соседей
+        self._memory_set(KIND_REVERSE, key, result)
+        self._cache_set(KIND_REVERSE, key, result)
+        return result, 'neighbour'
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def get_stats(self):
+        """Попадания и промахи по уровням в текущем процессе"""
+        with self._lock:
+            return {tier: dict(counts) for tier, counts in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            for counts in self._stats.values():
+                counts['hits'] = counts['misses'] = 0
+
+
+geocode_store = GeocodeStore()
@@ -0,0 +1,324 @@
+"""
+Геометрия зон доставки: разбор полигонов и проверка точки в полигоне.
+
+Полигоны хранятся в DeliveryZone.polygon_coordinates как [[широта, долгота], ...].
+Функции модуля не зависят от Django и работают с обычными float.
+Пакетная проверка многих точек использует NumPy, если он установлен.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy необязателен, есть поштучная проверка
+    np = None
+
+
+def parse_polygon(coordinates):
+    """
+    Преобразует JSON полигона в два списка float: широты и долготы.
+    Некорректные вершины пропускаются, замыкающая вершина (равная первой) отбрасывается.
+    """
+    lats = []
+    lons = []
+    if not coordinates:
+        return lats, lons
+
+    for point in coordinates:
+        try:
+            lat, lon = float(point[0]), float(point[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        lats.append(lat)
+        lons.append(lon)
+
+    if len(lats) > 1 and lats[0] == lats[-1] and lons[0] == lons[-1]:
+        lats.pop()
+        lons.pop()
+
+    return lats, lons
+
+
+def bounding_box(lats, lons):
+    """Возвращает (min_lat, min_lon, max_lat, max_lon) или None для пустого полигона"""
+    if not lats:
+        return None
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def point_in_ring(lat, lon, lats, lons):
+    """
+    Проверяет, находится ли точка внутри полигона (алгоритм ray casting).
+    Луч направлен вдоль оси долготы.
+    """
+    n = len(lats)
+    if n < 3:
+        return False
+
+    inside = False
+    j = n - 1
+    for i in range(n):
+        lat_i, lat_j = lats[i], lats[j]
+        if (lat_i > lat) != (lat_j > lat):
+            lon_cross = (lons[j] - lons[i]) * (lat - lat_i) / (lat_j - lat_i) + lons[i]
+            if lon < lon_cross:
+                inside = not inside
+        j = i
+
+    return inside
+
+
+# Состояния ячеек сетки зоны. Ячейки вне полигона в сетке не хранятся.
+CELL_INSIDE = 1
+CELL_BOUNDARY = 2
+
+
+def cell_key(lat, lon, cell_size):
+    """Ключ ячейки глобальной сетки с шагом cell_size градусов"""
+    return math.floor(lat / cell_size), math.floor(lon / cell_size)
+
+
+def segment_intersects_rect(lat1, lon1, lat2, lon2, min_lat, min_lon, max_lat, max_lon):
+    """Пересекает ли отрезок замкнутый прямоугольник (отсечение Лианга-Барски)"""
+    d_lat = lat2 - lat1
+    d_lon = lon2 - lon1
+    t0, t1 = 0.0, 1.0
+    for p, q in (
+        (-d_lon, lon1 - min_lon),
+        (d_lon, max_lon - lon1),
+        (-d_lat, lat1 - min_lat),
+        (d_lat, max_lat - lat1),
+    ):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return False
+            if t > t0:
+                t0 = t
+        else:
+            if t < t0:
+                return False
+            if t < t1:
+                t1 = t
+    return True
+
+
+def rasterize_polygon(lats, lons, cell_size, max_cells=None):
+    """
+    Раскладывает полигон по сетке с шагом cell_size градусов.
+
+    Возвращает словарь {ключ ячейки: CELL_INSIDE | CELL_BOUNDARY}. Ячейки,
+    через которые проходит граница, помечаются как граничные; остальные
+    ячейки bounding box целиком внутри или целиком снаружи полигона, и
+    снаружи лежащие в словарь не попадают. Если сетка получается больше
+    max_cells ячеек, возвращается None.
+    """
+    n = len(lats)
+    if n < 3:
+        return None
+
+    min_row, min_col = cell_key(min(lats), min(lons), cell_size)
+    max_row, max_col = cell_key(max(lats), max(lons), cell_size)
+    if max_cells is not None and (max_row - min_row + 1) * (max_col - min_col + 1) > max_cells:
+        return None
+
+    # Небольшой запас, чтобы ошибки округления не превращали граничную ячейку во внутреннюю
+    eps = cell_size * 1e-9
+    cells = {}
+
+    j = n - 1
+    for i in range(n):
+        lat1, lon1, lat2, lon2 = lats[j], lons[j], lats[i], lons[i]
+        row_from, col_from = cell_key(min(lat1, lat2), min(lon1, lon2), cell_size)
+        row_to, col_to = cell_key(max(lat1, lat2), max(lon1, lon2), cell_size)
+        for row in range(row_from, row_to + 1):
+            cell_min_lat = row * cell_size - eps
+            cell_max_lat = (row + 1) * cell_size + eps
+            for col in range(col_from, col_to + 1):
+                if (row, col) in cells:
+                    continue
+                if segment_intersects_rect(
+                    lat1, lon1, lat2, lon2,
+                    cell_min_lat, col * cell_size - eps, cell_max_lat, (col + 1) * cell_size + eps
+                ):
+                    cells[(row, col)] = CELL_BOUNDARY
+        j = i
+
+    # Соседние неграничные ячейки строки лежат по одну сторону границы,
+    # поэтому точную проверку достаточно сделать один раз на каждый отрезок строки.
+    for row in range(min_row, max_row + 1):
+        run_inside = None
+        center_lat = (row + 0.5) * cell_size
+        for col in range(min_col, max_col + 1):
+            if cells.get((row, col)) == CELL_BOUNDARY:
+                run_inside = None
+                continue
+            if run_inside is None:
+                run_inside = point_in_ring(center_lat, (col + 0.5) * cell_size, lats, lons)
+            if run_inside:
+                cells[(row, col)] = CELL_INSIDE
+
+    return cells
+
+
+# Ограничение размера матрицы точки x ребра в одном проходе векторной проверки
+BATCH_CHUNK_ELEMENTS = 1_000_000
+
+
+def ring_edges(lats, lons):
+    """
+    Массивы ребер полигона для векторной проверки: (lat_i, lon_i, lat_j, lon_j),
+    где j - предыдущая вершина. Без NumPy возвращает None.
+    """
+    if np is None or len(lats) < 3:
+        return None
+    lat_i = np.asarray(lats, dtype=np.float64)
+    lon_i = np.asarray(lons, dtype=np.float64)
+    return lat_i, lon_i, np.roll(lat_i, 1), np.roll(lon_i, 1)
+
+
+def points_in_ring(point_lats, point_lons, edges):
+    """
+    Векторная версия point_in_ring: crossing number по массивам ребер.
+    Принимает массивы координат точек, возвращает булев массив той же длины.
+    Арифметика совпадает с point_in_ring, поэтому результаты идентичны.
+    """
+    count = len(point_lats)
+    result = np.zeros(count, dtype=bool)
+    if edges is None or count == 0:
+        return result
+
+    lat_i, lon_i, lat_j, lon_j = edges
+    chunk = max(1, BATCH_CHUNK_ELEMENTS // len(lat_i))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, count, chunk):
+            lat = point_lats[start:start + chunk, None]
+            lon = point_lons[start:start + chunk, None]
+            straddles = (lat_i > lat) != (lat_j > lat)
+            lon_cross = (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i
+            crossings = np.count_nonzero(straddles & (lon < lon_cross), axis=1)
+            result[start:start + chunk] = (crossings & 1).astype(bool)
+    return result
+
+
+# Километров в градусе дуги (радиус Земли 6371 км, как в calculate_distance)
+KM_PER_DEGREE = math.pi * 6371 / 180
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """Расстояние от точки до отрезка в плоских координатах (в тех же единицах)"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    if t < 0:
+        t = 0.0
+    elif t > 1:
+        t = 1.0
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def ring_signed_area(lats, lons):
+    """Удвоенная ориентированная площадь кольца в градусах: > 0 - обход против часовой стрелки"""
+    n = len(lats)
+    area = 0.0
+    j = n - 1
+    for i in range(n):
+        area += lons[j] * lats[i] - lons[i] * lats[j]
+        j = i
+    return area
+
+
+def dedupe_ring(lats, lons):
+    """Убирает повторяющиеся подряд вершины, включая совпадение последних вершин с первой"""
+    out_lats, out_lons = [], []
+    for lat, lon in zip(lats, lons):
+        if out_lats and lat == out_lats[-1] and lon == out_lons[-1]:
+            continue
+        out_lats.append(lat)
+        out_lons.append(lon)
+    while len(out_lats) > 1 and out_lats[-1] == out_lats[0] and out_lons[-1] == out_lons[0]:
+        out_lats.pop()
+        out_lons.pop()
+    return out_lats, out_lons
+
+
+def simplify_ring(lats, lons, tolerance_km):
+    """
+    Упрощает замкнутое кольцо алгоритмом Дугласа-Пекера.
+    Каждая отброшенная вершина лежит не дальше tolerance_km от итоговой границы.
+    Кольцо разбивается на две цепочки: от первой вершины до самой удаленной от нее и обратно.
+    """
+    n = len(lats)
+    if n <= 3 or tolerance_km <= 0:
+        return list(lats), list(lons)
+
+    ref_lat = sum(lats) / n
+    lon_scale = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+    xs = [lon * lon_scale for lon in lons]
+    ys = [lat * KM_PER_DEGREE for lat in lats]
+
+    far = max(range(1, n), key=lambda i: (xs[i] - xs[0]) ** 2 + (ys[i] - ys[0]) ** 2)
+    keep = [False] * (n + 1)
+    keep[0] = keep[far] = keep[n] = True
+
+    # Индекс n обозначает первую вершину, замыкающую кольцо
+    stack = [(0, far), (far, n)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        ax, ay = xs[start], ys[start]
+        bx, by = xs[end % n], ys[end % n]
+        max_distance = -1.0
+        index = start
+        for i in range(start + 1, end):
+            distance = point_segment_distance(xs[i], ys[i], ax, ay, bx, by)
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if max_distance > tolerance_km:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    kept = [i for i in range(n) if keep[i]]
+    # Первая вершина сохраняется алгоритмом всегда; убираем ее, если весь участок
+    # между соседними сохраненными вершинами укладывается в допуск
+    if len(kept) > 3:
+        prev, nxt = kept[-1], kept[1]
+        span = list(range(prev + 1, n)) + list(range(0, nxt))
+        if all(
+            point_segment_distance(xs[i], ys[i], xs[prev], ys[prev], xs[nxt], ys[nxt]) <= tolerance_km
+            for i in span
+        ):
+            kept = kept[1:]
+    if len(kept) < 3:
+        return list(lats), list(lons)
+    return [lats[i] for i in kept], [lons[i] for i in kept]
+
+
+def compact_polygon(coordinates, tolerance_km, precision=6):
+    """
+    Компактная версия полигона для проверок принадлежности: координаты округляются
+    до precision знаков, дубли вершин удаляются, кольцо упрощается с допуском
+    tolerance_km и ориентируется против часовой стрелки.
+    Возвращает [[широта, долгота], ...] или None, если полигон некорректен.
+    """
+    lats, lons = parse_polygon(coordinates)
+    lats = [round(lat, precision) for lat in lats]
+    lons = [round(lon, precision) for lon in lons]
+    lats, lons = dedupe_ring(lats, lons)
+    if len(lats) < 3:
+        return None
+
+    lats, lons = simplify_ring(lats, lons, tolerance_km)
+    if ring_signed_area(lats, lons) < 0:
+        lats.reverse()
+        lons.reverse()
+    return [[lat, lon] for lat, lon in zip(lats, lons)]
@@ -0,0 +1,184 @@
+"""
+Общий HTTP-клиент для исходящих запросов (Telegram Bot API, Яндекс Геокодер).
+
+Для каждого хоста держится своя requests.Session с пулом keep-alive соединений,
+поэтому повторные запросы к api.telegram.org не платят за TCP+TLS рукопожатие.
+Все запросы получают одинаковые таймауты (подключение, чтение) и повтор с
+экспоненциальной задержкой и джиттером. По каждому endpoint копятся счетчики
+запросов, ошибок и времени ответа - в процессе (get_stats) и, если установлен
+prometheus_client, в метриках Prometheus.
+
+Сессии не переживают fork: дочерний процесс (воркер Celery, gunicorn) создает
+свои пулы при первом запросе и не делит сокеты с родителем.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from prometheus_client import Counter, Histogram
+except ImportError:  # prometheus_client не установлен - остаются только счетчики в процессе
+    Counter = Histogram = None
+
+logger = logging.getLogger('api')
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+YANDEX_GEOCODER_URL = 'https://geocode-maps.yandex.ru/1.x/'
+
+# Статусы, при которых запрос повторяется (для POST - только если сервер его не принял)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+if Histogram is not None:
+    REQUEST_SECONDS = Histogram(
+        'babay_http_client_request_seconds',
+        'Время исходящих HTTP-запросов',
+        ['endpoint'],
+    )
+    REQUEST_ERRORS = Counter(
+        'babay_http_client_errors_total',
+        'Ошибки исходящих HTTP-запросов',
+        ['endpoint', 'kind'],
+    )
+else:
+    REQUEST_SECONDS = REQUEST_ERRORS = None
+
+_lock = threading.Lock()
+_sessions = {}
+_stats = {}
+
+
+def _reset_after_fork():
+    """Сбрасывает унаследованные от родителя сессии и блокировку в дочернем процессе"""
+    global _lock, _sessions
+    _lock = threading.Lock()
+    _sessions = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_timeout():
+    """Таймауты по умолчанию: (подключение, чтение) в секундах"""
+    return (
+        getattr(settings, 'HTTP_CLIENT_CONNECT_TIMEOUT', 3.05),
+        getattr(settings, 'HTTP_CLIENT_READ_TIMEOUT', 10),
+    )
+
+
+def _build_session():
+    retry = Retry(
+        total=getattr(settings, 'HTTP_CLIENT_RETRIES', 2),
+        backoff_factor=getattr(settings, 'HTTP_CLIENT_BACKOFF_FACTOR', 0.3),
+        backoff_jitter=getattr(settings, 'HTTP_CLIENT_BACKOFF_JITTER', 0.2),
+        status_forcelist=RETRY_STATUSES,
+        # Ошибки подключения повторяются для любых методов, ошибки чтения и статусы -
+        # только для идемпотентных: повтор POST после таймаута чтения задвоил бы сообщение
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, 'HTTP_CLIENT_POOL_MAXSIZE', 10)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url):
+    """Сессия с пулом соединений для хоста из url"""
+    parts = urlsplit(url)
+    host = (parts.scheme, parts.netloc)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _build_session()
+    return session
+
+
+def close_sessions():
+    """Закрывает все пулы соединений процесса"""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def _record(endpoint, elapsed, error=None):
+    with _lock:
+        stats = _stats.setdefault(endpoint, {'requests': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['requests'] += 1
+        stats['total_seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        if error:
+            stats['errors'] += 1
+
+    if REQUEST_SECONDS is not None:
+        REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+        if error:
+            REQUEST_ERRORS.labels(endpoint, error).inc()
+
+
+def get_stats():
+    """Счетчики текущего процесса: {endpoint: {requests, errors, total_seconds, max_seconds}}"""
+    with _lock:
+        return {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def request(method, url, endpoint, timeout=None, **kwargs):
+    """
+    Выполняет запрос через пул соединений хоста.
+
+    Args:
+        method: HTTP-метод
+        url: Адрес запроса
+        endpoint: Метка для метрик (например, 'telegram.sendMessage')
+        timeout: Таймаут; по умолчанию берется из настроек
+
+    Returns:
+        requests.Response; сетевые ошибки пробрасываются как requests.RequestException
+    """
+    started = time.perf_counter()
+    try:
+        response = get_session(url).request(method, url, timeout=timeout or get_timeout(), **kwargs)
+    except requests.RequestException as e:
+        _record(endpoint, time.perf_counter() - started, error=type(e).__name__)
+        raise
+
+    error = f'http_{response.status_code}' if response.status_code >= 400 else None
+    _record(endpoint, time.perf_counter() - started, error=error)
+    return response
+
+
+def get(url, endpoint, **kwargs):
+    return request('GET', url, endpoint, **kwargs)
+
+
+def post(url, endpoint, **kwargs):
+    return request('POST', url, endpoint, **kwargs)
+
+
+def telegram_request(api_method, payload, timeout=None):
+    """Вызов метода Telegram Bot API (sendMessage, answerCallbackQuery, ...)"""
+    url = f"{TELEGRAM_API_URL}/bot{settings.BOT_TOKEN}/{api_method}"
+    return post(url, f'telegram.{api_method}', json=payload, timeout=timeout)
+
+
+def yandex_geocode_request(params, timeout=None):
+    """Запрос к Яндекс Геокодеру"""
+    return get(YANDEX_GEOCODER_URL, 'yandex.geocode', params=params, timeout=timeout)
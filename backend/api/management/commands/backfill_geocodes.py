@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from api.geocode_store import geocode_store
+from api.models import Address
+from api.tasks import geocode_yandex
+from api.zone_index import get_zone_index
+
+
+class RateLimiter:
+    """Не больше rate вызовов в секунду на все потоки"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_at, now)
+            self.next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Command(BaseCommand):
+    help = 'Геокодирование адресов без координат пачками через пул потоков с ограничением частоты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество потоков, одновременно обращающихся к геокодеру',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=5.0,
+            help='Максимум запросов к Яндекс API в секунду (0 - без ограничения)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Количество адресов, сохраняемых одним bulk_update',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Обработать не больше указанного количества адресов',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'logs', 'backfill_geocodes.json'),
+            help='Файл с прогрессом (ID последнего обработанного адреса)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить с адреса после сохраненного в файле прогресса',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checkpoint_path = options['checkpoint']
+        progress = {'last_id': 0, 'geocoded': 0, 'failed': 0}
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                progress.update(json.load(f))
+            self.stdout.write(f"Продолжение после адреса {progress['last_id']}")
+
+        addresses = Address.objects.filter(
+            Q(latitude__isnull=True) | Q(longitude__isnull=True), id__gt=progress['last_id']
+        ).order_by('id')
+        if options['limit']:
+            addresses = addresses[:options['limit']]
+
+        limiter = RateLimiter(options['rate'])
+        chunk_size = options['chunk_size']
+
+        def geocode(full_address):
+            limiter.wait()
+            try:
+                return geocode_yandex(address=full_address)
+            finally:
+                # geocode_yandex читает и пишет хранилище в БД; соединение потока пула
+                # само не закрывается и осталось бы открытым до конца команды
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            chunk = []
+            for address in addresses.iterator(chunk_size=chunk_size):
+                chunk.append(address)
+                if len(chunk) >= chunk_size:
+                    self._process_chunk(chunk, executor, geocode, progress, checkpoint_path)
+                    chunk = []
+            if chunk:
+                self._process_chunk(chunk, executor, geocode, progress, checkpoint_path)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Геокодировано: {progress['geocoded']}, не найдено: {progress['failed']} за {elapsed:.2f} с"
+        ))
+
+    def _process_chunk(self, chunk, executor, geocode, progress, checkpoint_path):
+        # Известные адреса берем из хранилища сразу, в пул уходят только промахи
+        results = {}
+        futures = {}
+        for address in chunk:
+            cached, _ = geocode_store.get_forward(address.full_address)
+            if cached:
+                results[address.id] = {'result': cached}
+            else:
+                futures[address.id] = executor.submit(geocode, address.full_address)
+        for address_id, future in futures.items():
+            try:
+                results[address_id] = future.result()
+            except Exception as e:
+                results[address_id] = {'error': str(e)}
+
+        zone_index = get_zone_index()
+        now = timezone.now()
+        geocoded = []
+        for address in chunk:
+            # updated_at обновляется явно: по нему автодополнение подхватывает новые адреса
+            address.updated_at = now
+            result = results[address.id]
+            if 'result' in result:
+                address.latitude = round(result['result']['lat'], 6)
+                address.longitude = round(result['result']['lon'], 6)
+                address.geocode_status = Address.GEOCODE_OK
+                geocoded.append(address)
+            else:
+                address.geocode_status = Address.GEOCODE_FAILED
+
+        # Зоны доставки пересчитываются пачкой, как в revalidate_addresses
+        zones = zone_index.locate_many([(a.latitude, a.longitude, a.city) for a in geocoded])
+        for address, zone in zip(geocoded, zones):
+            address.delivery_zone_id = zone.id if zone else None
+            address.delivery_zone_version = zone_index.version
+
+        Address.objects.bulk_update(
+            chunk,
+            ['latitude', 'longitude', 'geocode_status', 'delivery_zone', 'delivery_zone_version', 'updated_at'],
+        )
+
+        progress['last_id'] = chunk[-1].id
+        progress['geocoded'] += len(geocoded)
+        progress['failed'] += len(chunk) - len(geocoded)
+        self._save_checkpoint(checkpoint_path, progress)
+        self.stdout.write(
+            f"  ...до адреса {progress['last_id']}: геокодировано {progress['geocoded']}, "
+            f"не найдено {progress['failed']}"
+        )
+
+    @staticmethod
+    def _save_checkpoint(path, progress):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, path)
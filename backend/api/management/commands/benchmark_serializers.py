@@ -0,0 +1,126 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serializers import serialize_menu_items
+from api.models import AddOn, Category, MenuItem, SizeOption
+from api.serializers import MenuItemSerializer
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк сериализации товаров: MenuItemSerializer против быстрого read-only пути (данные синтетические, откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            type=int,
+            nargs='+',
+            default=[50, 500, 5000],
+            help='Количество товаров в синтетическом каталоге',
+        )
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            default=3,
+            help='Размеров у каждого товара',
+        )
+        parser.add_argument(
+            '--add-ons',
+            type=int,
+            default=4,
+            help='Дополнений у каждого товара',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Повторов каждого замера (берется медиана)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'товаров':>8} {'DRF, мс':>9} {'запр.':>6} {'быстро, мс':>11} {'запр.':>6} "
+            f"{'ускорение':>10} {'байт':>10}"
+        )
+        for count in options['items']:
+            with transaction.atomic():
+                queryset = self.make_catalog(count, options['sizes'], options['add_ons'])
+                drf_ms, drf_queries, drf_body = self.measure(
+                    lambda: MenuItemSerializer(queryset.all(), many=True).data, options['repeat']
+                )
+                fast_ms, fast_queries, fast_body = self.measure(
+                    lambda: serialize_menu_items(queryset.all()), options['repeat']
+                )
+                transaction.set_rollback(True)
+
+            if drf_body != fast_body:
+                self.stdout.write(self.style.ERROR(f"Вывод различается для {count} товаров"))
+            self.stdout.write(
+                f"{count:>8} {drf_ms:>9.1f} {drf_queries:>6} {fast_ms:>11.1f} {fast_queries:>6} "
+                f"{drf_ms / fast_ms:>9.1f}x {len(fast_body):>10}"
+            )
+
+    @staticmethod
+    def measure(serialize, repeat):
+        """Медиана времени сериализации с рендерингом в JSON, число запросов и байты ответа"""
+        timings = []
+        for _ in range(repeat):
+            queries = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                body = JSONRenderer().render(serialize())
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), queries, body
+
+    @staticmethod
+    def make_catalog(count, sizes_per_item, add_ons_per_item):
+        """Синтетический каталог через bulk_create (без сигналов и журнала изменений)"""
+        categories = Category.objects.bulk_create(
+            Category(name=f'benchmark-{number}') for number in range(10)
+        )
+        sizes = SizeOption.objects.bulk_create(
+            SizeOption(name=f'size-{number}', price_modifier=Decimal(number * 1500))
+            for number in range(sizes_per_item)
+        )
+        add_ons = AddOn.objects.bulk_create(
+            AddOn(name=f'add-on-{number}', price=Decimal(number * 1000), category=categories[number % len(categories)])
+            for number in range(add_ons_per_item)
+        )
+        AddOn.available_for_categories.through.objects.bulk_create(
+            AddOn.available_for_categories.through(addon_id=add_on.id, category_id=category.id)
+            for add_on in add_ons
+            for category in categories[:2]
+        )
+        items = MenuItem.objects.bulk_create(
+            MenuItem(
+                name=f'item-{number}',
+                description='Синтетический товар для бенчмарка',
+                price=Decimal(10000 + number),
+                category=categories[number % len(categories)],
+                is_hit=number % 7 == 0,
+                is_new=number % 11 == 0,
+                priority=number % 5,
+            )
+            for number in range(count)
+        )
+        MenuItem.size_options.through.objects.bulk_create(
+            MenuItem.size_options.through(menuitem_id=item.id, sizeoption_id=size.id)
+            for item in items
+            for size in sizes
+        )
+        MenuItem.add_on_options.through.objects.bulk_create(
+            MenuItem.add_on_options.through(menuitem_id=item.id, addon_id=add_on.id)
+            for item in items
+            for add_on in add_ons
+        )
+        return MenuItem.objects.filter(category__in=categories).order_by('priority', '-created_at', 'id')
@@ -0,0 +1,173 @@
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import DeliveryZone
+from api.geometry import CELL_BOUNDARY, point_segment_distance
+from api.synthetic_zones import CENTER_LAT, CENTER_LON, make_synthetic_polygon
+from api.zone_distance import EdgeIndex
+from api.zone_index import CompiledZone
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк проверки точки в зоне доставки на синтетических полигонах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vertices',
+            type=int,
+            nargs='+',
+            default=[100, 300, 1000],
+            help='Количество вершин синтетических полигонов',
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=20000,
+            help='Количество случайных точек на полигон',
+        )
+        parser.add_argument(
+            '--cell-size',
+            type=float,
+            default=0.001,
+            help='Шаг сетки в градусах',
+        )
+        parser.add_argument(
+            '--distance-zones',
+            type=int,
+            default=9,
+            help='Количество зон (сетка вокруг центра) в бенчмарке расстояния до границы',
+        )
+        parser.add_argument(
+            '--bucket-size',
+            type=float,
+            default=0.005,
+            help='Шаг корзин индекса ребер в градусах',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed генератора случайных чисел',
+        )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        points_count = options['points']
+
+        self.stdout.write(
+            f"{'вершин':>7} {'сетка, мс':>10} {'ячеек':>7} {'гранич.':>8} "
+            f"{'модель, мкс':>12} {'bbox+ray, мкс':>14} {'сетка, мкс':>11} {'ускорение':>10}"
+        )
+
+        for vertices in options['vertices']:
+            zone = DeliveryZone(
+                id=vertices,
+                name=f'synthetic-{vertices}',
+                city='Бухара',
+                delivery_fee=0,
+                polygon_coordinates=make_synthetic_polygon(vertices, seed=options['seed']),
+            )
+
+            started = time.perf_counter()
+            gridded = CompiledZone(zone, cell_size=options['cell_size'])
+            build_ms = (time.perf_counter() - started) * 1000
+            exact = CompiledZone(zone)
+
+            min_lat, min_lon, max_lat, max_lon = exact.bbox
+            pad_lat = (max_lat - min_lat) * 0.1
+            pad_lon = (max_lon - min_lon) * 0.1
+            points = [
+                (rnd.uniform(min_lat - pad_lat, max_lat + pad_lat), rnd.uniform(min_lon - pad_lon, max_lon + pad_lon))
+                for _ in range(points_count)
+            ]
+
+            started = time.perf_counter()
+            model_results = [zone._is_point_in_polygon(lat, lon) for lat, lon in points]
+            model_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            started = time.perf_counter()
+            exact_results = [exact.contains(lat, lon) for lat, lon in points]
+            exact_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            started = time.perf_counter()
+            grid_results = [gridded.contains(lat, lon) for lat, lon in points]
+            grid_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            if not (model_results == exact_results == grid_results):
+                mismatches = sum(1 for a, b in zip(model_results, grid_results) if a != b)
+                self.stdout.write(self.style.ERROR(f"Результаты расходятся для {vertices} вершин: {mismatches} точек"))
+
+            boundary = sum(1 for state in gridded.cells.values() if state == CELL_BOUNDARY) if gridded.cells else 0
+            self.stdout.write(
+                f"{vertices:>7} {build_ms:>10.1f} {len(gridded.cells or {}):>7} {boundary:>8} "
+                f"{model_us:>12.1f} {exact_us:>14.1f} {grid_us:>11.2f} {model_us / grid_us:>9.0f}x"
+            )
+
+        self.benchmark_distance(options, rnd)
+
+    def benchmark_distance(self, options, rnd):
+        """Расстояние до ближайшей границы: полный перебор ребер против индекса ребер"""
+        points_count = options['points'] // 10
+        side = max(1, math.ceil(math.sqrt(options['distance_zones'])))
+        step_lat = 4.0 / 111.32
+        step_lon = 4.0 / (111.32 * math.cos(math.radians(CENTER_LAT)))
+
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'вершин':>7} {'зон':>4} {'ребер':>7} {'индекс, мс':>11} "
+            f"{'перебор, мкс':>13} {'индекс, мкс':>12} {'ускорение':>10}"
+        )
+
+        for vertices in options['vertices']:
+            zones = []
+            for number in range(options['distance_zones']):
+                row, col = divmod(number, side)
+                center = (CENTER_LAT + (row - side / 2) * step_lat, CENTER_LON + (col - side / 2) * step_lon)
+                zones.append(CompiledZone(DeliveryZone(
+                    id=number + 1,
+                    name=f'synthetic-{number}',
+                    city='Бухара',
+                    delivery_fee=0,
+                    polygon_coordinates=make_synthetic_polygon(
+                        vertices, radius_km=1.5, seed=options['seed'] + number, center=center
+                    ),
+                )))
+
+            started = time.perf_counter()
+            edge_index = EdgeIndex(zones, options['bucket_size'])
+            build_ms = (time.perf_counter() - started) * 1000
+
+            min_lat = min(min(zone.lats) for zone in zones) - step_lat
+            max_lat = max(max(zone.lats) for zone in zones) + step_lat
+            min_lon = min(min(zone.lons) for zone in zones) - step_lon
+            max_lon = max(max(zone.lons) for zone in zones) + step_lon
+            points = [
+                (rnd.uniform(min_lat, max_lat), rnd.uniform(min_lon, max_lon))
+                for _ in range(points_count)
+            ]
+
+            started = time.perf_counter()
+            brute_results = []
+            for lat, lon in points:
+                px, py = lon * edge_index.lon_scale, lat * edge_index.lat_scale
+                brute_results.append(min(
+                    point_segment_distance(px, py, ax, ay, bx, by)
+                    for _, ax, ay, bx, by in edge_index.edges
+                ))
+            brute_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            started = time.perf_counter()
+            index_results = [edge_index.nearest(lat, lon)[1] for lat, lon in points]
+            index_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            mismatches = sum(1 for a, b in zip(brute_results, index_results) if abs(a - b) > 1e-9)
+            if mismatches:
+                self.stdout.write(self.style.ERROR(f"Расстояния расходятся для {vertices} вершин: {mismatches} точек"))
+
+            self.stdout.write(
+                f"{vertices:>7} {len(zones):>4} {len(edge_index):>7} {build_ms:>11.1f} "
+                f"{brute_us:>13.1f} {index_us:>12.1f} {brute_us / index_us:>9.0f}x"
+            )
@@ -0,0 +1,65 @@
+import statistics
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.gazetteer import address_keys, gazetteer_key, write_gazetteer
+from api.geocode_store import KIND_FORWARD
+from api.models import Address, GeocodeCacheEntry
+
+
+class Command(BaseCommand):
+    help = 'Сборка локального газеттира из геокодированных адресов и кэша геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Путь к файлу газеттира (по умолчанию GAZETTEER_PATH)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Размер пачки при чтении адресов',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        output = options['output'] or settings.GAZETTEER_PATH
+
+        points = defaultdict(list)
+        addresses = Address.objects.filter(
+            geocode_status=Address.GEOCODE_OK, latitude__isnull=False, longitude__isnull=False
+        ).values_list('street', 'house_number', 'city', 'latitude', 'longitude')
+        address_count = 0
+        for street, house_number, city, lat, lon in addresses.iterator(chunk_size=options['batch_size']):
+            for key in address_keys(street, house_number, city):
+                points[key].append((float(lat), float(lon)))
+            address_count += 1
+
+        entries = GeocodeCacheEntry.objects.filter(
+            kind=KIND_FORWARD, latitude__isnull=False, longitude__isnull=False
+        ).values_list('key', 'latitude', 'longitude', 'result')
+        entry_count = 0
+        for key, lat, lon, result in entries.iterator(chunk_size=options['batch_size']):
+            # Ответы с точностью до улицы или города не должны попадать в газеттир как адрес дома
+            if result.get('precision') not in (None, 'exact'):
+                continue
+            points[gazetteer_key(key)].append((float(lat), float(lon)))
+            entry_count += 1
+
+        # Пользователи могут сдвигать метку; медиана устойчива к единичным выбросам
+        gazetteer = {
+            key: (statistics.median(lat for lat, _ in found), statistics.median(lon for _, lon in found))
+            for key, found in points.items()
+        }
+        written = write_gazetteer(output, gazetteer)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Газеттир {output}: {written} ключей из {address_count} адресов и "
+            f"{entry_count} записей кэша за {elapsed:.2f} с"
+        ))
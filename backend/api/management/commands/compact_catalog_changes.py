@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.catalog_changes import compact_catalog_changes, get_catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Сжатие журнала изменений каталога: клиенты с более старой версией получат полный снимок меню'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'CATALOG_CHANGE_LOG_RETENTION_DAYS', 30),
+            help='Сколько дней хранить записи журнала',
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = compact_catalog_changes(before)
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено записей журнала: {deleted}, текущая версия каталога: {get_catalog_version()}"
+        ))
@@ -0,0 +1,76 @@
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from api.models import Address
+from api.zone_index import get_zone_index
+
+
+class Command(BaseCommand):
+    help = 'Перепроверка всех адресов с координатами по активным зонам доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество адресов, проверяемых за один проход',
+        )
+        parser.add_argument(
+            '--show-outside',
+            action='store_true',
+            help='Вывести ID адресов вне зон доставки',
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Сохранить вычисленные зоны в адресах',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = get_zone_index()
+        batch_size = options['batch_size']
+
+        rows = Address.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).order_by('id').values_list('id', 'latitude', 'longitude', 'city')
+
+        per_zone = Counter()
+        to_save = defaultdict(list)
+        outside = []
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            zones = index.locate_many([(lat, lon, city) for _, lat, lon, city in batch])
+            for (address_id, _, _, _), zone in zip(batch, zones):
+                if zone:
+                    per_zone[zone.id] += 1
+                else:
+                    outside.append(address_id)
+                to_save[zone.id if zone else None].append(address_id)
+            total += len(batch)
+            last_id = batch[-1][0]
+
+        if options['save']:
+            # Обновляем адреса пачками по зонам, не сохраняя каждый по отдельности
+            for zone_id, address_ids in to_save.items():
+                for start in range(0, len(address_ids), batch_size):
+                    Address.objects.filter(id__in=address_ids[start:start + batch_size]).update(
+                        delivery_zone_id=zone_id, delivery_zone_version=index.version
+                    )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено адресов: {total} за {elapsed:.2f} с (зон: {len(index)}, версия {index.version})"
+        ))
+        for zone_id, count in per_zone.most_common():
+            self.stdout.write(f"  {index.get(zone_id).name}: {count}")
+        self.stdout.write(f"  Вне зон доставки: {len(outside)}")
+
+        if options['show_outside'] and outside:
+            self.stdout.write(', '.join(str(address_id) for address_id in outside))
@@ -0,0 +1,79 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.geometry import parse_polygon, point_in_ring, bounding_box
+from api.models import DeliveryZone
+
+
+class Command(BaseCommand):
+    help = 'Отчет об упрощении полигонов зон доставки: количество вершин и время проверки точки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tolerance-m',
+            type=float,
+            default=None,
+            help='Допуск упрощения в метрах (по умолчанию DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M)',
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=5000,
+            help='Количество случайных точек для замера на зону',
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Пересчитать и сохранить упрощенные полигоны',
+        )
+
+    def handle(self, *args, **options):
+        tolerance_m = options['tolerance_m']
+        if tolerance_m is None:
+            tolerance_m = getattr(settings, 'DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M', 5.0)
+        rnd = random.Random(42)
+        points_count = options['points']
+
+        self.stdout.write(f"Допуск упрощения: {tolerance_m} м")
+        self.stdout.write(
+            f"{'зона':<30} {'вершин':>7} {'упрощ.':>7} {'исходный, мкс':>14} {'упрощ., мкс':>12} {'совпадение':>11}"
+        )
+
+        for zone in DeliveryZone.objects.filter(polygon_coordinates__isnull=False).order_by('city', 'name'):
+            compact = zone.build_compact_polygon(tolerance_m)
+            full_lats, full_lons = parse_polygon(zone.polygon_coordinates)
+            if compact is None or len(full_lats) < 3:
+                self.stdout.write(self.style.WARNING(f"{str(zone):<30} некорректный полигон"))
+                continue
+            lats, lons = parse_polygon(compact)
+
+            min_lat, min_lon, max_lat, max_lon = bounding_box(full_lats, full_lons)
+            points = [
+                (rnd.uniform(min_lat, max_lat), rnd.uniform(min_lon, max_lon))
+                for _ in range(points_count)
+            ]
+
+            started = time.perf_counter()
+            full_results = [point_in_ring(lat, lon, full_lats, full_lons) for lat, lon in points]
+            full_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            started = time.perf_counter()
+            compact_results = [point_in_ring(lat, lon, lats, lons) for lat, lon in points]
+            compact_us = (time.perf_counter() - started) * 1e6 / points_count
+
+            agreement = sum(1 for a, b in zip(full_results, compact_results) if a == b) / points_count * 100
+            self.stdout.write(
+                f"{str(zone)[:30]:<30} {len(full_lats):>7} {len(lats):>7} "
+                f"{full_us:>14.1f} {compact_us:>12.1f} {agreement:>10.2f}%"
+            )
+
+            if options['save']:
+                zone.polygon_compact = compact
+                # updated_at меняет версию набора зон, и процессы перестраивают индекс
+                zone.save(update_fields=['polygon_compact', 'updated_at'])
+
+        if options['save']:
+            self.stdout.write(self.style.SUCCESS('Упрощенные полигоны сохранены'))
@@ -0,0 +1,242 @@
+"""
+Поиск по меню.
+
+Бэкенд выбирается настройкой MENU_SEARCH_BACKEND:
+- 'memory' - инвертированный индекс в памяти процесса по названиям,
+  описаниям и категориям активных товаров;
+- 'fts5' - полнотекстовый индекс SQLite FTS5 (таблица api_menuitem_fts,
+  синхронизируется триггерами, ранжирование BM25); без SQLite или FTS5 -
+  откат на icontains;
+- 'icontains' - прежний поиск name/description__icontains в БД.
+
+Слова индекса и запроса приводятся к латинской свертке api.text.transliterate
+(регистр, ё/е, кириллица и узбекская латиница), поэтому "burger" находит
+"Бургер", а "hot dog" - "Хот-дог". Каждое слово
+запроса ищется как префикс (bisect по отсортированному словарю), товар
+должен содержать все слова. Ранжирование: совпадение в названии весит
+больше категории, категория - больше описания; полное слово - больше
+префикса; при равенстве - порядок меню.
+
+Индекс перестраивается при смене версии каталога (api.catalog_changes),
+версия сверяется не чаще раза в MENU_SEARCH_CHECK_INTERVAL секунд.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework import filters
+
+from .text import normalize_text, transliterate
+
+logger = logging.getLogger('api')
+
+BACKEND_MEMORY = 'memory'
+BACKEND_FTS5 = 'fts5'
+BACKEND_ICONTAINS = 'icontains'
+
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+PREFIX_FACTOR = 0.5
+TERM_CACHE_SIZE = 4096
+
+# В свертке sh/ch/zh/kh уже обработаны; одиночная h - это "х" ("hot dog" = "хот-дог")
+_H_RE = re.compile(r'(?<![sc])h')
+
+
+def search_tokens(text):
+    """Слова строки в латинской свертке"""
+    return _H_RE.sub('x', transliterate(text)).split()
+
+
+class MenuSearchIndex:
+    """Инвертированный индекс активных товаров: слово -> {id товара: вес}"""
+
+    def __init__(self, rows, version=None):
+        """rows - (id, название, описание, категория) в порядке меню"""
+        self.version = version
+        self.postings = {}
+        self.order = {}
+        for position, (item_id, name, description, category) in enumerate(rows):
+            self.order[item_id] = position
+            for field, text in (('name', name), ('category', category), ('description', description)):
+                weight = FIELD_WEIGHTS[field]
+                for token in search_tokens(text):
+                    postings = self.postings.setdefault(token, {})
+                    if postings.get(item_id, 0) < weight:
+                        postings[item_id] = weight
+        self.tokens = sorted(self.postings)
+        # Префиксы повторяются при наборе по буквам; индекс неизменяем, поэтому кэш не устаревает
+        self._term_cache = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def _match_term(self, term):
+        matched = self._term_cache.get(term)
+        if matched is not None:
+            return matched
+        matched = {}
+        start = bisect.bisect_left(self.tokens, term)
+        for token in self.tokens[start:]:
+            if not token.startswith(term):
+                break
+            factor = 1.0 if token == term else PREFIX_FACTOR
+            for item_id, weight in self.postings[token].items():
+                score = weight * factor
+                if matched.get(item_id, 0) < score:
+                    matched[item_id] = score
+        if len(self._term_cache) >= TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        self._term_cache[term] = matched
+        return matched
+
+    def search(self, query):
+        """id товаров, содержащих все слова запроса (как префиксы), по убыванию релевантности"""
+        terms = search_tokens(query)
+        if not terms:
+            return []
+
+        scores = None
+        # Самые редкие слова первыми - пересечение сразу становится маленьким
+        for matched in sorted((self._match_term(term) for term in set(terms)), key=len):
+            if scores is None:
+                scores = matched
+            else:
+                scores = {item_id: score + matched[item_id] for item_id, score in scores.items() if item_id in matched}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda item_id: (-scores[item_id], self.order[item_id]))
+
+
+_index = None
+_index_lock = threading.Lock()
+_version_checked_at = 0.0
+_checked_version = None
+
+
+def _current_version():
+    global _version_checked_at, _checked_version
+    from .catalog_changes import get_catalog_version
+
+    now = time.monotonic()
+    if _checked_version is None or now - _version_checked_at >= getattr(settings, 'MENU_SEARCH_CHECK_INTERVAL', 1.0):
+        _checked_version = get_catalog_version()
+        _version_checked_at = now
+    return _checked_version
+
+
+def get_menu_search_index():
+    """Индекс поиска процесса, перестраиваемый при смене версии каталога"""
+    global _index
+
+    version = _current_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or index.version != version:
+            from .models import MenuItem
+
+            started = time.perf_counter()
+            rows = MenuItem.objects.filter(is_active=True).order_by('priority', '-created_at').values_list(
+                'id', 'name', 'description', 'category__name'
+            )
+            index = MenuSearchIndex(rows.iterator(chunk_size=2000), version)
+            _index = index
+            logger.info(
+                f"Menu search index rebuilt: {len(index)} items, {len(index.tokens)} tokens, "
+                f"version={version} in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+    return index
+
+
+def reset_menu_search_index():
+    global _index, _checked_version
+    with _index_lock:
+        _index = None
+        _checked_version = None
+
+
+# Таблица и триггеры создаются миграцией 0016_menuitem_fts
+FTS_TABLE = 'api_menuitem_fts'
+# Веса колонок для bm25(): название важнее описания
+FTS_WEIGHTS = (3.0, 1.0)
+
+
+def fts5_search(query):
+    """
+    id товаров по запросу через FTS5 в порядке BM25: все слова как префиксы.
+    None - индекс недоступен (не SQLite, нет FTS5 или миграции)
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    terms = normalize_text(query).split()
+    if not terms:
+        return []
+    match = ' AND '.join('"%s"*' % term.replace('"', '""') for term in terms)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, FTS_WEIGHTS))})",
+                [match],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError as e:
+        logger.warning(f"FTS5 menu search unavailable, falling back to icontains: {str(e)}")
+        return None
+
+
+def rank_ordering(ranked_ids):
+    """Выражение для order_by(): позиция id в списке ranked_ids"""
+    if not ranked_ids:
+        return Value(0)
+    return Case(
+        *(When(id=item_id, then=Value(position)) for position, item_id in enumerate(ranked_ids)),
+        output_field=IntegerField(),
+    )
+
+
+def search_menu_items(queryset, query):
+    """
+    Фильтрует queryset товаров по запросу выбранным бэкендом.
+    Возвращает (queryset, id в порядке релевантности или None, если порядок задает вызывающий)
+    """
+    backend = getattr(settings, 'MENU_SEARCH_BACKEND', BACKEND_MEMORY)
+    if backend == BACKEND_MEMORY:
+        ranked_ids = get_menu_search_index().search(query)
+        return queryset.filter(id__in=ranked_ids), ranked_ids
+    if backend == BACKEND_FTS5:
+        ranked_ids = fts5_search(query)
+        if ranked_ids is not None:
+            return queryset.filter(id__in=ranked_ids), ranked_ids
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query)), None
+
+
+class MenuSearchFilter(filters.SearchFilter):
+    """
+    ?search= для MenuItemViewSet: при MENU_SEARCH_BACKEND = 'fts5' через индекс FTS5
+    в порядке BM25 (если не задан ?ordering=), иначе (и без FTS5) - стандартный
+    поиск DRF по search_fields. Индекс в памяти сюда не подходит - в нем только
+    активные товары
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(settings, 'MENU_SEARCH_BACKEND', BACKEND_MEMORY) == BACKEND_FTS5:
+            query = ' '.join(self.get_search_terms(request))
+            if not query:
+                return queryset
+            ranked_ids = fts5_search(query)
+            if ranked_ids is not None:
+                queryset = queryset.filter(id__in=ranked_ids)
+                if request.query_params.get(filters.OrderingFilter.ordering_param):
+                    # Явный ?ordering= применит OrderingFilter
+                    return queryset
+                return queryset.order_by(rank_ordering(ranked_ids))
+        return super().filter_queryset(request, queryset, view)
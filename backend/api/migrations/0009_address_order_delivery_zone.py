@@ -0,0 +1,132 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:25
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+# Копия api.geometry и api.zone_index на момент миграции: существующие адреса и
+# заказы получают зону так же, как ее вычислил бы индекс зон, даже если модули
+# потом изменятся
+BATCH_SIZE = 2000
+
+
+def parse_polygon(coordinates):
+    lats = []
+    lons = []
+    if not coordinates:
+        return lats, lons
+
+    for point in coordinates:
+        try:
+            lat, lon = float(point[0]), float(point[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        lats.append(lat)
+        lons.append(lon)
+
+    if len(lats) > 1 and lats[0] == lats[-1] and lons[0] == lons[-1]:
+        lats.pop()
+        lons.pop()
+
+    return lats, lons
+
+
+def point_in_ring(lat, lon, lats, lons):
+    n = len(lats)
+    if n < 3:
+        return False
+
+    inside = False
+    j = n - 1
+    for i in range(n):
+        lat_i, lat_j = lats[i], lats[j]
+        if (lat_i > lat) != (lat_j > lat):
+            lon_cross = (lons[j] - lons[i]) * (lat - lat_i) / (lat_j - lat_i) + lons[i]
+            if lon < lon_cross:
+                inside = not inside
+        j = i
+
+    return inside
+
+
+def normalize_city(city):
+    if not city:
+        return ''
+    return ' '.join(str(city).split()).casefold()
+
+
+def zones_version(DeliveryZone):
+    stats = DeliveryZone.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    last_updated = stats['last_updated']
+    timestamp = int(last_updated.timestamp() * 1_000_000) if last_updated else 0
+    return f"{stats['count']}-{timestamp}"
+
+
+def stamp_rows(queryset, zones_by_city, version, prefix=''):
+    """Зона для каждой записи queryset по координатам и городу адреса, пачками по BATCH_SIZE"""
+    rows = queryset.order_by('id').values_list('id', f'{prefix}latitude', f'{prefix}longitude', f'{prefix}city')
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        by_zone = {}
+        for row_id, latitude, longitude, city in batch:
+            zone_id = None
+            if latitude and longitude:
+                lat, lon = float(latitude), float(longitude)
+                for candidate_id, lats, lons in zones_by_city.get(normalize_city(city), []):
+                    if point_in_ring(lat, lon, lats, lons):
+                        zone_id = candidate_id
+                        break
+            by_zone.setdefault(zone_id, []).append(row_id)
+        for zone_id, ids in by_zone.items():
+            queryset.model.objects.filter(id__in=ids).update(delivery_zone_id=zone_id, delivery_zone_version=version)
+        last_id = batch[-1][0]
+
+
+def stamp_delivery_zones(apps, schema_editor):
+    DeliveryZone = apps.get_model('api', 'DeliveryZone')
+    Address = apps.get_model('api', 'Address')
+    Order = apps.get_model('api', 'Order')
+
+    zones_by_city = {}
+    for zone in DeliveryZone.objects.filter(is_active=True).order_by('city', 'name', 'id'):
+        lats, lons = parse_polygon(zone.polygon_coordinates)
+        zones_by_city.setdefault(normalize_city(zone.city), []).append((zone.id, lats, lons))
+    version = zones_version(DeliveryZone)
+
+    stamp_rows(Address.objects.all(), zones_by_city, version)
+    # Заказы всех статусов: лента и карта оператора фильтруют по delivery_zone
+    stamp_rows(Order.objects.all(), zones_by_city, version, prefix='address__')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_deliveryzone_polygon_fill_color_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='delivery_zone',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='addresses', to='api.deliveryzone', verbose_name='Зона доставки'),
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='delivery_zone_version',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='Версия зон доставки'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_zone',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='api.deliveryzone', verbose_name='Зона доставки'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_zone_version',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='Версия зон доставки'),
+        ),
+        migrations.RunPython(stamp_delivery_zones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_address_order_delivery_zone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_zone', 'status', 'created_at'], name='api_order_deliver_d66dac_idx'),
+        ),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:30
+
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Копия api.geometry на момент миграции: данные должны строиться так же,
+# даже если алгоритм в модуле потом изменится
+
+
+def parse_polygon(coordinates):
+    """
+    Преобразует JSON полигона в два списка float: широты и долготы.
+    Некорректные вершины пропускаются, замыкающая вершина (равная первой) отбрасывается.
+    """
+    lats = []
+    lons = []
+    if not coordinates:
+        return lats, lons
+
+    for point in coordinates:
+        try:
+            lat, lon = float(point[0]), float(point[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        lats.append(lat)
+        lons.append(lon)
+
+    if len(lats) > 1 and lats[0] == lats[-1] and lons[0] == lons[-1]:
+        lats.pop()
+        lons.pop()
+
+    return lats, lons
+
+
+# Километров в градусе дуги (радиус Земли 6371 км, как в calculate_distance)
+KM_PER_DEGREE = math.pi * 6371 / 180
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """Расстояние от точки до отрезка в плоских координатах (в тех же единицах)"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    if t < 0:
+        t = 0.0
+    elif t > 1:
+        t = 1.0
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def ring_signed_area(lats, lons):
+    """Удвоенная ориентированная площадь кольца в градусах: > 0 - обход против часовой стрелки"""
+    n = len(lats)
+    area = 0.0
+    j = n - 1
+    for i in range(n):
+        area += lons[j] * lats[i] - lons[i] * lats[j]
+        j = i
+    return area
+
+
+def dedupe_ring(lats, lons):
+    """Убирает повторяющиеся подряд вершины, включая совпадение последних вершин с первой"""
+    out_lats, out_lons = [], []
+    for lat, lon in zip(lats, lons):
+        if out_lats and lat == out_lats[-1] and lon == out_lons[-1]:
+            continue
+        out_lats.append(lat)
+        out_lons.append(lon)
+    while len(out_lats) > 1 and out_lats[-1] == out_lats[0] and out_lons[-1] == out_lons[0]:
+        out_lats.pop()
+        out_lons.pop()
+    return out_lats, out_lons
+
+
+def simplify_ring(lats, lons, tolerance_km):
+    """
+    Упрощает замкнутое кольцо алгоритмом Дугласа-Пекера.
+    Каждая отброшенная вершина лежит не дальше tolerance_km от итоговой границы.
+    Кольцо разбивается на две цепочки: от первой вершины до самой удаленной от нее и обратно.
+    """
+    n = len(lats)
+    if n <= 3 or tolerance_km <= 0:
+        return list(lats), list(lons)
+
+    ref_lat = sum(lats) / n
+    lon_scale = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+    xs = [lon * lon_scale for lon in lons]
+    ys = [lat * KM_PER_DEGREE for lat in lats]
+
+    far = max(range(1, n), key=lambda i: (xs[i] - xs[0]) ** 2 + (ys[i] - ys[0]) ** 2)
+    keep = [False] * (n + 1)
+    keep[0] = keep[far] = keep[n] = True
+
+    # Индекс n обозначает первую вершину, замыкающую кольцо
+    stack = [(0, far), (far, n)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        ax, ay = xs[start], ys[start]
+        bx, by = xs[end % n], ys[end % n]
+        max_distance = -1.0
+        index = start
+        for i in range(start + 1, end):
+            distance = point_segment_distance(xs[i], ys[i], ax, ay, bx, by)
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if max_distance > tolerance_km:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    kept = [i for i in range(n) if keep[i]]
+    # Первая вершина сохраняется алгоритмом всегда; убираем ее, если весь участок
+    # между соседними сохраненными вершинами укладывается в допуск
+    if len(kept) > 3:
+        prev, nxt = kept[-1], kept[1]
+        span = list(range(prev + 1, n)) + list(range(0, nxt))
+        if all(
+            point_segment_distance(xs[i], ys[i], xs[prev], ys[prev], xs[nxt], ys[nxt]) <= tolerance_km
+            for i in span
+        ):
+            kept = kept[1:]
+    if len(kept) < 3:
+        return list(lats), list(lons)
+    return [lats[i] for i in kept], [lons[i] for i in kept]
+
+
+def compact_polygon(coordinates, tolerance_km, precision=6):
+    """
+    Компактная версия полигона для проверок принадлежности: координаты округляются
+    до precision знаков, дубли вершин удаляются, кольцо упрощается с допуском
+    tolerance_km и ориентируется против часовой стрелки.
+    Возвращает [[широта, долгота], ...] или None, если полигон некорректен.
+    """
+    lats, lons = parse_polygon(coordinates)
+    lats = [round(lat, precision) for lat in lats]
+    lons = [round(lon, precision) for lon in lons]
+    lats, lons = dedupe_ring(lats, lons)
+    if len(lats) < 3:
+        return None
+
+    lats, lons = simplify_ring(lats, lons, tolerance_km)
+    if ring_signed_area(lats, lons) < 0:
+        lats.reverse()
+        lons.reverse()
+    return [[lat, lon] for lat, lon in zip(lats, lons)]
+
+
+def build_compact_polygons(apps, schema_editor):
+    DeliveryZone = apps.get_model('api', 'DeliveryZone')
+    tolerance_km = getattr(settings, 'DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M', 5.0) / 1000
+    for zone in DeliveryZone.objects.filter(polygon_coordinates__isnull=False):
+        zone.polygon_compact = compact_polygon(zone.polygon_coordinates, tolerance_km)
+        zone.save(update_fields=['polygon_compact'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_order_delivery_zone_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryzone',
+            name='polygon_compact',
+            field=models.JSONField(blank=True, editable=False, help_text='Полигон без дублей вершин, упрощенный с допуском DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M', null=True, verbose_name='Упрощенный полигон'),
+        ),
+        migrations.RunPython(build_compact_polygons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:34
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def mark_addresses_without_coordinates(apps, schema_editor):
+    # Такие адреса уже прошли синхронное геокодирование при сохранении и не получили координат
+    Address = apps.get_model('api', 'Address')
+    Address.objects.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True)).update(geocode_status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_deliveryzone_polygon_compact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geocode_status',
+            field=models.CharField(choices=[('ok', 'Координаты определены'), ('pending', 'Ожидает геокодирования'), ('failed', 'Не удалось определить координаты')], db_index=True, default='ok', max_length=10, verbose_name='Статус геокодирования'),
+        ),
+        migrations.RunPython(mark_addresses_without_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_address_geocode_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('forward', 'Адрес -> координаты'), ('reverse', 'Координаты -> адрес')], max_length=10, verbose_name='Тип запроса')),
+                ('key', models.CharField(help_text='Нормализованный адрес или округленные координаты', max_length=255, verbose_name='Ключ')),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Широта')),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Долгота')),
+                ('result', models.JSONField(verbose_name='Результат')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Кэш геокодирования',
+                'verbose_name_plural': 'Кэш геокодирования',
+                'indexes': [models.Index(fields=['kind', 'latitude', 'longitude'], name='api_geocode_kind_c30511_idx')],
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
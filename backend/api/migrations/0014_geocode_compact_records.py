@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations
+
+
+# Копия api.geocode_store.compact_geocode_record на момент миграции (без поля
+# 'raw'): записи должны сжиматься так же, даже если модуль потом изменится
+def compact_geocode_record(feature):
+    """Компактная запись из GeoObject Яндекса"""
+    lon, lat = feature['Point']['pos'].split()
+    meta = feature.get('metaDataProperty', {}).get('GeocoderMetaData', {})
+    address = meta.get('Address', {})
+    # Компонент одного типа может повторяться (province) - оставляем самый точный, он последний
+    components = {item['kind']: item['name'] for item in address.get('Components', []) if 'kind' in item}
+    return {
+        'lat': float(lat),
+        'lon': float(lon),
+        'address': address.get('formatted') or meta.get('text'),
+        'precision': meta.get('precision'),
+        'kind': meta.get('kind'),
+        'components': components,
+    }
+
+
+def compact_geocode_entries(apps, schema_editor):
+    GeocodeCacheEntry = apps.get_model('api', 'GeocodeCacheEntry')
+    for entry in GeocodeCacheEntry.objects.all().iterator():
+        raw = entry.result.get('raw') if isinstance(entry.result, dict) else None
+        if not raw:
+            continue
+        try:
+            entry.result = compact_geocode_record(raw)
+        except (KeyError, ValueError):
+            continue
+        entry.save(update_fields=['result'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_geocode_entries, migrations.RunPython.noop),
+    ]
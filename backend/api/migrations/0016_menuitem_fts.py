@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:00
+
+import logging
+
+from django.db import DatabaseError, migrations
+
+logger = logging.getLogger('api')
+
+# SQL зафиксирован здесь, а не импортируется из api.menu_search: миграция
+# должна создавать ту же схему, что и в момент ее написания
+FTS_TABLE = 'api_menuitem_fts'
+
+
+def fts_value(column):
+    # unicode61 приводит кириллицу к нижнему регистру, но не сводит ё к е
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def fts5_available(schema_editor):
+    """Проверка FTS5 до создания таблицы: без нее поиск останется на icontains"""
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE temp.api_fts5_probe USING fts5(value)')
+            cursor.execute('DROP TABLE temp.api_fts5_probe')
+    except DatabaseError as e:
+        logger.warning(f"SQLite built without FTS5, menu search index not created: {str(e)}")
+        return False
+    return True
+
+
+def create_menu_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite' or not fts5_available(schema_editor):
+        return
+    new_values = f"new.id, {fts_value('new.name')}, {fts_value('new.description')}"
+    # Дальше ошибки не глушатся: таблица без триггеров отдавала бы устаревший поиск
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"name, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+        f"SELECT id, {fts_value('name')}, {fts_value('description')} FROM api_menuitem"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON api_menuitem BEGIN "
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES ({new_values}); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name, description ON api_menuitem BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES ({new_values}); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON api_menuitem BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END"
+    )
+
+
+def drop_menu_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'update', 'delete'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_catalogchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_menu_search_index, drop_menu_search_index),
+    ]
@@ -1,46 +1,16 @@
 import os
-import requests
+import logging
 import math
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.conf import settings
 import re
 
-def get_coordinates_from_address(address_string):
-    """
-    Получает координаты по адресу через Яндекс.Карты API
-    """
-    try:
-        api_key = getattr(settings, 'YANDEX_MAPS_API_KEY', None)
-        if not api_key:
-            return None, None
-        
-        url = 'https://geocode-maps.yandex.ru/1.x/'
-        params = {
-            'apikey': api_key,
-            'geocode': address_string,
-            'format': 'json',
-            'lang': 'ru_RU',
-        }
-        
-        response = requests.get(url, params=params, timeout=5)
-        if response.status_code != 200:
-            return None, None
-        
-        data = response.json()
-        feature_member = data['response']['GeoObjectCollection']['featureMember']
-        
-        if feature_member:
-            pos = feature_member[0]['GeoObject']['Point']['pos']
-            lon, lat = pos.split()
-            return float(lat), float(lon)
-        
-        return None, None
-        
-    except Exception as e:
-        print(f"Ошибка геокодирования: {e}")
-        return None, None
+from .geometry import parse_polygon, point_in_ring, compact_polygon
+from .zone_index import get_zone_index
+
+logger = logging.getLogger('api')
 
 def validate_uzbek_phone_number(value):
     """
@@ -179,6 +149,15 @@ class DeliveryZone(models.Model):
         help_text="Массив координат [[широта, долгота], ...] для точных границ зоны"
     )
     
+    # Упрощенный полигон для проверок принадлежности (вычисляется при сохранении)
+    polygon_compact = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Упрощенный полигон",
+        help_text="Полигон без дублей вершин, упрощенный с допуском DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M"
+    )
+    
     # Стилизация полигона
     polygon_fill_color = models.CharField(
         max_length=7,
@@ -235,6 +214,26 @@ class DeliveryZone(models.Model):
     def __str__(self):
         return f"{self.name} ({self.city})"
     
+    def save(self, *args, **kwargs):
+        """При сохранении пересчитываем упрощенный полигон"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'polygon_coordinates' in update_fields:
+            self.polygon_compact = self.build_compact_polygon()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'polygon_compact'}
+        super().save(*args, **kwargs)
+    
+    def build_compact_polygon(self, tolerance_m=None):
+        """Строит упрощенный полигон из polygon_coordinates"""
+        if tolerance_m is None:
+            tolerance_m = getattr(settings, 'DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M', 5.0)
+        return compact_polygon(self.polygon_coordinates, tolerance_m / 1000)
+    
+    @property
+    def membership_polygon(self):
+        """Полигон для проверок принадлежности: упрощенный, если он уже вычислен"""
+        return self.polygon_compact or self.polygon_coordinates
+    
     def is_address_in_zone(self, latitude, longitude):
         """
         Проверяет, находится ли адрес в зоне доставки
@@ -253,28 +252,13 @@ class DeliveryZone(models.Model):
     def _is_point_in_polygon(self, latitude, longitude):
         """
         Проверяет, находится ли точка внутри полигона
-        Использует алгоритм ray casting
+        Использует алгоритм ray casting (вершины хранятся как [широта, долгота])
         """
         if not self.polygon_coordinates or len(self.polygon_coordinates) < 3:
             return False
         
-        x, y = float(longitude), float(latitude)
-        n = len(self.polygon_coordinates)
-        inside = False
-        
-        p1x, p1y = self.polygon_coordinates[0]
-        for i in range(n + 1):
-            p2x, p2y = self.polygon_coordinates[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        
-        return inside
+        lats, lons = parse_polygon(self.membership_polygon)
+        return point_in_ring(float(latitude), float(longitude), lats, lons)
     
     def get_distance_to_zone(self, latitude, longitude):
         """
@@ -282,6 +266,8 @@ class DeliveryZone(models.Model):
         """
         if not latitude or not longitude:
             return None
+        if self.center_latitude is None or self.center_longitude is None:
+            return None
         
         return calculate_distance(
             float(self.center_latitude),
@@ -311,6 +297,18 @@ class User(models.Model):
             full_name += f" (@{self.username})"
         return full_name
     
+def schedule_address_geocoding(address_id):
+    """
+    Ставит в очередь геокодирование адреса.
+    Если очередь недоступна, адрес остается pending - его подберет периодическая
+    задача geocode_pending_addresses; запрос к Яндексу в веб-процессе не выполняется.
+    """
+    from .tasks import geocode_address
+    try:
+        geocode_address.delay(address_id)
+    except Exception as e:
+        logger.warning(f"Could not queue geocoding for address {address_id}: {str(e)}")
+
 class Address(models.Model):
     """Модель для хранения адресов доставки с координатами"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='addresses')
@@ -349,6 +347,39 @@ class Address(models.Model):
     )
     comment = models.TextField(blank=True, null=True, verbose_name="Комментарий к адресу")
     
+    # Состояние фонового геокодирования адреса без координат
+    GEOCODE_OK = 'ok'
+    GEOCODE_PENDING = 'pending'
+    GEOCODE_FAILED = 'failed'
+    GEOCODE_STATUS_CHOICES = (
+        (GEOCODE_OK, 'Координаты определены'),
+        (GEOCODE_PENDING, 'Ожидает геокодирования'),
+        (GEOCODE_FAILED, 'Не удалось определить координаты'),
+    )
+    geocode_status = models.CharField(
+        max_length=10,
+        choices=GEOCODE_STATUS_CHOICES,
+        default=GEOCODE_OK,
+        db_index=True,
+        verbose_name="Статус геокодирования"
+    )
+    
+    # Зона доставки, в которую попадает адрес, и версия набора зон, по которой она вычислена
+    delivery_zone = models.ForeignKey(
+        DeliveryZone,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='addresses',
+        verbose_name="Зона доставки"
+    )
+    delivery_zone_version = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        verbose_name="Версия зон доставки"
+    )
+    
     # Метаданные
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -436,21 +467,45 @@ class Address(models.Model):
         if self.phone_number:
             validate_uzbek_phone_number(self.phone_number)
         
-        # Автоматическое геокодирование координат, если они не указаны
-        if (not self.latitude or not self.longitude) and self.street and self.house_number:
-            address_string = self.full_address
-            lat, lon = get_coordinates_from_address(address_string)
-            
-            if lat and lon:
-                self.latitude = lat
-                self.longitude = lon
-                print(f"Автоматически получены координаты для адреса '{address_string}': {lat}, {lon}")
-            else:
-                print(f"Не удалось получить координаты для адреса '{address_string}'")
+        update_fields = kwargs.get('update_fields')
+        location_changed = update_fields is None or bool(set(update_fields) & {
+            'street', 'house_number', 'apartment', 'city', 'latitude', 'longitude'
+        })
+        
+        # Отсутствующие координаты определяются фоновой задачей после сохранения
+        needs_geocoding = (
+            location_changed
+            and (not self.latitude or not self.longitude)
+            and bool(self.street and self.house_number)
+        )
+        if self.latitude and self.longitude:
+            self.geocode_status = self.GEOCODE_OK
+        elif needs_geocoding:
+            self.geocode_status = self.GEOCODE_PENDING
         
         if self.is_primary:
             Address.objects.filter(user=self.user, is_primary=True).exclude(pk=self.pk).update(is_primary=False)
+        
+        # Запоминаем зону доставки, чтобы не пересчитывать геометрию при каждом обращении
+        if location_changed:
+            self.stamp_delivery_zone()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'delivery_zone', 'delivery_zone_version', 'geocode_status'}
         super().save(*args, **kwargs)
+        
+        if needs_geocoding:
+            address_id = self.pk
+            transaction.on_commit(lambda: schedule_address_geocoding(address_id))
+    
+    def stamp_delivery_zone(self):
+        """Вычисляет зону доставки по координатам и запоминает ее вместе с версией набора зон"""
+        zone_index = get_zone_index()
+        zone = None
+        if self.latitude and self.longitude:
+            zone = zone_index.locate(self.latitude, self.longitude, city=self.city)
+        self.delivery_zone_id = zone.id if zone else None
+        self.delivery_zone_version = zone_index.version
+        return zone
     
     def is_in_delivery_zone(self):
         """
@@ -459,55 +514,69 @@ class Address(models.Model):
         if not self.latitude or not self.longitude:
             return False, "Координаты адреса не определены"
         
-        # Получаем активные зоны доставки для города
-        delivery_zones = DeliveryZone.objects.filter(
-            city__iexact=self.city,
-            is_active=True
-        )
+        # Получаем активные зоны доставки для города из индекса процесса
+        zone_index = get_zone_index()
+        delivery_zones = zone_index.zones_for_city(self.city)
         
-        if not delivery_zones.exists():
+        if not delivery_zones:
             return False, f"Доставка в город '{self.city}' не осуществляется"
         
-        # Проверяем каждую зону доставки
-        for zone in delivery_zones:
-            if zone.is_address_in_zone(self.latitude, self.longitude):
-                return True, f"Адрес находится в зоне доставки '{zone.name}'"
-        
-        # Если адрес не входит ни в одну зону, находим ближайшую
-        closest_zone = None
-        min_distance = float('inf')
+        zone = self.resolve_delivery_zone()
+        if zone:
+            return True, f"Адрес находится в зоне доставки '{zone.name}'"
         
-        for zone in delivery_zones:
-            distance = zone.get_distance_to_zone(self.latitude, self.longitude)
-            if distance and distance < min_distance:
-                min_distance = distance
-                closest_zone = zone
+        # Если адрес не входит ни в одну зону, находим ближайшую по расстоянию до границы
+        closest_zone, min_distance = zone_index.edge_index(self.city).nearest(self.latitude, self.longitude)
         
         if closest_zone:
             return False, f"Адрес находится на расстоянии {min_distance:.1f} км от зоны доставки '{closest_zone.name}'"
         
         return False, "Не удалось определить зону доставки"
     
+    def resolve_delivery_zone(self):
+        """
+        Возвращает скомпилированную зону доставки (CompiledZone), в которую попадает адрес, или None.
+        Использует сохраненную зону, пока не изменился набор зон; иначе пересчитывает и сохраняет ее.
+        """
+        zone_index = get_zone_index()
+        if self.pk and self.delivery_zone_version == zone_index.version:
+            return zone_index.get(self.delivery_zone_id) if self.delivery_zone_id else None
+        
+        zone = self.stamp_delivery_zone()
+        if self.pk:
+            Address.objects.filter(pk=self.pk).update(
+                delivery_zone_id=self.delivery_zone_id,
+                delivery_zone_version=self.delivery_zone_version
+            )
+        return zone
+    
     def get_delivery_zones_info(self):
         """
-        Возвращает информацию о доступных зонах доставки для города
+        Возвращает информацию о доступных зонах доставки для города.
+        distance - расстояние до границы зоны в км (0, если адрес внутри зоны)
         """
-        zones = DeliveryZone.objects.filter(
-            city__iexact=self.city,
-            is_active=True
-        )
+        zone_index = get_zone_index()
+        zones = zone_index.zones_for_city(self.city)
+        
+        has_coordinates = bool(self.latitude and self.longitude)
+        distances = {}
+        if has_coordinates and zones:
+            distances = zone_index.edge_index(self.city).distances(self.latitude, self.longitude)
         
         zones_info = []
         for zone in zones:
+            is_in_zone = has_coordinates and zone.contains(float(self.latitude), float(self.longitude))
             distance = None
-            if self.latitude and self.longitude:
-                distance = zone.get_distance_to_zone(self.latitude, self.longitude)
+            if is_in_zone:
+                distance = 0.0
+            elif zone.id in distances:
+                distance = round(distances[zone.id], 3)
             
             zones_info.append({
                 'name': zone.name,
-                'radius_km': float(zone.radius_km),
+                'radius_km': float(zone.radius_km) if zone.radius_km is not None else None,
                 'distance': distance,
-                'is_in_zone': zone.is_address_in_zone(self.latitude, self.longitude) if self.latitude and self.longitude else False
+                'is_in_zone': is_in_zone
             })
         
         return zones_info
@@ -812,6 +881,22 @@ class Order(models.Model):
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Стоимость доставки")
     discounted_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Итоговая сумма после скидки")
     
+    # Зона доставки заказа (по адресу) и версия набора зон, по которой она вычислена
+    delivery_zone = models.ForeignKey(
+        DeliveryZone,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='orders',
+        verbose_name="Зона доставки"
+    )
+    delivery_zone_version = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        verbose_name="Версия зон доставки"
+    )
+    
     # Время доставки
     delivery_time = models.DateTimeField(
         blank=True, 
@@ -837,11 +922,45 @@ class Order(models.Model):
             models.Index(fields=['delivery_time']),
             models.Index(fields=['user', 'status']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['delivery_zone', 'status', 'created_at']),  # Лента заказов оператора по зонам
         ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user}"
 
+    def save(self, *args, **kwargs):
+        # Зона берется из адреса; при частичном сохранении без смены адреса не пересчитывается
+        update_fields = kwargs.get('update_fields')
+        if self.address_id and (update_fields is None or 'address' in update_fields):
+            self.stamp_delivery_zone()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'delivery_zone', 'delivery_zone_version'}
+        super().save(*args, **kwargs)
+
+    def stamp_delivery_zone(self):
+        """Запоминает зону доставки адреса заказа вместе с версией набора зон"""
+        zone = self.address.resolve_delivery_zone()
+        self.delivery_zone_id = zone.id if zone else None
+        self.delivery_zone_version = get_zone_index().version
+        return zone
+
+    def resolve_delivery_zone(self):
+        """
+        Возвращает скомпилированную зону доставки заказа (CompiledZone) или None.
+        Пересчитывается только если с момента сохранения изменился набор зон.
+        """
+        zone_index = get_zone_index()
+        if self.pk and self.delivery_zone_version == zone_index.version:
+            return zone_index.get(self.delivery_zone_id) if self.delivery_zone_id else None
+        
+        zone = self.stamp_delivery_zone()
+        if self.pk:
+            Order.objects.filter(pk=self.pk).update(
+                delivery_zone_id=self.delivery_zone_id,
+                delivery_zone_version=self.delivery_zone_version
+            )
+        return zone
+
     def calculate_total(self):
         total = 0
         for item in self.orderitem_set.all():
@@ -851,21 +970,13 @@ class Order(models.Model):
 
     def apply_promotion(self):
         # Проверяем зону доставки
-        is_in_zone, message = self.address.is_in_delivery_zone()
-        if not is_in_zone:
+        zone = self.resolve_delivery_zone()
+        if not zone:
+            _, message = self.address.is_in_delivery_zone()
             raise ValidationError(f"Адрес не в зоне доставки: {message}")
         
         # Получаем базовую стоимость доставки из зоны (без учета min_order_amount зоны)
-        base_delivery_fee = 0
-        delivery_zones = DeliveryZone.objects.filter(
-            city__iexact=self.address.city,
-            is_active=True
-        )
-        
-        for zone in delivery_zones:
-            if zone.is_address_in_zone(self.address.latitude, self.address.longitude):
-                base_delivery_fee = zone.delivery_fee
-                break
+        base_delivery_fee = zone.delivery_fee if zone else 0
         
         # Если акция не выбрана, автоматически применяем лучшую доступную
         if not self.promotion:
@@ -882,11 +993,8 @@ class Order(models.Model):
             print(f"   - Акция не валидна или не выбрана")
             # Применяем базовую стоимость доставки и проверяем min_order_amount зоны
             self.delivery_fee = base_delivery_fee
-            for zone in delivery_zones:
-                if zone.is_address_in_zone(self.address.latitude, self.address.longitude):
-                    if zone.min_order_amount and self.calculate_total() >= zone.min_order_amount:
-                        self.delivery_fee = 0
-                    break
+            if zone and zone.min_order_amount and self.calculate_total() >= zone.min_order_amount:
+                self.delivery_fee = 0
             self.discounted_total = self.calculate_total() + self.delivery_fee
             self.save()
             return
@@ -944,11 +1052,8 @@ class Order(models.Model):
         self.delivery_fee = new_delivery_fee
         
         # Проверяем min_order_amount зоны после применения акции
-        for zone in delivery_zones:
-            if zone.is_address_in_zone(self.address.latitude, self.address.longitude):
-                if zone.min_order_amount and self.calculate_total() >= zone.min_order_amount:
-                    self.delivery_fee = 0
-                break
+        if zone and zone.min_order_amount and self.calculate_total() >= zone.min_order_amount:
+            self.delivery_fee = 0
         
         self.discounted_total = order_total - discount_amount + self.delivery_fee
         if self.discounted_total < 0:
@@ -972,16 +1077,8 @@ class Order(models.Model):
         max_discount = 0
         
         # Рассчитываем базовую стоимость доставки для оценки FREE_DELIVERY акций (без учета min_order_amount зоны)
-        base_delivery_fee = 0
-        delivery_zones = DeliveryZone.objects.filter(
-            city__iexact=self.address.city,
-            is_active=True
-        )
-        
-        for zone in delivery_zones:
-            if zone.is_address_in_zone(self.address.latitude, self.address.longitude):
-                base_delivery_fee = zone.delivery_fee
-                break
+        zone = self.resolve_delivery_zone()
+        base_delivery_fee = zone.delivery_fee if zone else 0
         
         # Отладочная информация
         print(f"🔍 Отладка get_best_available_promotion:")
@@ -1052,4 +1149,65 @@ class Favorite(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.first_name} - {self.menu_item.name}"
\ No newline at end of file
+        return f"{self.user.first_name} - {self.menu_item.name}"
+
+class GeocodeCacheEntry(models.Model):
+    """Постоянный кэш ответов геокодера (нижний уровень api.geocode_store)"""
+    KIND_FORWARD = 'forward'
+    KIND_REVERSE = 'reverse'
+    KIND_CHOICES = [
+        (KIND_FORWARD, 'Адрес -> координаты'),
+        (KIND_REVERSE, 'Координаты -> адрес'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип запроса")
+    key = models.CharField(max_length=255, verbose_name="Ключ",
+                           help_text="Нормализованный адрес или округленные координаты")
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name="Широта")
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name="Долгота")
+    result = models.JSONField(verbose_name="Результат")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Кэш геокодирования"
+        verbose_name_plural = "Кэш геокодирования"
+        unique_together = ('kind', 'key')
+        indexes = [
+            models.Index(fields=['kind', 'latitude', 'longitude']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.key}"
+
+class CatalogChange(models.Model):
+    """
+    Журнал изменений каталога для дельта-синхронизации (api.catalog_changes).
+    id записи - версия каталога: клиент присылает последнюю известную версию
+    и получает только товары, измененные после нее
+    """
+    KIND_ITEM = 'item'
+    KIND_CATEGORY = 'category'
+    KIND_CHOICES = [
+        (KIND_ITEM, 'Товар'),
+        (KIND_CATEGORY, 'Категория'),
+    ]
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, 'Создание или изменение'),
+        (ACTION_DELETE, 'Удаление'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип объекта")
+    object_id = models.PositiveIntegerField(verbose_name="ID объекта")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="Действие")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Изменение каталога"
+        verbose_name_plural = "Изменения каталога"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.get_action_display()}: {self.get_kind_display()} {self.object_id}"
@@ -18,9 +18,9 @@ class AddressSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'street', 'house_number', 'apartment', 'city',
             'latitude', 'longitude', 'is_primary', 'phone_number', 'formatted_phone', 'comment',
-            'full_address', 'coordinates', 'created_at', 'updated_at'
+            'full_address', 'coordinates', 'geocode_status', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['geocode_status', 'created_at', 'updated_at']
 
 class AddressCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания адреса"""
@@ -1,43 +1,121 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from .models import MenuItem, Category
-from .utils import clear_menu_cache, clear_categories_cache
+from django.db import transaction
+from .models import MenuItem, Category, CatalogChange, DeliveryZone, SizeOption, AddOn, Promotion
+from .catalog_cache import bump_catalog_generation
+from .catalog_changes import record_changes
+from .zone_index import invalidate_zone_index
 import logging
 
 logger = logging.getLogger('api')
 
-@receiver(post_save, sender=MenuItem)
-def clear_menu_cache_on_menu_item_change(sender, instance, **kwargs):
-    """Очищает кэш меню при изменении элемента меню"""
+CATALOG_MODELS = (MenuItem, Category, SizeOption, AddOn, Promotion)
+CATALOG_M2M = (
+    MenuItem.size_options.through,
+    MenuItem.add_on_options.through,
+    AddOn.available_for_categories.through,
+    Promotion.applicable_items.through,
+)
+
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш каталога (меню, категории, хиты, новинки) при изменении модели каталога"""
+    action = kwargs.get('action')
+    if action is not None and not action.startswith('post_'):
+        # m2m_changed: реагируем только на post_add/post_remove/post_clear
+        return
     try:
-        clear_menu_cache()
-        logger.info(f"Menu cache cleared after MenuItem change: id={instance.id}")
+        bump_catalog_generation()
+        logger.info(f"Catalog cache invalidated after {sender.__name__} change: id={instance.pk}")
     except Exception as e:
-        logger.error(f"Error clearing menu cache: {str(e)}")
+        logger.error(f"Error invalidating catalog cache: {str(e)}")
 
-@receiver(post_delete, sender=MenuItem)
-def clear_menu_cache_on_menu_item_delete(sender, instance, **kwargs):
-    """Очищает кэш меню при удалении элемента меню"""
+for catalog_model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog_cache, sender=catalog_model, dispatch_uid=f'catalog_save_{catalog_model.__name__}')
+    post_delete.connect(invalidate_catalog_cache, sender=catalog_model, dispatch_uid=f'catalog_delete_{catalog_model.__name__}')
+for through in CATALOG_M2M:
+    m2m_changed.connect(invalidate_catalog_cache, sender=through, dispatch_uid=f'catalog_m2m_{through.__name__}')
+
+def _items_with_addons(addon_ids):
+    return MenuItem.add_on_options.through.objects.filter(addon_id__in=addon_ids).values_list('menuitem_id', flat=True)
+
+def _record_item_changes(item_ids, action=CatalogChange.ACTION_UPSERT):
     try:
-        clear_menu_cache()
-        logger.info(f"Menu cache cleared after MenuItem deletion: id={instance.id}")
+        record_changes(CatalogChange.KIND_ITEM, item_ids, action)
     except Exception as e:
-        logger.error(f"Error clearing menu cache: {str(e)}")
+        logger.error(f"Error recording catalog change: {str(e)}")
+
+@receiver(post_save, sender=MenuItem)
+def record_menu_item_save(sender, instance, **kwargs):
+    """Журнал изменений каталога: товар создан или изменен"""
+    _record_item_changes([instance.pk])
+
+@receiver(post_delete, sender=MenuItem)
+def record_menu_item_delete(sender, instance, **kwargs):
+    """Журнал изменений каталога: товар удален"""
+    _record_item_changes([instance.pk], CatalogChange.ACTION_DELETE)
 
 @receiver(post_save, sender=Category)
-def clear_categories_cache_on_category_change(sender, instance, **kwargs):
-    """Очищает кэш категорий при изменении категории"""
+@receiver(post_delete, sender=Category)
+def record_category_change(sender, instance, signal, **kwargs):
+    """Журнал изменений каталога: категория изменена или удалена (товары удалятся своими сигналами)"""
+    action = CatalogChange.ACTION_DELETE if signal is post_delete else CatalogChange.ACTION_UPSERT
     try:
-        clear_categories_cache()
-        logger.info(f"Categories cache cleared after Category change: id={instance.id}")
+        record_changes(CatalogChange.KIND_CATEGORY, [instance.pk], action)
     except Exception as e:
-        logger.error(f"Error clearing categories cache: {str(e)}")
+        logger.error(f"Error recording catalog change: {str(e)}")
 
-@receiver(post_delete, sender=Category)
-def clear_categories_cache_on_category_delete(sender, instance, **kwargs):
-    """Очищает кэш категорий при удалении категории"""
+@receiver(post_save, sender=SizeOption)
+@receiver(pre_delete, sender=SizeOption)
+def record_size_option_change(sender, instance, **kwargs):
+    """Размер входит в сериализацию товаров - изменяются все товары с этим размером"""
+    # При удалении связи еще на месте только в pre_delete
+    _record_item_changes(instance.menuitem_set.values_list('id', flat=True))
+
+@receiver(post_save, sender=AddOn)
+@receiver(pre_delete, sender=AddOn)
+def record_add_on_change(sender, instance, **kwargs):
+    """Дополнение входит в сериализацию товаров - изменяются все товары с этим дополнением"""
+    _record_item_changes(instance.menuitem_set.values_list('id', flat=True))
+
+@receiver(m2m_changed, sender=MenuItem.size_options.through)
+@receiver(m2m_changed, sender=MenuItem.add_on_options.through)
+def record_menu_item_options_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Журнал изменений каталога: у товара изменились размеры или дополнения"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _record_item_changes([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        _record_item_changes(pk_set)
+    elif action == 'pre_clear':
+        _record_item_changes(instance.menuitem_set.values_list('id', flat=True))
+
+@receiver(m2m_changed, sender=AddOn.available_for_categories.through)
+def record_add_on_categories_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Журнал изменений каталога: изменились категории, для которых доступно дополнение"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _record_item_changes(_items_with_addons([instance.pk]))
+    elif action in ('post_add', 'post_remove'):
+        _record_item_changes(_items_with_addons(pk_set))
+    elif action == 'pre_clear':
+        _record_item_changes(_items_with_addons(instance.available_addons.values_list('id', flat=True)))
+
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+def invalidate_zone_index_on_zone_change(sender, instance, **kwargs):
+    """Сбрасывает индекс зон доставки при изменении или удалении зоны"""
+    try:
+        invalidate_zone_index()
+        logger.info(f"Delivery zone index invalidated after DeliveryZone change: id={instance.id}")
+    except Exception as e:
+        logger.error(f"Error invalidating delivery zone index: {str(e)}")
+    transaction.on_commit(schedule_delivery_zone_refresh)
+
+def schedule_delivery_zone_refresh():
+    """Ставит в очередь пересчет сохраненных зон заказов и адресов"""
+    from .tasks import refresh_delivery_zone_stamps
     try:
-        clear_categories_cache()
-        logger.info(f"Categories cache cleared after Category deletion: id={instance.id}")
+        refresh_delivery_zone_stamps.delay()
     except Exception as e:
-        logger.error(f"Error clearing categories cache: {str(e)}") 
\ No newline at end of file
+        # Пропущенный пересчет выполнит периодический запуск задачи из CELERY_BEAT_SCHEDULE
+        logger.warning(f"Could not schedule delivery zone refresh: {str(e)}")
@@ -0,0 +1,125 @@
+"""
+Single-flight: одновременно выполняется не больше одного вычисления на ключ.
+
+Внутри процесса потоки с одинаковым ключом ждут результата первого потока.
+Между процессами (веб-воркеры, воркеры Celery) ведущий выбирается через
+cache.add (SET NX в Redis): он выполняет вычисление и кладет результат в
+кэш, остальные опрашивают кэш до wait_timeout. Если ведущий упал или не
+уложился в время ожидания, ожидающий выполняет вычисление сам - ожидание
+ограничено, но запрос пользователя не теряется.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+logger = logging.getLogger('api')
+
+_PENDING = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = _PENDING
+
+
+_local_lock = threading.Lock()
+_local_flights = {}
+
+
+def _cache_call(method, *args):
+    try:
+        return getattr(cache, method)(*args)
+    except Exception as e:
+        logger.warning(f"Cache error in single-flight {method}: {str(e)}")
+        return None
+
+
+# Сравнение и удаление одной командой: между GET и DEL блокировка могла истечь
+# и достаться другому процессу - ее нельзя снимать
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _release_lock(lock_key, token):
+    """
+    Снимает блокировку, если она все еще наша (скрипт Lua в Redis).
+    Без Redis атомарного сравнения нет - блокировка истекает по lock_ttl
+    """
+    try:
+        from django_redis import get_redis_connection
+        connection = get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return
+    try:
+        connection.eval(_RELEASE_SCRIPT, 1, cache.client.make_key(lock_key), cache.client.encode(token))
+    except Exception as e:
+        logger.warning(f"Cache error releasing single-flight lock {lock_key}: {str(e)}")
+
+
+def _run_leader(key, compute, result_ttl, token):
+    try:
+        result = compute()
+        # Результат публикуется до снятия блокировки, чтобы ожидающие не стали ведущими зря
+        _cache_call('set', f'{key}:result', result, result_ttl)
+        return result
+    finally:
+        _release_lock(f'{key}:lock', token)
+
+
+def _run_distributed(key, compute, wait_timeout, lock_ttl, result_ttl):
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_timeout
+    delay = 0.02
+    while True:
+        acquired = _cache_call('add', f'{key}:lock', token, lock_ttl)
+        if acquired or acquired is None:
+            # Кэш недоступен (None) - координировать нечем, вычисляем сами
+            return _run_leader(key, compute, result_ttl, token)
+
+        result = _cache_call('get', f'{key}:result')
+        if result is not None:
+            return result
+        if time.monotonic() >= deadline:
+            logger.warning(f"Single-flight wait timed out for {key}, computing locally")
+            return compute()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.2)
+
+
+def single_flight(key, compute, wait_timeout=5, lock_ttl=30, result_ttl=30):
+    """
+    Выполняет compute() не более одного раза одновременно для key.
+
+    Args:
+        key: Ключ вычисления (без пробелов, пригодный для кэша)
+        compute: Функция без аргументов; ее результат должен сериализоваться в кэш
+        wait_timeout: Сколько ждать чужого результата (сек)
+        lock_ttl: Время жизни блокировки ведущего (сек)
+        result_ttl: Сколько результат ведущего лежит в кэше для ожидающих (сек)
+    """
+    with _local_lock:
+        flight = _local_flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _local_flights[key] = _Flight()
+
+    if not leader:
+        if flight.event.wait(wait_timeout) and flight.result is not _PENDING:
+            return flight.result
+        return compute()
+
+    try:
+        flight.result = _run_distributed(f'single_flight:{key}', compute, wait_timeout, lock_ttl, result_ttl)
+        return flight.result
+    finally:
+        with _local_lock:
+            _local_flights.pop(key, None)
+        flight.event.set()
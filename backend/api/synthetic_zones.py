@@ -0,0 +1,26 @@
+"""
+Синтетические полигоны зон доставки для бенчмарков и тестов.
+"""
+import math
+import random
+
+# Центр Бухары, вокруг которого строятся синтетические полигоны
+CENTER_LAT = 39.7747
+CENTER_LON = 64.4286
+
+
+def make_synthetic_polygon(vertices, radius_km=3.0, jitter=0.25, seed=0, center=(CENTER_LAT, CENTER_LON)):
+    """Звездообразный полигон с заданным количеством вершин [[широта, долгота], ...]"""
+    rnd = random.Random(seed)
+    center_lat, center_lon = center
+    lat_deg = radius_km / 111.32
+    lon_deg = radius_km / (111.32 * math.cos(math.radians(center_lat)))
+    polygon = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        scale = 1 + rnd.uniform(-jitter, jitter)
+        polygon.append([
+            center_lat + lat_deg * scale * math.sin(angle),
+            center_lon + lon_deg * scale * math.cos(angle),
+        ])
+    return polygon
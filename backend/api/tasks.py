@@ -1,10 +1,20 @@
 import os
+import uuid
 import requests
 import logging
+from datetime import timedelta
 from celery import shared_task
+from celery.signals import task_postrun
 from django.conf import settings
 from django.core.cache import cache
 
+from . import http_client
+from .geocode_store import (
+    KIND_FORWARD, KIND_REVERSE, compact_geocode_record, forward_key, geocode_store, reverse_key, store_key
+)
+from .single_flight import single_flight
+from .utils import notify_task_done
+
 logger = logging.getLogger(__name__)
 
 @shared_task(
@@ -34,9 +44,6 @@ def send_telegram_notification(self, chat_id, message, parse_mode='HTML'):
             logger.error("BOT_TOKEN not configured")
             return {'success': False, 'error': 'BOT_TOKEN not configured'}
         
-        # URL для отправки сообщения
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        
         # Данные для отправки
         data = {
             'chat_id': chat_id,
@@ -45,8 +52,8 @@ def send_telegram_notification(self, chat_id, message, parse_mode='HTML'):
             'disable_web_page_preview': True,
         }
         
-        # Отправляем запрос с таймаутом
-        response = requests.post(url, json=data, timeout=10)
+        # Отправляем запрос через общий пул соединений с api.telegram.org
+        response = http_client.telegram_request('sendMessage', data)
         response.raise_for_status()
         
         result = response.json()
@@ -208,48 +215,172 @@ def geocode_yandex(self, address=None, lat=None, lon=None):
     Асинхронная задача для геокодирования через Яндекс.Карты с кэшированием
     address: строка адреса (прямое геокодирование)
     lat, lon: координаты (обратное геокодирование)
+    Ответы хранятся в geocode_store (память процесса, Redis, таблица GeocodeCacheEntry);
+    известные адреса берутся из локального газеттира без запроса к Яндекс
     """
     try:
         api_key = settings.YANDEX_MAPS_API_KEY
-        url = 'https://geocode-maps.yandex.ru/1.x/'
-        cache_key = None
         params = {
             'apikey': api_key,
             'format': 'json',
             'lang': 'ru_RU',
         }
-        if address:
-            cache_key = f'yandex_geocode:{address.strip().lower()}'
+        if address and forward_key(address):
+            kind, key = KIND_FORWARD, forward_key(address)
             params['geocode'] = address
         elif lat is not None and lon is not None:
-            cache_key = f'yandex_reverse:{lat},{lon}'
+            kind, key = KIND_REVERSE, reverse_key(lat, lon)
             params['geocode'] = f'{lon},{lat}'
         else:
             return {'error': 'address or lat/lon required'}
 
         # Проверяем кэш
-        cached = cache.get(cache_key)
+        if kind == KIND_REVERSE:
+            cached, tier = geocode_store.get_reverse(lat, lon)
+        else:
+            cached, tier = geocode_store.get_forward(address)
         if cached:
-            return {'cached': True, 'result': cached}
+            return {'cached': True, 'tier': tier, 'result': cached}
+
+        # Одинаковые запросы из разных процессов ждут один запрос к Яндекс API
+        return single_flight(
+            store_key(kind, key),
+            lambda: _fetch_yandex(kind, key, params, address, lat, lon),
+            wait_timeout=getattr(settings, 'GEOCODE_SINGLE_FLIGHT_WAIT_SECONDS', 5),
+            lock_ttl=getattr(settings, 'GEOCODE_SINGLE_FLIGHT_LOCK_TTL', 30),
+        )
+    except Exception as e:
+        return {'error': str(e)} 
+
+def _fetch_yandex(kind, key, params, address, lat, lon):
+    """Запрос к Яндекс API для geocode_yandex; выполняется ведущим single-flight"""
+    # Пока ждали блокировку, ответ мог сохранить предыдущий ведущий
+    cached, tier = geocode_store.get(kind, key, count=False)
+    if cached:
+        return {'cached': True, 'tier': tier, 'result': cached}
+
+    r = http_client.yandex_geocode_request(params)
+    if r.status_code != 200:
+        return {'error': 'Yandex API error', 'details': r.text}
+    resp = r.json()
+    try:
+        feature = resp['response']['GeoObjectCollection']['featureMember'][0]['GeoObject']
+        # Кэшируем и возвращаем компактную запись, а не весь GeoObject
+        result = compact_geocode_record(feature)
+        if address:
+            geocode_store.set(kind, key, result, result['lat'], result['lon'])
+        else:
+            if not result['address']:
+                raise KeyError('address text')
+            geocode_store.set(kind, key, result, lat, lon)
+        return {'cached': False, 'result': result}
+    except Exception as e:
+        return {'error': 'Not found', 'details': str(e)}
+
+@task_postrun.connect(sender=geocode_yandex)
+def notify_geocode_done(task_id=None, **kwargs):
+    """Будит запросы GeocodeResultView, ожидающие результат (?wait=); результат к этому моменту сохранен"""
+    notify_task_done(task_id)
 
-        # Запрос к Яндекс API
-        r = requests.get(url, params=params, timeout=10)
-        if r.status_code != 200:
-            return {'error': 'Yandex API error', 'details': r.text}
-        resp = r.json()
+def enqueue_geocode_yandex(kind, key, **kwargs):
+    """
+    Ставит geocode_yandex в очередь и возвращает task_id.
+    Пока задача по тому же ключу в работе, повторные вызовы получают ее task_id
+    вместо новой задачи
+    """
+    task_key = f'single_flight:{store_key(kind, key)}:task'
+    task_id = uuid.uuid4().hex
+    try:
+        if not cache.add(task_key, task_id, getattr(settings, 'GEOCODE_SINGLE_FLIGHT_LOCK_TTL', 30)):
+            existing = cache.get(task_key)
+            if existing:
+                return existing
+    except Exception as e:
+        logger.warning(f"Cache error coalescing geocode task: {str(e)}")
+
+    try:
+        geocode_yandex.apply_async(kwargs=kwargs, task_id=task_id)
+    except Exception:
         try:
-            feature = resp['response']['GeoObjectCollection']['featureMember'][0]['GeoObject']
-            if address:
-                pos = feature['Point']['pos']
-                lon_, lat_ = pos.split()
-                result = {'lat': float(lat_), 'lon': float(lon_), 'raw': feature}
-            else:
-                result_address = feature['metaDataProperty']['GeocoderMetaData']['text']
-                result = {'address': result_address, 'raw': feature}
-            # Кэшируем результат на 24 часа
-            cache.set(cache_key, result, 60*60*24)
-            return {'cached': False, 'result': result}
-        except Exception as e:
-            return {'error': 'Not found', 'details': str(e)}
+            cache.delete(task_key)
+        except Exception:
+            pass
+        raise
+    return task_id
+
+@shared_task(bind=True, name='api.tasks.refresh_delivery_zone_stamps', queue='default')
+def refresh_delivery_zone_stamps(self):
+    """
+    Пересчитывает сохраненные зоны доставки заказов (всех статусов - по ним фильтруются
+    лента, история и карта оператора) и адресов после изменения зон
+    """
+    from .models import Address, Order
+    from .zone_index import refresh_zone_stamps
+
+    try:
+        orders = refresh_zone_stamps(Order.objects.all(), prefix='address__')
+        addresses = refresh_zone_stamps(Address.objects.all())
+        return {'success': True, 'orders': orders, 'addresses': addresses}
     except Exception as e:
-        return {'error': str(e)} 
\ No newline at end of file
+        logger.error(f"Error refreshing delivery zone stamps: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+@shared_task(
+    bind=True,
+    name='api.tasks.geocode_address',
+    queue='default',
+    max_retries=3,
+)
+def geocode_address(self, address_id):
+    """
+    Заполняет координаты адреса, сохраненного без них.
+    Использует geocode_yandex и его кэш; сохранение адреса пересчитывает зону доставки.
+    """
+    from .models import Address
+
+    try:
+        address = Address.objects.get(pk=address_id)
+    except Address.DoesNotExist:
+        return {'success': False, 'error': 'Address not found'}
+
+    if address.latitude and address.longitude:
+        Address.objects.filter(pk=address_id).update(geocode_status=Address.GEOCODE_OK)
+        return {'success': True, 'cached': True}
+
+    result = geocode_yandex(address=address.full_address)
+    if 'result' in result:
+        address.latitude = round(result['result']['lat'], 6)
+        address.longitude = round(result['result']['lon'], 6)
+        address.save(update_fields=['latitude', 'longitude', 'geocode_status', 'updated_at'])
+        logger.info(f"Address {address_id} geocoded: {address.latitude}, {address.longitude}")
+        return {'success': True, 'cached': result.get('cached', False)}
+
+    # Адрес не найден - повтор не поможет; ошибки сети и API повторяем
+    retriable = not (self.request.is_eager or self.request.called_directly)
+    if result.get('error') != 'Not found' and retriable and self.request.retries < self.max_retries:
+        raise self.retry(countdown=5 * (self.request.retries + 1))
+
+    Address.objects.filter(pk=address_id).update(geocode_status=Address.GEOCODE_FAILED)
+    logger.warning(f"Address {address_id} geocoding failed: {result.get('error')}")
+    return {'success': False, 'error': result.get('error')}
+
+@shared_task(bind=True, name='api.tasks.geocode_pending_addresses', queue='default')
+def geocode_pending_addresses(self):
+    """
+    Повторно ставит в очередь адреса, застрявшие в pending (например, очередь была
+    недоступна при сохранении). Запускается celery beat
+    """
+    from django.utils import timezone
+    from .models import Address
+
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'ADDRESS_GEOCODE_RETRY_AFTER', 60))
+    address_ids = list(
+        Address.objects.filter(geocode_status=Address.GEOCODE_PENDING, updated_at__lt=stale_before)
+        .order_by('updated_at')
+        .values_list('id', flat=True)[:getattr(settings, 'ADDRESS_GEOCODE_RETRY_BATCH', 100)]
+    )
+    for address_id in address_ids:
+        geocode_address.delay(address_id)
+    if address_ids:
+        logger.info(f"Requeued geocoding for {len(address_ids)} pending addresses")
+    return {'success': True, 'queued': len(address_ids)}
@@ -1,3 +1,1000 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from requests.adapters import HTTPAdapter
+from rest_framework.test import APIClient
+
+from . import http_client
+from .single_flight import single_flight
+from .tasks import geocode_address, geocode_pending_addresses
+from .geocode_store import KIND_FORWARD, KIND_REVERSE, forward_key, geocode_store, reverse_key
+from .models import User, Address, AddOn, Category, DeliveryZone, GeocodeCacheEntry, MenuItem, Order, SizeOption
+from .geometry import KM_PER_DEGREE, parse_polygon, point_segment_distance, ring_signed_area
+from .zone_distance import EdgeIndex
+from .zone_index import CompiledZone, get_zone_index, invalidate_zone_index, normalize_city
+from .synthetic_zones import make_synthetic_polygon
+
+# Квадрат ~2x2 км вокруг центра Бухары, вершины [широта, долгота]
+BUKHARA_SQUARE = [
+    [39.76, 64.41],
+    [39.76, 64.43],
+    [39.78, 64.43],
+    [39.78, 64.41],
+]
+
+
+class ZoneIndexTest(TestCase):
+    """
+    Тесты скомпилированного индекса зон доставки
+    """
+
+    def setUp(self):
+        # Откат транзакции теста не вызывает сигналы - индекс зон процесса сбрасываем сами
+        self.addCleanup(invalidate_zone_index)
+        self.zone = DeliveryZone.objects.create(
+            name='Центр',
+            city='Бухара',
+            delivery_fee=Decimal('5000'),
+            min_order_amount=Decimal('100000'),
+            polygon_coordinates=BUKHARA_SQUARE,
+            is_active=True
+        )
+        self.user = User.objects.create(telegram_id=111, first_name='Тест')
+
+    def test_locate_point_inside_polygon(self):
+        zone = get_zone_index().locate(39.77, 64.42, city='Бухара')
+        self.assertIsNotNone(zone)
+        self.assertEqual(zone.id, self.zone.id)
+        self.assertEqual(zone.delivery_fee, Decimal('5000'))
+
+    def test_locate_point_outside_polygon(self):
+        self.assertIsNone(get_zone_index().locate(39.79, 64.42, city='Бухара'))
+        self.assertIsNone(get_zone_index().locate(39.77, 64.42, city='Каган'))
+
+    def test_city_key_is_case_insensitive(self):
+        self.assertEqual(normalize_city('  БУХАРА '), normalize_city('бухара'))
+        self.assertEqual(len(get_zone_index().zones_for_city('бухара')), 1)
+
+    def test_model_check_matches_index(self):
+        self.assertTrue(self.zone.is_address_in_zone(39.77, 64.42))
+        self.assertFalse(self.zone.is_address_in_zone(39.79, 64.42))
+
+    def test_index_rebuilt_after_zone_change(self):
+        first = get_zone_index()
+        self.zone.is_active = False
+        self.zone.save()
+        second = get_zone_index()
+        self.assertIsNot(first, second)
+        self.assertIsNone(second.locate(39.77, 64.42))
+
+    def test_grid_matches_exact_check(self):
+        zone = DeliveryZone(id=1, name='synthetic', city='Бухара', delivery_fee=0,
+                            polygon_coordinates=make_synthetic_polygon(300, seed=7))
+        gridded = CompiledZone(zone, cell_size=0.001)
+        exact = CompiledZone(zone)
+        self.assertTrue(gridded.cells)
+        min_lat, min_lon, max_lat, max_lon = exact.bbox
+        steps = 60
+        for i in range(steps + 1):
+            for j in range(steps + 1):
+                lat = min_lat + (max_lat - min_lat) * i / steps
+                lon = min_lon + (max_lon - min_lon) * j / steps
+                self.assertEqual(gridded.contains(lat, lon), exact.contains(lat, lon), (lat, lon))
+
+    def test_locate_many_matches_locate(self):
+        zone = DeliveryZone.objects.create(
+            name='Звезда', city='Каган', delivery_fee=Decimal('7000'),
+            polygon_coordinates=make_synthetic_polygon(200, seed=3), is_active=True
+        )
+        index = get_zone_index()
+        min_lat, min_lon, max_lat, max_lon = index.get(zone.id).bbox
+        points = []
+        for i in range(41):
+            for j in range(41):
+                lat = min_lat + (max_lat - min_lat) * i / 40
+                lon = min_lon + (max_lon - min_lon) * j / 40
+                points.append((lat, lon, 'каган' if j % 2 else None))
+        points.append((None, None, None))
+        expected = [index.locate(lat, lon, city=city) for lat, lon, city in points]
+        self.assertEqual(index.locate_many(points), expected)
+
+    def test_batch_check_endpoint(self):
+        response = APIClient().post('/api/addresses/delivery-zone-check/batch/', {
+            'points': [
+                {'id': 'a', 'latitude': 39.77, 'longitude': 64.42, 'city': 'Бухара'},
+                {'id': 'b', 'latitude': 39.79, 'longitude': 64.42},
+                {'id': 'c', 'latitude': 'x', 'longitude': 64.42},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], ['a', 'b', 'c'])
+        self.assertEqual(results[0]['zone_id'], self.zone.id)
+        self.assertEqual(results[0]['delivery_fee'], '5000.00')
+        self.assertFalse(results[1]['is_in_delivery_zone'])
+        self.assertIsNone(results[2]['zone_id'])
+
+    def test_edge_index_distance_to_boundary(self):
+        # Точка в 0.01° к северу от верхней границы квадрата (~1.1 км)
+        zone, distance = get_zone_index().edge_index('Бухара').nearest(39.79, 64.42)
+        self.assertEqual(zone.id, self.zone.id)
+        self.assertAlmostEqual(distance, 0.01 * KM_PER_DEGREE, places=6)
+
+    def test_edge_index_matches_brute_force(self):
+        zones = [
+            CompiledZone(DeliveryZone(
+                id=number, name=str(number), city='Бухара', delivery_fee=0,
+                polygon_coordinates=make_synthetic_polygon(
+                    150, radius_km=1.0, seed=number, center=(39.70 + number * 0.03, 64.40)
+                )
+            ))
+            for number in range(1, 4)
+        ]
+        edge_index = EdgeIndex(zones, 0.003)
+        for i in range(30):
+            for j in range(30):
+                lat, lon = 39.65 + i * 0.005, 64.33 + j * 0.005
+                px, py = lon * edge_index.lon_scale, lat * edge_index.lat_scale
+                expected = {}
+                for zone_id, ax, ay, bx, by in edge_index.edges:
+                    distance = point_segment_distance(px, py, ax, ay, bx, by)
+                    expected[zone_id] = min(distance, expected.get(zone_id, distance))
+                self.assertEqual(edge_index.distances(lat, lon), expected)
+                self.assertEqual(edge_index.nearest(lat, lon)[1], min(expected.values()))
+
+    def test_address_outside_zone_reports_boundary_distance(self):
+        address = Address(
+            user=self.user, street='Тестовая', house_number='3', city='Бухара',
+            latitude=Decimal('39.790000'), longitude=Decimal('64.420000')
+        )
+        is_in_zone, message = address.is_in_delivery_zone()
+        self.assertFalse(is_in_zone)
+        self.assertIn('1.1 км', message)
+        info = address.get_delivery_zones_info()
+        self.assertEqual(info[0]['radius_km'], None)
+        self.assertAlmostEqual(info[0]['distance'], 1.112, places=3)
+
+    def test_compact_polygon_on_save(self):
+        # Квадрат по часовой стрелке, каждая сторона разбита на 200 вершин, с дублями
+        dense = []
+        for (lat1, lon1), (lat2, lon2) in zip(BUKHARA_SQUARE, BUKHARA_SQUARE[1:] + BUKHARA_SQUARE[:1]):
+            for step in range(200):
+                point = [lat1 + (lat2 - lat1) * step / 200, lon1 + (lon2 - lon1) * step / 200]
+                dense.extend([point, point])
+        dense.reverse()
+        self.zone.polygon_coordinates = dense
+        self.zone.save()
+
+        compact = DeliveryZone.objects.get(pk=self.zone.pk).polygon_compact
+        self.assertEqual(len(compact), 4)
+        self.assertGreater(ring_signed_area(*parse_polygon(compact)), 0)
+        self.assertEqual(len(get_zone_index().get(self.zone.id).lats), 4)
+        self.assertTrue(self.zone.is_address_in_zone(39.77, 64.42))
+        self.assertFalse(self.zone.is_address_in_zone(39.79, 64.42))
+
+    def test_address_delivery_zone_check(self):
+        address = Address.objects.create(
+            user=self.user,
+            street='Тестовая',
+            house_number='1',
+            city='бухара',
+            latitude=Decimal('39.770000'),
+            longitude=Decimal('64.420000'),
+            phone_number='901234567'
+        )
+        is_in_zone, message = address.is_in_delivery_zone()
+        self.assertTrue(is_in_zone)
+        self.assertIn('Центр', message)
+        self.assertEqual(address.resolve_delivery_zone().id, self.zone.id)
+
+
+class ResolvedZoneTest(TestCase):
+    """
+    Тесты сохраненной зоны доставки адреса и заказа
+    """
+
+    def setUp(self):
+        self.addCleanup(invalidate_zone_index)
+        self.zone = DeliveryZone.objects.create(
+            name='Центр',
+            city='Бухара',
+            delivery_fee=Decimal('5000'),
+            polygon_coordinates=BUKHARA_SQUARE,
+            is_active=True
+        )
+        self.user = User.objects.create(telegram_id=222, first_name='Тест')
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Тестовая',
+            house_number='2',
+            city='Бухара',
+            latitude=Decimal('39.770000'),
+            longitude=Decimal('64.420000'),
+            phone_number='901234567'
+        )
+
+    def test_zone_stamped_on_save(self):
+        address = Address.objects.get(pk=self.address.pk)
+        self.assertEqual(address.delivery_zone_id, self.zone.id)
+        self.assertEqual(address.delivery_zone_version, get_zone_index().version)
+
+        order = Order.objects.create(user=self.user, address=self.address, total_price=Decimal('10000'))
+        self.assertEqual(Order.objects.get(pk=order.pk).delivery_zone_id, self.zone.id)
+
+    def test_zone_recomputed_after_zone_change(self):
+        self.zone.polygon_coordinates = [[39.70, 64.30], [39.70, 64.31], [39.71, 64.31], [39.71, 64.30]]
+        self.zone.save()
+
+        address = Address.objects.get(pk=self.address.pk)
+        self.assertIsNone(address.resolve_delivery_zone())
+        stored = Address.objects.get(pk=self.address.pk)
+        self.assertIsNone(stored.delivery_zone_id)
+        self.assertEqual(stored.delivery_zone_version, get_zone_index().version)
+
+    def test_migration_stamps_existing_rows(self):
+        import importlib
+        from django.apps import apps
+
+        migration = importlib.import_module('api.migrations.0009_address_order_delivery_zone')
+        order = Order.objects.create(user=self.user, address=self.address, total_price=Decimal('10000'), status='completed')
+        # Записи, созданные до появления колонок
+        Address.objects.update(delivery_zone=None, delivery_zone_version='')
+        Order.objects.update(delivery_zone=None, delivery_zone_version='')
+
+        migration.stamp_delivery_zones(apps, None)
+        version = get_zone_index().version
+        self.assertEqual(
+            Address.objects.values_list('delivery_zone_id', 'delivery_zone_version').get(pk=self.address.pk),
+            (self.zone.id, version)
+        )
+        self.assertEqual(
+            Order.objects.values_list('delivery_zone_id', 'delivery_zone_version').get(pk=order.pk),
+            (self.zone.id, version)
+        )
+
+
+class AddressGeocodingTest(TestCase):
+    """
+    Тесты фонового геокодирования адресов
+    """
+
+    def setUp(self):
+        self.addCleanup(invalidate_zone_index)
+        self.zone = DeliveryZone.objects.create(
+            name='Центр', city='Бухара', delivery_fee=Decimal('5000'),
+            polygon_coordinates=BUKHARA_SQUARE, is_active=True
+        )
+        self.user = User.objects.create(telegram_id=333, first_name='Тест')
+
+    def create_address(self):
+        return Address.objects.create(
+            user=self.user, street='Ляби-Хауз', house_number='5', city='Бухара', phone_number='901234567'
+        )
+
+    def test_address_saved_pending_and_geocoded_in_background(self):
+        geocoded = {'cached': False, 'result': {'lat': 39.77, 'lon': 64.42}}
+        with mock.patch('api.tasks.geocode_yandex', return_value=geocoded) as geocode, \
+                mock.patch('api.tasks.geocode_address.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            address = self.create_address()
+            self.assertEqual(address.geocode_status, Address.GEOCODE_PENDING)
+            self.assertIsNone(address.latitude)
+        delay.assert_called_once_with(address.id)
+
+        with mock.patch('api.tasks.geocode_yandex', return_value=geocoded) as geocode:
+            geocode_address.apply(args=[address.id])
+        geocode.assert_called_once_with(address=address.full_address)
+        address.refresh_from_db()
+        self.assertEqual(address.geocode_status, Address.GEOCODE_OK)
+        self.assertEqual(address.latitude, Decimal('39.770000'))
+        self.assertEqual(address.delivery_zone_id, self.zone.id)
+
+    def test_broker_outage_leaves_address_pending_for_retry(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        with mock.patch('api.tasks.geocode_yandex') as geocode, \
+                mock.patch('api.tasks.geocode_address.delay', side_effect=ConnectionError('broker down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            address = self.create_address()
+        # Запрос к Яндексу в веб-процессе не выполняется
+        geocode.assert_not_called()
+        address.refresh_from_db()
+        self.assertEqual(address.geocode_status, Address.GEOCODE_PENDING)
+
+        with mock.patch('api.tasks.geocode_address.delay') as delay:
+            self.assertEqual(geocode_pending_addresses.apply().result['queued'], 0)
+            Address.objects.filter(pk=address.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+            self.assertEqual(geocode_pending_addresses.apply().result['queued'], 1)
+        delay.assert_called_once_with(address.id)
+
+    def test_geocoding_failure_marks_address(self):
+        with mock.patch('api.tasks.geocode_address.delay'), self.captureOnCommitCallbacks(execute=True):
+            address = self.create_address()
+        with mock.patch('api.tasks.geocode_yandex', return_value={'error': 'Not found'}):
+            geocode_address.apply(args=[address.id])
+        address.refresh_from_db()
+        self.assertEqual(address.geocode_status, Address.GEOCODE_FAILED)
+
+    def test_backfill_command_geocodes_and_resumes(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+
+        addresses = [self.create_address() for _ in range(3)]
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'progress.json')
+        geocoded = {'cached': False, 'result': {'lat': 39.77, 'lon': 64.42}}
+        with mock.patch('api.management.commands.backfill_geocodes.geocode_yandex', return_value=geocoded) as geocode:
+            call_command('backfill_geocodes', '--chunk-size', '2', '--limit', '2', '--rate', '0',
+                         '--checkpoint', checkpoint, stdout=StringIO())
+            call_command('backfill_geocodes', '--resume', '--rate', '0',
+                         '--checkpoint', checkpoint, stdout=StringIO())
+
+        self.assertEqual(geocode.call_count, 3)
+        for address in addresses:
+            address.refresh_from_db()
+            self.assertEqual(address.geocode_status, Address.GEOCODE_OK)
+            self.assertEqual(address.delivery_zone_id, self.zone.id)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['last_id'], addresses[-1].id)
+
+    def test_order_creation_fails_fast_while_pending(self):
+        address = self.create_address()
+        response = APIClient().post('/api/orders/create/', {
+            'telegram_id': self.user.telegram_id,
+            'address_id': address.id,
+            'items': [{'menu_item_id': 1, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['geocode_status'], Address.GEOCODE_PENDING)
+        self.assertFalse(Order.objects.exists())
+
+
+def make_response(status_code=200, body=b'{"ok": true, "result": {"message_id": 7}}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    return response
+
+
+class HttpClientTest(TestCase):
+    """
+    Тесты общего HTTP-клиента
+    """
+
+    def setUp(self):
+        http_client.close_sessions()
+        http_client.reset_stats()
+
+    def test_session_pooled_per_host(self):
+        first = http_client.get_session('https://api.telegram.org/bot1/sendMessage')
+        second = http_client.get_session('https://api.telegram.org/bot1/answerCallbackQuery')
+        other = http_client.get_session('https://geocode-maps.yandex.ru/1.x/')
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    @override_settings(BOT_TOKEN='token', HTTP_CLIENT_CONNECT_TIMEOUT=2, HTTP_CLIENT_READ_TIMEOUT=7)
+    def test_telegram_notification_uses_client_and_records_stats(self):
+        from .tasks import send_telegram_notification
+
+        with mock.patch.object(HTTPAdapter, 'send', return_value=make_response()) as send:
+            result = send_telegram_notification.apply(args=(42, 'Привет')).get()
+
+        self.assertEqual(result, {'success': True, 'message_id': 7, 'chat_id': 42})
+        self.assertEqual(send.call_args.kwargs['timeout'], (2, 7))
+        self.assertEqual(send.call_args.args[0].url, 'https://api.telegram.org/bottoken/sendMessage')
+        stats = http_client.get_stats()['telegram.sendMessage']
+        self.assertEqual((stats['requests'], stats['errors']), (1, 0))
+
+    def test_errors_counted_per_endpoint(self):
+        with mock.patch.object(HTTPAdapter, 'send', side_effect=requests.ConnectionError('refused')):
+            with self.assertRaises(requests.RequestException):
+                http_client.yandex_geocode_request({'geocode': 'Бухара'})
+        with mock.patch.object(HTTPAdapter, 'send', return_value=make_response(503, b'')):
+            http_client.yandex_geocode_request({'geocode': 'Бухара'})
+
+        stats = http_client.get_stats()['yandex.geocode']
+        self.assertEqual((stats['requests'], stats['errors']), (2, 2))
+
+
+YANDEX_FEATURE = {
+    'Point': {'pos': '64.421 39.771'},
+    'metaDataProperty': {'GeocoderMetaData': {
+        'text': 'Узбекистан, Бухара, улица Ляби-Хауз, 5',
+        'precision': 'exact',
+        'kind': 'house',
+        'Address': {
+            'formatted': 'Узбекистан, Бухара, улица Ляби-Хауз, 5',
+            'Components': [
+                {'kind': 'country', 'name': 'Узбекистан'},
+                {'kind': 'locality', 'name': 'Бухара'},
+                {'kind': 'street', 'name': 'улица Ляби-Хауз'},
+                {'kind': 'house', 'name': '5'},
+            ],
+        },
+    }},
+    'boundedBy': {'Envelope': {'lowerCorner': '64.417 39.769', 'upperCorner': '64.425 39.773'}},
+}
+
+
+def make_yandex_response():
+    body = {'response': {'GeoObjectCollection': {'featureMember': [{'GeoObject': YANDEX_FEATURE}]}}}
+    return make_response(body=json.dumps(body).encode())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GeocodeStoreTest(TestCase):
+    """
+    Тесты трехуровневого кэша геокодирования
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        geocode_store.clear_memory()
+        geocode_store.reset_stats()
+
+    def test_address_key_normalized(self):
+        self.assertEqual(forward_key('Бухара, улица  Ляби-Хауз, дом 5'), forward_key('бухара ул. ляби хауз д.5'))
+        self.assertEqual(forward_key('Бухара, пр-т Навои, 12'), forward_key('бухара проспект навои 12'))
+        self.assertEqual(forward_key('ПР-Т. Навои 12'), 'пр навои 12')
+
+    def test_lookup_served_from_db_after_cache_loss(self):
+        from django.core.cache import cache
+        from .tasks import geocode_yandex
+
+        with mock.patch.object(HTTPAdapter, 'send', return_value=make_yandex_response()) as send:
+            first = geocode_yandex(address='Бухара, ул. Ляби-Хауз, 5')
+            self.assertFalse(first['cached'])
+            self.assertTrue(GeocodeCacheEntry.objects.filter(kind=KIND_FORWARD).exists())
+
+            # Сброс Redis и перезапуск процесса не должны вести к повторному запросу в Яндекс
+            cache.clear()
+            geocode_store.clear_memory()
+            second = geocode_yandex(address='бухара улица ляби хауз 5')
+            third = geocode_yandex(address='Бухара, ул. Ляби-Хауз, 5')
+
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual((second['tier'], third['tier']), ('db', 'memory'))
+        self.assertEqual(second['result']['lat'], 39.771)
+        stats = geocode_store.get_stats()
+        self.assertEqual(stats['db'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['memory']['hits'], 1)
+
+    @override_settings(GEOCODE_REVERSE_GRID_M=10)
+    def test_reverse_key_quantized(self):
+        self.assertEqual(reverse_key('39.7700001', '64.4200001'), reverse_key(39.77, 64.42))
+        self.assertEqual(reverse_key(39.770004, 64.420004), reverse_key(39.770001, 64.420001))
+        self.assertNotEqual(reverse_key(39.77, 64.42), reverse_key(39.7702, 64.42))
+
+    @override_settings(GEOCODE_REVERSE_GRID_M=10, GEOCODE_REVERSE_NEIGHBOUR_M=15)
+    def test_reverse_lookup_falls_back_to_nearby_point(self):
+        from django.core.cache import cache
+
+        stored = {'address': 'Узбекистан, Бухара, улица Ляби-Хауз, 5'}
+        geocode_store.set(KIND_REVERSE, reverse_key(39.77, 64.42), stored, 39.77, 64.42)
+        cache.clear()
+        geocode_store.clear_memory()
+
+        # ~11 м севернее - другая ячейка, но в радиусе поиска соседей
+        self.assertNotEqual(reverse_key(39.7701, 64.42), reverse_key(39.77, 64.42))
+        self.assertEqual(geocode_store.get_reverse(39.7701, 64.42), (stored, 'neighbour'))
+        self.assertEqual(geocode_store.get_reverse(39.7701, 64.42), (stored, 'memory'))
+        # ~110 м - вне радиуса
+        self.assertEqual(geocode_store.get_reverse(39.771, 64.42), (None, None))
+
+    def test_gazetteer_resolves_known_address_without_network(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from .gazetteer import get_gazetteer, reset_gazetteer
+        from .tasks import geocode_yandex
+
+        user = User.objects.create(telegram_id=444, first_name='Тест')
+        Address.objects.create(
+            user=user, street='ул. Ляби-Хауз', house_number='5', city='Бухара',
+            phone_number='901234567', latitude=Decimal('39.771'), longitude=Decimal('64.421')
+        )
+        path = os.path.join(tempfile.mkdtemp(), 'gazetteer.bin')
+        with override_settings(GAZETTEER_PATH=path):
+            call_command('build_gazetteer', stdout=StringIO())
+            reset_gazetteer()
+            with mock.patch.object(HTTPAdapter, 'send') as send:
+                result = geocode_yandex(address='улица Ляби-Хауз, 5, кв. 12, Бухара')
+                prefix = get_gazetteer().prefix('Бухара ул Ляби')
+            reset_gazetteer()
+
+        send.assert_not_called()
+        self.assertEqual(result['tier'], 'gazetteer')
+        self.assertEqual((result['result']['lat'], result['result']['lon']), (39.771, 64.421))
+        self.assertEqual(prefix, [('бухара ул ляби хауз 5', 39.771, 64.421)])
+
+    def test_compact_record_cached_without_raw(self):
+        from .tasks import geocode_yandex
+
+        with mock.patch.object(HTTPAdapter, 'send', return_value=make_yandex_response()):
+            result = geocode_yandex(lat=39.771, lon=64.421)['result']
+            with override_settings(GEOCODE_INCLUDE_RAW=True):
+                debug = geocode_yandex(address='Бухара, Ляби-Хауз, 5')['result']
+
+        self.assertEqual(result, {
+            'lat': 39.771, 'lon': 64.421,
+            'address': 'Узбекистан, Бухара, улица Ляби-Хауз, 5',
+            'precision': 'exact', 'kind': 'house',
+            'components': {'country': 'Узбекистан', 'locality': 'Бухара', 'street': 'улица Ляби-Хауз', 'house': '5'},
+        })
+        stored = GeocodeCacheEntry.objects.get(kind=KIND_REVERSE).result
+        self.assertNotIn('raw', stored)
+        self.assertEqual(debug['raw'], YANDEX_FEATURE)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SingleFlightTest(TestCase):
+    """
+    Тесты объединения одинаковых запросов к геокодеру
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_concurrent_calls_share_one_computation(self):
+        import threading
+        import time
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'lat': 39.77}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('geocode:test', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'lat': 39.77}] * 5)
+
+    def test_waiter_reads_result_of_other_process(self):
+        from django.core.cache import cache
+
+        # Блокировку держит другой процесс, его результат уже в кэше
+        cache.set('single_flight:geocode:other:lock', 'token', 30)
+        cache.set('single_flight:geocode:other:result', {'lat': 1.0}, 30)
+        compute = mock.Mock(return_value={'lat': 2.0})
+        self.assertEqual(single_flight('geocode:other', compute, wait_timeout=1), {'lat': 1.0})
+        compute.assert_not_called()
+
+    def test_async_requests_reuse_task(self):
+        with mock.patch('api.tasks.geocode_yandex.apply_async') as apply_async:
+            first = APIClient().get('/api/geocode/', {'query': 'Бухара, ул. Ляби-Хауз, 5', 'async': '1'})
+            second = APIClient().get('/api/geocode/', {'query': 'бухара улица ляби хауз 5', 'async': '1'})
+
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(first.json()['task_id'], second.json()['task_id'])
+
+
+class GeocodeResultViewTest(TestCase):
+    """
+    Тесты ожидания результата задачи геокодирования
+    """
+
+    def test_result_view_waits_for_task(self):
+        class FakeResult:
+            """Задача, которая завершается на третьей проверке"""
+            id = 'task-1'
+            checks = 0
+
+            def ready(self):
+                self.checks += 1
+                return self.checks >= 3
+
+            @property
+            def state(self):
+                return 'SUCCESS' if self.checks >= 3 else 'PENDING'
+
+            result = {'cached': False, 'result': {'lat': 39.77, 'lon': 64.42}}
+
+        with mock.patch('api.views.AsyncResult', return_value=FakeResult()):
+            pending = APIClient().get('/api/geocode-result/task-1/')
+        with mock.patch('api.views.AsyncResult', return_value=FakeResult()):
+            done = APIClient().get('/api/geocode-result/task-1/', {'wait': '2'})
+
+        self.assertEqual(pending.json(), {'status': 'pending'})
+        self.assertEqual(done.json()['status'], 'success')
+        self.assertEqual(done.json()['result']['result']['lat'], 39.77)
+
+
+@override_settings(ADDRESS_AUTOCOMPLETE_REFRESH_INTERVAL=0)
+class AddressAutocompleteTest(TestCase):
+    """
+    Тесты автодополнения адресов
+    """
+
+    def setUp(self):
+        from .address_autocomplete import reset_address_trie
+
+        reset_address_trie()
+        self.addCleanup(reset_address_trie)
+        self.user = User.objects.create(telegram_id=555, first_name='Тест')
+
+    def create_address(self, street, house_number, apartment=None, telegram_id=None):
+        user = self.user if telegram_id is None else User.objects.create(telegram_id=telegram_id, first_name='Тест')
+        return Address.objects.create(
+            user=user, street=street, house_number=house_number, apartment=apartment, city='Бухара',
+            phone_number='901234567', latitude=Decimal('39.771'), longitude=Decimal('64.421')
+        )
+
+    def suggest(self, query):
+        return APIClient().get('/api/addresses/autocomplete/', {'q': query}).json()['suggestions']
+
+    def test_suggestions_by_prefix_and_transliteration(self):
+        self.create_address('ул. Ляби-Хауз', '5')
+        self.create_address('ул. Ляби-Хауз', '7', apartment='1')
+        self.create_address('ул. Ляби-Хауз', '7', apartment='2')
+        self.create_address('Чорсу', '1')
+
+        # Дом 7 выше: по нему больше адресов
+        self.assertEqual(
+            [s['address'] for s in self.suggest('Ляби')],
+            ['ул. Ляби-Хауз, 7, Бухара', 'ул. Ляби-Хауз, 5, Бухара']
+        )
+        self.assertEqual(self.suggest('lyabi khauz 5')[0]['address'], 'ул. Ляби-Хауз, 5, Бухара')
+        self.assertEqual(self.suggest('Бухара chor')[0], {'address': 'Чорсу, 1, Бухара', 'lat': 39.771, 'lon': 64.421})
+        self.assertEqual(self.suggest('Самарканд'), [])
+
+    def test_new_addresses_added_incrementally(self):
+        from .address_autocomplete import get_address_trie
+
+        self.create_address('Чорсу', '1')
+        trie = get_address_trie()
+        self.assertEqual(self.suggest('Навои'), [])
+
+        self.create_address('пр. Навои', '12', telegram_id=556)
+        self.assertEqual(self.suggest('navoi')[0]['address'], 'пр. Навои, 12, Бухара')
+        self.assertIs(get_address_trie(), trie)
+
+    def test_edited_address_replaces_its_suggestion(self):
+        address = self.create_address('Чорсу', '1')
+        self.create_address('Чорсу', '2', telegram_id=556)
+        self.assertEqual(len(self.suggest('Чорсу')), 2)
+
+        address.street = 'пр. Навои'
+        address.save()
+        self.assertEqual([s['address'] for s in self.suggest('Чорсу')], ['Чорсу, 2, Бухара'])
+        self.assertEqual(self.suggest('Навои')[0]['address'], 'пр. Навои, 1, Бухара')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTest(TestCase):
+    """
+    Тесты версионированного кэша каталога
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.category = Category.objects.create(name='Бургеры')
+        self.item = MenuItem.objects.create(
+            name='Чизбургер', price=Decimal('25000'), category=self.category, is_hit=True
+        )
+
+    def menu_item(self, url='/api/menu/', key='all_items'):
+        return APIClient().get(url).json()[key][0]
+
+    def test_menu_cache_invalidated_on_change(self):
+        from .catalog_cache import get_catalog_generation
+
+        self.assertEqual(self.menu_item()['name'], 'Чизбургер')
+        generation = get_catalog_generation()
+        MenuItem.objects.filter(pk=self.item.pk).update(name='Без сигнала')
+        self.assertEqual(self.menu_item()['name'], 'Чизбургер')
+
+        self.item.name = 'Двойной чизбургер'
+        self.item.save()
+        self.assertGreater(get_catalog_generation(), generation)
+        self.assertEqual(self.menu_item()['name'], 'Двойной чизбургер')
+
+    def test_m2m_and_related_models_invalidate(self):
+        self.assertEqual(self.menu_item('/api/menu/hits/', 'hits')['size_options'], [])
+
+        size = SizeOption.objects.create(name='XL', price_modifier=Decimal('5000'))
+        self.item.size_options.add(size)
+        self.assertEqual(self.menu_item('/api/menu/hits/', 'hits')['size_options'][0]['name'], 'XL')
+
+        size.name = 'XXL'
+        size.save()
+        self.assertEqual(self.menu_item('/api/menu/hits/', 'hits')['size_options'][0]['name'], 'XXL')
+
+    def test_menu_query_count_does_not_grow(self):
+        from django.core.cache import cache
+
+        def build_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = APIClient().get('/api/menu/')
+            return response, len(ctx.captured_queries)
+
+        size = SizeOption.objects.create(name='XL', price_modifier=Decimal('5000'))
+        inactive = SizeOption.objects.create(name='XXL', price_modifier=Decimal('9000'), is_active=False)
+        sauce = AddOn.objects.create(name='Сырный соус', price=Decimal('3000'))
+        sauce.available_for_categories.add(self.category)
+        self.item.size_options.add(size)
+        self.item.add_on_options.add(sauce)
+        _, baseline = build_queries()
+
+        drinks = Category.objects.create(name='Напитки')
+        for i in range(5):
+            item = MenuItem.objects.create(name=f'Товар {i}', price=Decimal('10000'), category=drinks)
+            item.size_options.add(size, inactive)
+            item.add_on_options.add(sauce)
+
+        response, queries = build_queries()
+        self.assertEqual(queries, baseline)
+        data = response.json()
+        self.assertEqual(data['total_items'], 6)
+        self.assertEqual({c['name']: c['item_count'] for c in data['categories']}, {'Бургеры': 1, 'Напитки': 5})
+        items = {item['id']: item for item in data['all_items']}
+        category = next(c for c in data['categories'] if c['name'] == 'Напитки')
+        first = items[category['item_ids'][0]]
+        self.assertEqual([s['name'] for s in first['size_options']], ['XL'])
+        self.assertEqual(first['add_on_options'][0]['available_for_categories'], [self.category.id])
+
+    def test_catalog_served_as_prerendered_bytes_with_etag(self):
+        import gzip
+
+        MenuItem.objects.filter(pk=self.item.pk).update(description='Сочная котлета ' * 100)
+        client = APIClient()
+        response = client.get('/api/menu/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        compressed = client.get('/api/menu/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        self.assertLess(len(compressed.content), len(response.content))
+
+        not_modified = client.get('/api/menu/', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        self.item.name = 'Двойной чизбургер'
+        self.item.save()
+        changed = client.get('/api/menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['all_items'][0]['name'], 'Двойной чизбургер')
+
+        for url in ('/api/categories/', '/api/menu/hits/', '/api/menu/new/', '/api/menu/featured/'):
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200, url)
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304, url)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MenuSyncTest(TestCase):
+    """
+    Тесты дельта-синхронизации меню по версии каталога
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.category = Category.objects.create(name='Бургеры')
+        self.item = MenuItem.objects.create(name='Чизбургер', price=Decimal('25000'), category=self.category)
+
+    def test_menu_sync_returns_changes_since_version(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import CatalogChange
+
+        client = APIClient()
+        snapshot = client.get('/api/menu/sync/').json()
+        self.assertTrue(snapshot['full'])
+        self.assertEqual(snapshot['version'], client.get('/api/menu/').json()['version'])
+        version = snapshot['version']
+
+        unchanged = client.get('/api/menu/sync/', {'since': version}).json()
+        self.assertEqual((unchanged['full'], unchanged['items'], unchanged['deleted_items']), (False, [], []))
+
+        self.item.price = Decimal('27000')
+        self.item.save()
+        removed = MenuItem.objects.create(name='Сезонный', price=Decimal('1000'), category=self.category)
+        removed_id = removed.id
+        removed.delete()
+        size = SizeOption.objects.create(name='XL', price_modifier=Decimal('5000'))
+        other = MenuItem.objects.create(name='Гамбургер', price=Decimal('20000'), category=self.category)
+        other.size_options.add(size)
+        changes_before = CatalogChange.objects.count()
+        size.name = 'XXL'
+        size.save()
+        self.assertEqual(CatalogChange.objects.count(), changes_before + 1)
+
+        delta = client.get('/api/menu/sync/', {'since': version}).json()
+        self.assertFalse(delta['full'])
+        self.assertGreater(delta['version'], version)
+        items = {item['id']: item for item in delta['items']}
+        self.assertEqual(set(items), {self.item.id, other.id})
+        self.assertEqual(items[self.item.id]['price'], '27000.00')
+        self.assertEqual(items[other.id]['size_options'][0]['name'], 'XXL')
+        self.assertEqual(delta['deleted_items'], [removed_id])
+        self.assertEqual(delta['categories'][0]['item_count'], 2)
+
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=60))
+        call_command('compact_catalog_changes', days=30, stdout=StringIO())
+        self.assertEqual(CatalogChange.objects.count(), 1)
+        self.assertTrue(client.get('/api/menu/sync/', {'since': version}).json()['full'])
+        self.assertEqual(client.get('/api/menu/sync/', {'since': 'abc'}).status_code, 400)
+
+    def test_stale_versions_share_one_snapshot(self):
+        from django.core.cache import cache
+        from . import views
+        from .catalog_cache import catalog_cache_key
+
+        client = APIClient()
+        version = client.get('/api/menu/sync/').json()['version']
+        # Неизвестные версии не строят меню заново и не заводят свои ключи кэша
+        with mock.patch.object(views, 'build_menu_data', wraps=views.build_menu_data) as build:
+            for since in (-5, version + 1, version + 1000, None):
+                params = {} if since is None else {'since': since}
+                self.assertTrue(client.get('/api/menu/sync/', params).json()['full'])
+            self.assertEqual(build.call_count, 0)
+        self.assertIsNotNone(cache.get(catalog_cache_key('sync:full', 'payload')))
+        for since in (-5, version + 1):
+            self.assertIsNone(cache.get(catalog_cache_key(f'sync:{since}', 'payload')))
+
+
+
+class FastSerializerTest(TestCase):
+    """
+    Тесты быстрой read-only сериализации товаров
+    """
+
+    def setUp(self):
+        burgers = Category.objects.create(name='Бургеры')
+        drinks = Category.objects.create(name='Напитки')
+        small = SizeOption.objects.create(name='S', price_modifier=Decimal('0'))
+        large = SizeOption.objects.create(name='L', price_modifier=Decimal('7500.5'), description='Большой')
+        hidden = SizeOption.objects.create(name='XL', price_modifier=Decimal('9000'), is_active=False)
+        sauce = AddOn.objects.create(name='Соус', price=Decimal('3000'), category=burgers)
+        sauce.available_for_categories.add(drinks, burgers)
+        ice = AddOn.objects.create(name='Лед', price=Decimal('0'))
+        self.burger = MenuItem.objects.create(
+            name='Чизбургер', price=Decimal('25000'), category=burgers, is_hit=True,
+            image='menu_items/cheese.jpg', description='С сыром',
+        )
+        self.burger.size_options.add(large, small, hidden)
+        self.burger.add_on_options.add(sauce, ice)
+        cola = MenuItem.objects.create(name='Кола', price=Decimal('8000.10'), category=drinks, is_new=True, priority=1)
+        cola.add_on_options.add(ice)
+        self.user = User.objects.create(telegram_id=42, first_name='Test')
+
+    def assertSameJSON(self, fast, drf):
+        from rest_framework.renderers import JSONRenderer
+
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(drf))
+
+    def test_menu_items_byte_identical(self):
+        from .fast_serializers import serialize_menu_items
+        from .serializers import MenuItemSerializer
+
+        items = MenuItem.objects.order_by('priority', '-created_at')
+        self.assertSameJSON(serialize_menu_items(items), MenuItemSerializer(items, many=True).data)
+        self.assertEqual(serialize_menu_items(MenuItem.objects.none()), [])
+
+        fast = serialize_menu_items(items, active_options=True)
+        burger = next(item for item in fast if item['id'] == self.burger.id)
+        self.assertEqual([size['name'] for size in burger['size_options']], ['S', 'L'])
+
+    def test_favorites_byte_identical(self):
+        from .fast_serializers import serialize_favorites
+        from .models import Favorite
+        from .serializers import FavoriteSerializer
+
+        for item in MenuItem.objects.all():
+            Favorite.objects.create(user=self.user, menu_item=item)
+        favorites = Favorite.objects.filter(user=self.user).order_by('-created_at')
+        self.assertSameJSON(serialize_favorites(favorites), FavoriteSerializer(favorites, many=True).data)
+
+
+@override_settings(MENU_SEARCH_BACKEND='memory', MENU_SEARCH_CHECK_INTERVAL=0)
+class MenuSearchTest(TestCase):
+    """
+    Тесты поиска по меню через индекс в памяти
+    """
+
+    def setUp(self):
+        from .menu_search import reset_menu_search_index
+
+        reset_menu_search_index()
+        burgers = Category.objects.create(name='Бургеры')
+        hot = Category.objects.create(name='Горячее')
+        self.cheese = MenuItem.objects.create(name='Чизбургер', price=Decimal('25000'), category=burgers)
+        self.burger = MenuItem.objects.create(
+            name='Бургер классический', price=Decimal('22000'), category=burgers, priority=1
+        )
+        self.hot_dog = MenuItem.objects.create(
+            name='Хот-дог', description='С горчицей', price=Decimal('15000'), category=hot
+        )
+        self.plov = MenuItem.objects.create(
+            name='Ош', description='Бухарский плов с говядиной', price=Decimal('30000'), category=hot
+        )
+
+    def search(self, query, **params):
+        response = APIClient().get('/api/menu/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['items']]
+
+    def test_transliteration_and_prefix(self):
+        self.assertEqual(self.search('burger'), [self.burger.id, self.cheese.id])
+        self.assertEqual(self.search('hot dog'), [self.hot_dog.id])
+        self.assertEqual(self.search('ОШ'), [self.plov.id])
+        self.assertEqual(self.search('бух плов'), [self.plov.id])
+        self.assertEqual(self.search('горч'), [self.hot_dog.id])
+        self.assertEqual(self.search('бургер пицца'), [])
+
+    def test_ranking_and_filters(self):
+        # Название весит больше категории: "Горячее" - категория хот-дога и плова
+        MenuItem.objects.create(name='Горячий чай', price=Decimal('5000'), category=Category.objects.get(name='Бургеры'))
+        results = self.search('горяч')
+        self.assertEqual(results[0], MenuItem.objects.get(name='Горячий чай').id)
+        self.assertEqual(set(results[1:]), {self.hot_dog.id, self.plov.id})
+        self.assertEqual(self.search('горяч', max_price='20000'), [results[0], self.hot_dog.id])
+
+    def test_index_follows_catalog_version(self):
+        self.assertEqual(self.search('shaurma'), [])
+        item = MenuItem.objects.create(name='Шаурма', price=Decimal('20000'), category=self.burger.category)
+        self.assertEqual(self.search('shaurma'), [item.id])
+        item.is_active = False
+        item.save()
+        self.assertEqual(self.search('шаурма'), [])
+
+    @override_settings(MENU_SEARCH_BACKEND='icontains')
+    def test_icontains_backend(self):
+        self.assertEqual(self.search('плов'), [self.plov.id])
+        self.assertEqual(self.search('burger'), [])
+
+    @override_settings(MENU_SEARCH_BACKEND='fts5')
+    def test_fts5_backend(self):
+        from django.db import connection
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 доступен только в SQLite')
+        self.assertEqual(self.search('бургер'), [self.burger.id])
+        self.assertEqual(self.search('говяд бух'), [self.plov.id])
+        # Название весит больше описания; триггеры подхватывают новые и измененные товары
+        mustard = MenuItem.objects.create(name='Горчица', price=Decimal('2000'), category=self.burger.category)
+        self.assertEqual(self.search('горчиц'), [mustard.id, self.hot_dog.id])
+        # ?search= в API товаров сохраняет порядок BM25, ?ordering= его переопределяет
+        response = APIClient().get('/api/menu-items/', {'search': 'горчиц'})
+        self.assertEqual([item['id'] for item in response.json()], [mustard.id, self.hot_dog.id])
+        response = APIClient().get('/api/menu-items/', {'search': 'горчиц', 'ordering': '-price'})
+        self.assertEqual([item['id'] for item in response.json()], [self.hot_dog.id, mustard.id])
+        MenuItem.objects.filter(pk=self.hot_dog.pk).update(description='С кетчупом')
+        self.assertEqual(self.search('горчиц'), [mustard.id])
+        mustard.delete()
+        self.assertEqual(self.search('горчиц'), [])
+
+        honey = MenuItem.objects.create(name='Чай с мёдом', price=Decimal('6000'), category=self.hot_dog.category)
+        self.assertEqual(self.search('медом'), [honey.id])
+        response = APIClient().get('/api/menu-items/', {'search': 'ош'})
+        self.assertEqual([item['id'] for item in response.json()], [self.plov.id])
@@ -0,0 +1,71 @@
+"""
+Нормализация строк для ключей кэшей и поиска.
+
+transliterate() приводит строку к латинской "свертке": кириллица
+транслитерируется, а латинские варианты узбекской и русской транслитерации
+(kh/x, zh/j, q/k, o') сводятся к одному написанию.
+"""
+import re
+import unicodedata
+
+_PUNCTUATION_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+# Полные формы частых слов адреса сводятся к сокращениям, чтобы
+# "улица Ленина, дом 5" и "ул. Ленина д.5" давали один ключ
+ADDRESS_ABBREVIATIONS = {
+    'улица': 'ул',
+    'проспект': 'пр',
+    'пр-т': 'пр',
+    'переулок': 'пер',
+    'площадь': 'пл',
+    'махалля': 'мх',
+    'дом': 'д',
+    'квартира': 'кв',
+    'город': 'г',
+}
+# Сокращения с дефисом раскрываются до нормализации: normalize_text делает из дефиса пробел
+_HYPHENATED_ABBREVIATIONS_RE = re.compile(
+    r'\b(?:%s)\b' % '|'.join(re.escape(word) for word in ADDRESS_ABBREVIATIONS if '-' in word),
+    re.IGNORECASE,
+)
+
+
+def normalize_text(value):
+    """Нижний регистр, ё -> е, пунктуация -> пробел, схлопнутые пробелы"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', str(value)).casefold().replace('ё', 'е')
+    return ' '.join(_PUNCTUATION_RE.sub(' ', value).split())
+
+
+def normalize_address(value):
+    """Каноническая форма адреса для ключа кэша геокодирования"""
+    value = _HYPHENATED_ABBREVIATIONS_RE.sub(
+        lambda m: ADDRESS_ABBREVIATIONS[m.group(0).casefold()], str(value or '')
+    )
+    words = normalize_text(value).split()
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # Узбекская кириллица
+    'ў': 'o', 'қ': 'k', 'ғ': 'g', 'ҳ': 'x',
+}
+
+# Латинские варианты одного звука сводятся к написанию из CYRILLIC_TO_LATIN
+_LATIN_FOLD_MAP = {'shch': 'sh', 'kh': 'x', 'zh': 'j', 'q': 'k', 'w': 'v', 'c': 'ts'}
+# c перед h не трогаем: "ch" уже совпадает со сверткой "ч"
+_LATIN_FOLD_RE = re.compile('shch|kh|zh|q|w|c(?!h)')
+# Апостроф узбекской латиницы (o', g') - часть буквы, а не разделитель слов
+_APOSTROPHES_RE = re.compile("[ʻʼ'’`]")
+
+
+def transliterate(text):
+    """Нормализованная строка в латинской свертке"""
+    text = normalize_text(_APOSTROPHES_RE.sub('', text or ''))
+    text = ''.join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    return _LATIN_FOLD_RE.sub(lambda m: _LATIN_FOLD_MAP[m.group(0)], text)
@@ -1,8 +1,9 @@
 from django.urls import path
 from .views import (
-    AuthView, MenuView, OrderView, UserAddressView, CategoryView, WebhookView,
+    AuthView, MenuView, MenuSyncView, OrderView, UserAddressView, CategoryView, WebhookView,
     AddressView, AddressDetailView, OrderCreateView, GeocodeView, GeocodeResultView,
-    DeliveryZoneView, AddressDeliveryZoneCheckView, AddressDeliveryZoneDetailView,
+    DeliveryZoneView, AddressDeliveryZoneCheckView, AddressDeliveryZoneBatchCheckView,
+    AddressDeliveryZoneDetailView, AddressAutocompleteView,
     MenuItemViewSet, AddOnViewSet, SizeOptionViewSet, PromotionViewSet, OrderViewSet,
     TelegramLoginWidgetView, TestUserCreationView, HitsView, NewItemsView, PromotionsView,
     MenuItemDetailView, CategoryItemsView, SearchView, FeaturedView, PriceRangeView,
@@ -34,6 +35,7 @@ urlpatterns = [
     path('categories/', CategoryView.as_view(), name='categories'),
     path('categories/<int:category_id>/items/', CategoryItemsView.as_view(), name='category-items'),
     path('menu/', MenuView.as_view(), name='menu'),
+    path('menu/sync/', MenuSyncView.as_view(), name='menu-sync'),
     path('menu/items/<int:item_id>/', MenuItemDetailView.as_view(), name='menu-item-detail'),
     # Хиты, новинки, акции
     path('menu/hits/', HitsView.as_view(), name='hits'),
@@ -54,9 +56,11 @@ urlpatterns = [
     path('orders/create/', OrderCreateView.as_view(), name='order-create'),
     path('geocode/', GeocodeView.as_view(), name='geocode'),
     path('geocode-result/<str:task_id>/', GeocodeResultView.as_view(), name='geocode-result'),
+    path('addresses/autocomplete/', AddressAutocompleteView.as_view(), name='address-autocomplete'),
     # Зоны доставки
     path('delivery-zones/', DeliveryZoneView.as_view(), name='delivery-zones'),
     path('addresses/delivery-zone-check/', AddressDeliveryZoneCheckView.as_view(), name='address-delivery-zone-check'),
+    path('addresses/delivery-zone-check/batch/', AddressDeliveryZoneBatchCheckView.as_view(), name='address-delivery-zone-check-batch'),
     path('addresses/<int:address_id>/delivery-zone/', AddressDeliveryZoneDetailView.as_view(), name='address-delivery-zone-detail'),
 ]
 
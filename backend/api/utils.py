@@ -1,5 +1,6 @@
 from django.core.cache import cache
 import logging
+import time
 
 logger = logging.getLogger('api')
 
@@ -18,24 +19,20 @@ def is_redis_available():
         return False
 
 def clear_menu_cache():
-    """Очищает кэш меню"""
+    """Очищает кэш меню (вместе со всем кэшем каталога - ключи общего поколения)"""
+    from .catalog_cache import bump_catalog_generation
     try:
-        if is_redis_available():
-            cache.delete('menu_items')
-            logger.info("Menu cache cleared successfully")
-        else:
-            logger.warning("Redis not available, skipping menu cache clear")
+        bump_catalog_generation()
+        logger.info("Menu cache cleared successfully")
     except Exception as e:
         logger.error(f"Error clearing menu cache: {str(e)}")
 
 def clear_categories_cache():
-    """Очищает кэш категорий"""
+    """Очищает кэш категорий (вместе со всем кэшем каталога - ключи общего поколения)"""
+    from .catalog_cache import bump_catalog_generation
     try:
-        if is_redis_available():
-            cache.delete('categories')
-            logger.info("Categories cache cleared successfully")
-        else:
-            logger.warning("Redis not available, skipping categories cache clear")
+        bump_catalog_generation()
+        logger.info("Categories cache cleared successfully")
     except Exception as e:
         logger.error(f"Error clearing categories cache: {str(e)}")
 
@@ -60,13 +57,15 @@ def get_cache_info():
                 'categories_cached': False,
             }
         
-        menu_cached = cache.get('menu_items') is not None
-        categories_cached = cache.get('categories') is not None
+        from .catalog_cache import catalog_cache_key, get_catalog_generation
+        menu_cached = cache.get(catalog_cache_key('menu', 'payload')) is not None
+        categories_cached = cache.get(catalog_cache_key('categories', 'payload')) is not None
         
         return {
             'redis_available': True,
             'menu_cached': menu_cached,
             'categories_cached': categories_cached,
+            'catalog_generation': get_catalog_generation(),
         }
     except Exception as e:
         logger.error(f"Error getting cache info: {str(e)}")
@@ -74,4 +73,68 @@ def get_cache_info():
             'redis_available': False,
             'menu_cached': False,
             'categories_cached': False,
-        } 
\ No newline at end of file
+        }
+
+TASK_DONE_CHANNEL = 'task_done:{task_id}'
+
+def notify_task_done(task_id):
+    """Публикует в Redis уведомление о завершении задачи для ожидающих wait_for_task"""
+    try:
+        from django_redis import get_redis_connection
+        get_redis_connection("default").publish(TASK_DONE_CHANNEL.format(task_id=task_id), 1)
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"Error publishing task completion for {task_id}: {str(e)}")
+
+def _wait_pubsub(result, timeout):
+    """Ожидание через Redis pub/sub; None, если Redis недоступен"""
+    try:
+        from django_redis import get_redis_connection
+        pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(TASK_DONE_CHANNEL.format(task_id=result.id))
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning(f"Redis pub/sub unavailable, falling back to polling: {str(e)}")
+        return None
+
+    try:
+        deadline = time.monotonic() + timeout
+        # Задача могла завершиться до подписки
+        while not result.ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            pubsub.get_message(timeout=min(remaining, 1.0))
+        return result.ready()
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+def wait_for_task(result, timeout):
+    """
+    Ждет завершения задачи Celery не дольше timeout секунд.
+    Использует уведомление notify_task_done через Redis pub/sub,
+    без Redis - опрос бэкенда результатов с нарастающим интервалом.
+
+    Returns:
+        bool: завершилась ли задача
+    """
+    if result.ready() or timeout <= 0:
+        return result.ready()
+
+    ready = _wait_pubsub(result, timeout)
+    if ready is not None:
+        return ready
+
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() < deadline:
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        if result.ready():
+            return True
+        delay = min(delay * 2, 0.5)
+    return result.ready()
@@ -7,9 +7,7 @@ import time
 from urllib.parse import parse_qs, urlencode
 from decimal import Decimal
 
-import requests
 from django.conf import settings
-from django.core.cache import cache
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -24,8 +22,17 @@ from .serializers import (
     AddressCreateSerializer, DeliveryZoneSerializer, AddressDeliveryZoneSerializer, AddOnSerializer, SizeOptionSerializer, PromotionSerializer,
     FavoriteSerializer, FavoriteCreateSerializer
 )
+from . import http_client
 from .bot import send_notification
-from .tasks import send_order_status_notification, geocode_yandex
+from .utils import wait_for_task
+from .catalog_cache import catalog_response
+from .catalog_changes import changes_since, delta_available, get_catalog_version
+from .fast_serializers import serialize_favorites, serialize_menu_items
+from .menu_search import MenuSearchFilter, search_menu_items
+from .address_autocomplete import get_address_trie
+from .zone_index import get_zone_index
+from .geocode_store import KIND_FORWARD, KIND_REVERSE, forward_key, geocode_store, reverse_key
+from .tasks import send_order_status_notification, geocode_yandex, enqueue_geocode_yandex
 from celery.result import AsyncResult
 from django.db import models
 
@@ -401,9 +408,9 @@ class WebhookView(APIView):
             )
             
             # Отправляем сообщение с кнопкой
-            response = requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage",
-                json={
+            response = http_client.telegram_request(
+                'sendMessage',
+                {
                     "chat_id": chat_id,
                     "text": welcome_text,
                     "reply_markup": keyboard,
@@ -444,9 +451,9 @@ class WebhookView(APIView):
                 "inline_keyboard": [[web_app_button]]
             }
             
-            response = requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage",
-                json={
+            response = http_client.telegram_request(
+                'sendMessage',
+                {
                     "chat_id": chat_id,
                     "text": menu_text,
                     "reply_markup": keyboard,
@@ -477,9 +484,9 @@ class WebhookView(APIView):
                 "Быстро, вкусно, удобно!"
             )
             
-            response = requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage",
-                json={
+            response = http_client.telegram_request(
+                'sendMessage',
+                {
                     "chat_id": chat_id,
                     "text": help_text,
                     "parse_mode": "HTML"
@@ -504,9 +511,9 @@ class WebhookView(APIView):
                 "Используйте команду /start чтобы открыть приложение Babay Burger."
             )
             
-            response = requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage",
-                json={
+            response = http_client.telegram_request(
+                'sendMessage',
+                {
                     "chat_id": chat_id,
                     "text": response_text
                 }
@@ -529,9 +536,9 @@ class WebhookView(APIView):
             data = callback_query.get('data')
             
             # Отвечаем на callback query
-            response = requests.post(
-                f"https://api.telegram.org/bot{settings.BOT_TOKEN}/answerCallbackQuery",
-                json={
+            response = http_client.telegram_request(
+                'answerCallbackQuery',
+                {
                     "callback_query_id": callback_id
                 }
             )
@@ -616,102 +623,122 @@ class AuthView(APIView):
             logger.error(f"Auth error: {str(e)}")
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def menu_items_queryset():
+    """Активные товары меню в порядке показа"""
+    return MenuItem.objects.filter(is_active=True).order_by('priority', '-created_at')
+
+def build_menu_categories(item_rows):
+    """Категории меню со ссылками на товары по id; item_rows - пары (id товара, id категории) в порядке меню"""
+    item_ids_by_category = {}
+    for item_id, category_id in item_rows:
+        item_ids_by_category.setdefault(category_id, []).append(item_id)
+    
+    categories_data = []
+    for category in Category.objects.all():
+        item_ids = item_ids_by_category.get(category.id, [])
+        categories_data.append({
+            'id': category.id,
+            'name': category.name,
+            'description': category.description,
+            'image': category.image.url if category.image else None,
+            'item_ids': item_ids,
+            'item_count': len(item_ids)
+        })
+    return categories_data
+
+def build_menu_data(version=None):
+    """Полное меню; version читается до выборки товаров, чтобы не пропустить изменения при синхронизации"""
+    if version is None:
+        version = get_catalog_version()
+    # Число запросов не зависит от размера меню; каждый товар сериализуется
+    # один раз, категории ссылаются на него по id
+    all_items = serialize_menu_items(menu_items_queryset(), active_options=True)
+    categories_data = build_menu_categories((item['id'], item['category']) for item in all_items)
+    logger.info(f"Menu data built from database, {len(categories_data)} categories, {len(all_items)} items")
+    return {
+        'version': version,
+        'categories': categories_data,
+        'all_items': all_items,
+        'total_items': len(all_items),
+        'total_categories': len(categories_data)
+    }
+
 class MenuView(APIView):
     def get(self, request):
         try:
-            # Попробуем получить из кэша
-            cache_key = 'menu_data'
-            cached_data = None
-            
-            try:
-                cached_data = cache.get(cache_key)
-            except Exception as cache_error:
-                logger.warning(f"Cache error: {str(cache_error)}")
-            
-            if cached_data is not None:
-                logger.info("Menu data served from cache")
-                return Response(cached_data)
-            
-            # Если нет в кэше, получаем из БД
-            logger.info("Menu data not found in cache, fetching from database")
-            
-            # Получаем категории с количеством товаров
-            categories = Category.objects.all()
-            categories_data = []
-            
-            for category in categories:
-                items = MenuItem.objects.filter(category=category, is_active=True).order_by('priority', '-created_at')
-                items_serializer = MenuItemSerializer(items, many=True)
-                
-                categories_data.append({
-                    'id': category.id,
-                    'name': category.name,
-                    'description': category.description,
-                    'image': category.image.url if category.image else None,
-                    'items': items_serializer.data,
-                    'item_count': len(items)
-                })
-            
-            # Получаем все активные товары
-            all_items = MenuItem.objects.filter(is_active=True).select_related('category').order_by('priority', '-created_at')
-            all_items_serializer = MenuItemSerializer(all_items, many=True)
-            
-            # Формируем структурированный ответ
-            data = {
-                'categories': categories_data,
-                'all_items': all_items_serializer.data,
-                'total_items': len(all_items),
-                'total_categories': len(categories)
-            }
-            
-            # Сохраняем в кэш на 5 минут
-            try:
-                cache.set(cache_key, data, 300)
-                logger.info(f"Menu data cached successfully, {len(categories)} categories, {len(all_items)} items")
-            except Exception as cache_error:
-                logger.warning(f"Failed to cache menu data: {str(cache_error)}")
-            
-            return Response(data)
+            # Готовые байты JSON из кэша текущего поколения каталога на 5 минут
+            return catalog_response(request, 'menu', build_menu_data, 300)
         except Exception as e:
             logger.error(f"Menu view error: {str(e)}", exc_info=True)
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class MenuSyncView(APIView):
+    """
+    Дельта-синхронизация меню: товары, измененные после версии ?since=.
+    Без since, для неизвестной или сжатой части журнала - полный снимок (full=true)
+    """
+    
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({'error': 'since must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def build_snapshot():
+            data = build_menu_data()
+            data['full'] = True
+            return data
+        
+        try:
+            version = get_catalog_version()
+            if not delta_available(since, version):
+                # Без since, неизвестная, сжатая или слишком старая версия - один общий снимок
+                return catalog_response(request, 'sync:full', build_snapshot, 300)
+            
+            def build_delta():
+                item_ids, categories_changed = changes_since(since, version)
+                items = serialize_menu_items(menu_items_queryset().filter(id__in=item_ids), active_options=True)
+                # Удаленные и снятые с продажи товары клиент убирает из меню
+                deleted_ids = sorted(item_ids - {item['id'] for item in items})
+                data = {
+                    'version': version,
+                    'full': False,
+                    'since': since,
+                    'items': items,
+                    'deleted_items': deleted_ids,
+                }
+                if item_ids or categories_changed:
+                    # Состав и счетчики категорий могли измениться - отдаем их целиком, они маленькие
+                    rows = menu_items_queryset().values_list('id', 'category_id')
+                    data['categories'] = build_menu_categories(rows)
+                logger.info(f"Menu sync since {since}: version={version}, {len(items)} changed, {len(deleted_ids)} deleted")
+                return data
+            
+            # Ключи дельт ограничены: since лежит в пределах CATALOG_SYNC_MAX_CHANGES от версии
+            return catalog_response(request, f'sync:{version}:{since}', build_delta, 300)
+        except Exception as e:
+            logger.error(f"Menu sync error: {str(e)}", exc_info=True)
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class CategoryView(APIView):
     def get(self, request):
         try:
-            # Попробуем получить из кэша
-            cache_key = 'categories'
-            cached_data = None
-            
-            try:
-                cached_data = cache.get(cache_key)
-            except Exception as cache_error:
-                logger.warning(f"Cache error: {str(cache_error)}")
-            
-            if cached_data is not None:
-                logger.info("Categories data served from cache")
-                return Response(cached_data)
-            
-            # Если нет в кэше, получаем из БД
-            logger.info("Categories data not found in cache, fetching from database")
-            categories = Category.objects.all()
-            
-            # Добавляем количество товаров в каждую категорию
-            categories_data = []
-            for category in categories:
-                item_count = MenuItem.objects.filter(category=category, is_active=True).count()
-                category_data = CategorySerializer(category).data
-                category_data['item_count'] = item_count
-                categories_data.append(category_data)
-            
-            # Сохраняем в кэш на 10 минут
-            try:
-                cache.set(cache_key, categories_data, 600)
-                logger.info(f"Categories data cached successfully, {len(categories_data)} categories")
-            except Exception as cache_error:
-                logger.warning(f"Failed to cache categories data: {str(cache_error)}")
-            
-            return Response(categories_data)
+            def build():
+                categories = Category.objects.all()
+                
+                # Добавляем количество товаров в каждую категорию
+                categories_data = []
+                for category in categories:
+                    item_count = MenuItem.objects.filter(category=category, is_active=True).count()
+                    category_data = CategorySerializer(category).data
+                    category_data['item_count'] = item_count
+                    categories_data.append(category_data)
+                return categories_data
+            
+            # Готовые байты JSON из кэша текущего поколения каталога на 10 минут
+            return catalog_response(request, 'categories', build, 600)
         except Exception as e:
             logger.error(f"Category view error: {str(e)}", exc_info=True)
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1192,6 +1219,22 @@ class OrderCreateView(APIView):
                 logger.warning(f"Address not found for order: address_id={address_id}")
                 return Response({'error': 'Address not found'}, status=status.HTTP_404_NOT_FOUND)
             
+            # Координаты адреса определяются в фоне: не ждем, клиент повторит запрос
+            if address.geocode_status == Address.GEOCODE_PENDING:
+                logger.info(f"Order creation while address geocoding is pending: address_id={address_id}")
+                return Response({
+                    'error': 'Address geocoding in progress',
+                    'message': 'Координаты адреса еще определяются, повторите попытку через несколько секунд',
+                    'geocode_status': address.geocode_status
+                }, status=status.HTTP_409_CONFLICT)
+            if address.geocode_status == Address.GEOCODE_FAILED:
+                logger.warning(f"Order creation for address without coordinates: address_id={address_id}")
+                return Response({
+                    'error': 'Address coordinates not found',
+                    'message': 'Не удалось определить координаты адреса, укажите точку на карте',
+                    'geocode_status': address.geocode_status
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             # Проверяем зону доставки
             is_in_zone, message = address.is_in_delivery_zone()
             if not is_in_zone:
@@ -1307,13 +1350,12 @@ class GeocodeView(APIView):
         async_mode = request.query_params.get('async') == '1'
         if not address:
             return Response({'error': 'query param required'}, status=400)
-        cache_key = f'yandex_geocode:{address.strip().lower()}'
-        cached = cache.get(cache_key)
+        cached, tier = geocode_store.get_forward(address)
         if cached:
-            return Response({'cached': True, 'result': cached})
+            return Response({'cached': True, 'tier': tier, 'result': cached})
         if async_mode:
-            task = geocode_yandex.delay(address=address)
-            return Response({'task_id': task.id, 'status': 'pending'})
+            task_id = enqueue_geocode_yandex(KIND_FORWARD, forward_key(address), address=address)
+            return Response({'task_id': task_id, 'status': 'pending'})
         # sync mode (по умолчанию)
         result = geocode_yandex(address=address)
         if 'result' in result:
@@ -1326,13 +1368,15 @@ class GeocodeView(APIView):
         async_mode = request.data.get('async') == 1 or request.data.get('async') == '1'
         if not lat or not lon:
             return Response({'error': 'lat/lon required'}, status=400)
-        cache_key = f'yandex_reverse:{lat},{lon}'
-        cached = cache.get(cache_key)
+        try:
+            cached, tier = geocode_store.get_reverse(lat, lon)
+        except (TypeError, ValueError):
+            return Response({'error': 'lat/lon must be numbers'}, status=400)
         if cached:
-            return Response({'cached': True, 'result': cached})
+            return Response({'cached': True, 'tier': tier, 'result': cached})
         if async_mode:
-            task = geocode_yandex.delay(lat=lat, lon=lon)
-            return Response({'task_id': task.id, 'status': 'pending'})
+            task_id = enqueue_geocode_yandex(KIND_REVERSE, reverse_key(lat, lon), lat=lat, lon=lon)
+            return Response({'task_id': task_id, 'status': 'pending'})
         # sync mode (по умолчанию)
         result = geocode_yandex(lat=lat, lon=lon)
         if 'result' in result:
@@ -1341,15 +1385,37 @@ class GeocodeView(APIView):
 
 from celery.result import AsyncResult
 class GeocodeResultView(APIView):
-    """Получить результат асинхронного геокодирования по task_id"""
+    """
+    Получить результат асинхронного геокодирования по task_id.
+    ?wait=<сек> - дождаться результата на сервере (не дольше GEOCODE_RESULT_MAX_WAIT)
+    вместо повторных запросов клиента
+    """
     def get(self, request, task_id):
         res = AsyncResult(task_id)
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            return Response({'error': 'wait must be a number'}, status=400)
+        if wait > 0:
+            wait_for_task(res, min(wait, getattr(settings, 'GEOCODE_RESULT_MAX_WAIT', 10)))
         if res.state == 'PENDING':
             return Response({'status': 'pending'})
         if res.state == 'FAILURE':
             return Response({'status': 'failure', 'error': str(res.result)}, status=500)
         return Response({'status': res.state.lower(), 'result': res.result})
 
+class AddressAutocompleteView(APIView):
+    """Подсказки адресов по префиксу из дерева известных адресов (без запроса к геокодеру)"""
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), getattr(settings, 'ADDRESS_AUTOCOMPLETE_TOP_K', 10))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        if len(query.strip()) < getattr(settings, 'ADDRESS_AUTOCOMPLETE_MIN_CHARS', 2):
+            return Response({'suggestions': []})
+        return Response({'suggestions': get_address_trie().suggest(query, limit=max(limit, 1))})
+
 class DeliveryZoneView(APIView):
     """API для работы с зонами доставки"""
     
@@ -1408,6 +1474,58 @@ class AddressDeliveryZoneCheckView(APIView):
             logger.error(f"Error checking delivery zone: {str(e)}")
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class AddressDeliveryZoneBatchCheckView(APIView):
+    """API для пакетной проверки координат в зонах доставки"""
+
+    def post(self, request):
+        """
+        Проверить список точек.
+        Тело: {"points": [{"id": ..., "latitude": ..., "longitude": ..., "city": ...}, ...]}
+        id и city необязательны; без city точка проверяется по всем активным зонам.
+        """
+        points = request.data.get('points')
+        if not isinstance(points, list):
+            return Response({'error': 'points must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_points = getattr(settings, 'DELIVERY_ZONE_BATCH_MAX_POINTS', 1000)
+        if len(points) > max_points:
+            return Response(
+                {'error': f'Too many points, maximum is {max_points}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            parsed = []
+            for point in points:
+                if not isinstance(point, dict):
+                    parsed.append((None, None, None))
+                    continue
+                try:
+                    latitude = float(point.get('latitude'))
+                    longitude = float(point.get('longitude'))
+                except (TypeError, ValueError):
+                    latitude = longitude = None
+                parsed.append((latitude, longitude, point.get('city') or None))
+
+            index = get_zone_index()
+            zones = index.locate_many(parsed)
+
+            results = []
+            for point, zone in zip(points, zones):
+                results.append({
+                    'id': point.get('id') if isinstance(point, dict) else None,
+                    'is_in_delivery_zone': zone is not None,
+                    'zone_id': zone.id if zone else None,
+                    'zone_name': zone.name if zone else None,
+                    'delivery_fee': str(zone.delivery_fee) if zone else None,
+                })
+
+            return Response({'results': results, 'zones_version': index.version})
+
+        except Exception as e:
+            logger.error(f"Error checking delivery zones batch: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class AddressDeliveryZoneDetailView(APIView):
     """API для проверки конкретного адреса в зоне доставки"""
     
@@ -1490,7 +1608,7 @@ class PromotionViewSet(viewsets.ModelViewSet):
 class MenuItemViewSet(viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [MenuSearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'priority']
 
@@ -1530,17 +1648,20 @@ class HitsView(APIView):
     
     def get(self, request):
         try:
-            # Получаем товары-хиты
-            hits = MenuItem.objects.filter(is_hit=True).select_related('category').order_by('priority', '-created_at')
-            
-            # Сериализуем с дополнениями и размерами
-            serializer = MenuItemSerializer(hits, many=True)
+            def build():
+                # Получаем товары-хиты
+                hits = MenuItem.objects.filter(is_hit=True).order_by('priority', '-created_at')
+                
+                # Сериализуем с дополнениями и размерами (быстрый read-only путь)
+                hits = serialize_menu_items(hits)
+                
+                logger.info(f"Retrieved {len(hits)} hit items")
+                return {
+                    'hits': hits,
+                    'count': len(hits)
+                }
             
-            logger.info(f"Retrieved {len(hits)} hit items")
-            return Response({
-                'hits': serializer.data,
-                'count': len(hits)
-            })
+            return catalog_response(request, 'hits', build, 300)
             
         except Exception as e:
             logger.error(f"Error getting hits: {str(e)}")
@@ -1551,17 +1672,20 @@ class NewItemsView(APIView):
     
     def get(self, request):
         try:
-            # Получаем новинки
-            new_items = MenuItem.objects.filter(is_new=True, is_active=True).select_related('category').order_by('priority', '-created_at')
+            def build():
+                # Получаем новинки
+                new_items = MenuItem.objects.filter(is_new=True, is_active=True).order_by('priority', '-created_at')
+                
+                # Сериализуем с дополнениями и размерами (быстрый read-only путь)
+                new_items = serialize_menu_items(new_items)
+                
+                logger.info(f"Retrieved {len(new_items)} new items")
+                return {
+                    'new_items': new_items,
+                    'count': len(new_items)
+                }
             
-            # Сериализуем с дополнениями и размерами
-            serializer = MenuItemSerializer(new_items, many=True)
-            
-            logger.info(f"Retrieved {len(new_items)} new items")
-            return Response({
-                'new_items': serializer.data,
-                'count': len(new_items)
-            })
+            return catalog_response(request, 'new_items', build, 300)
             
         except Exception as e:
             logger.error(f"Error getting new items: {str(e)}")
@@ -1631,16 +1755,16 @@ class CategoryItemsView(APIView):
             items = MenuItem.objects.filter(
                 category=category, 
                 is_active=True
-            ).select_related('category').order_by('priority', '-created_at')
+            ).order_by('priority', '-created_at')
             
-            # Сериализуем товары
-            items_serializer = MenuItemSerializer(items, many=True)
+            # Сериализуем товары (быстрый read-only путь)
+            items = serialize_menu_items(items)
             category_serializer = CategorySerializer(category)
             
             logger.info(f"Retrieved {len(items)} items for category: {category.name}")
             return Response({
                 'category': category_serializer.data,
-                'items': items_serializer.data,
+                'items': items,
                 'count': len(items)
             })
             
@@ -1661,11 +1785,8 @@ class SearchView(APIView):
             # Базовый запрос
             items = MenuItem.objects.filter(is_active=True)
             
-            # Поиск по названию и описанию
-            items = items.filter(
-                models.Q(name__icontains=query) | 
-                models.Q(description__icontains=query)
-            )
+            # Поиск по названию, описанию и категории (бэкенд - MENU_SEARCH_BACKEND)
+            items, ranked_ids = search_menu_items(items, query)
             
             # Дополнительные фильтры
             category = request.query_params.get('category')
@@ -1706,14 +1827,16 @@ class SearchView(APIView):
                 items = items.filter(models.Q(is_hit=featured_value) | models.Q(is_new=featured_value))
             
             # Сортировка
-            items = items.select_related('category').order_by('priority', '-created_at')
-            
-            serializer = MenuItemSerializer(items, many=True)
+            items = serialize_menu_items(items.order_by('priority', '-created_at'))
+            if ranked_ids is not None:
+                # Порядок релевантности из индекса поиска
+                rank = {item_id: position for position, item_id in enumerate(ranked_ids)}
+                items.sort(key=lambda item: rank[item['id']])
             
             logger.info(f"Search for '{query}' returned {len(items)} items")
             return Response({
                 'query': query,
-                'items': serializer.data,
+                'items': items,
                 'count': len(items)
             })
             
@@ -1726,19 +1849,22 @@ class FeaturedView(APIView):
     
     def get(self, request):
         try:
-            # Получаем хиты и новинки
-            featured_items = MenuItem.objects.filter(
-                models.Q(is_hit=True) | models.Q(is_new=True),
-                is_active=True
-            ).select_related('category').order_by('priority', '-created_at')
-            
-            serializer = MenuItemSerializer(featured_items, many=True)
+            def build():
+                # Получаем хиты и новинки
+                featured_items = MenuItem.objects.filter(
+                    models.Q(is_hit=True) | models.Q(is_new=True),
+                    is_active=True
+                ).order_by('priority', '-created_at')
+                
+                featured_items = serialize_menu_items(featured_items)
+                
+                logger.info(f"Retrieved {len(featured_items)} featured items")
+                return {
+                    'featured_items': featured_items,
+                    'count': len(featured_items)
+                }
             
-            logger.info(f"Retrieved {len(featured_items)} featured items")
-            return Response({
-                'featured_items': serializer.data,
-                'count': len(featured_items)
-            })
+            return catalog_response(request, 'featured', build, 300)
             
         except Exception as e:
             logger.error(f"Error getting featured items: {str(e)}")
@@ -1768,12 +1894,11 @@ class PriceRangeView(APIView):
                 except (ValueError, TypeError):
                     return Response({'error': 'Invalid max_price'}, status=status.HTTP_400_BAD_REQUEST)
             
-            items = items.select_related('category').order_by('price', '-created_at')
-            serializer = MenuItemSerializer(items, many=True)
+            items = serialize_menu_items(items.order_by('price', '-created_at'))
             
             logger.info(f"Retrieved {len(items)} items in price range")
             return Response({
-                'items': serializer.data,
+                'items': items,
                 'count': len(items),
                 'min_price': min_price,
                 'max_price': max_price
@@ -2094,12 +2219,11 @@ class FavoriteView(APIView):
                 return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
             
             # Получаем избранные товары
-            favorites = Favorite.objects.filter(user=user).select_related('menu_item__category').order_by('-created_at')
-            serializer = FavoriteSerializer(favorites, many=True)
+            favorites = serialize_favorites(Favorite.objects.filter(user=user).order_by('-created_at'))
             
             logger.info(f"Retrieved {len(favorites)} favorites for user: telegram_id={telegram_id}")
             return Response({
-                'favorites': serializer.data,
+                'favorites': favorites,
                 'count': len(favorites)
             })
             
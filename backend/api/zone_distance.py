@@ -0,0 +1,131 @@
+"""
+Расстояние от точки до границ зон доставки.
+
+Ребра полигонов скомпилированных зон раскладываются по корзинам равномерной
+сетки. Поиск обходит корзины кольцами вокруг точки и останавливается, как
+только найденное расстояние не больше расстояния до еще не просмотренных
+колец, поэтому проверяются только ребра рядом с точкой.
+
+Координаты переводятся в километры локальной равнопромежуточной проекцией,
+точности которой достаточно в пределах города.
+"""
+import math
+
+from .geometry import KM_PER_DEGREE, cell_key, point_segment_distance, segment_intersects_rect
+
+
+class EdgeIndex:
+    """Пространственный индекс ребер набора скомпилированных зон"""
+
+    def __init__(self, zones, bucket_deg):
+        self.bucket_deg = bucket_deg
+        self.zones = {zone.id: zone for zone in zones}
+
+        # Масштаб долготы берется по средней широте вершин набора
+        all_lats = [lat for zone in zones for lat in zone.lats]
+        ref_lat = sum(all_lats) / len(all_lats) if all_lats else 0.0
+        self.lat_scale = KM_PER_DEGREE
+        self.lon_scale = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+        # Гарантированный прирост расстояния при переходе к следующему кольцу корзин
+        self.ring_step_km = bucket_deg * min(self.lat_scale, self.lon_scale)
+
+        self.edges = []
+        self.buckets = {}
+        eps = bucket_deg * 1e-9
+        for zone in zones:
+            n = len(zone.lats)
+            if n < 3:
+                continue
+            j = n - 1
+            for i in range(n):
+                lat1, lon1, lat2, lon2 = zone.lats[j], zone.lons[j], zone.lats[i], zone.lons[i]
+                edge_id = len(self.edges)
+                self.edges.append((
+                    zone.id,
+                    lon1 * self.lon_scale, lat1 * self.lat_scale,
+                    lon2 * self.lon_scale, lat2 * self.lat_scale,
+                ))
+                row_from, col_from = cell_key(min(lat1, lat2), min(lon1, lon2), bucket_deg)
+                row_to, col_to = cell_key(max(lat1, lat2), max(lon1, lon2), bucket_deg)
+                for row in range(row_from, row_to + 1):
+                    for col in range(col_from, col_to + 1):
+                        if segment_intersects_rect(
+                            lat1, lon1, lat2, lon2,
+                            row * bucket_deg - eps, col * bucket_deg - eps,
+                            (row + 1) * bucket_deg + eps, (col + 1) * bucket_deg + eps
+                        ):
+                            self.buckets.setdefault((row, col), []).append(edge_id)
+                j = i
+
+        self.indexed_zones = len({edge[0] for edge in self.edges})
+        if self.buckets:
+            rows = [row for row, _ in self.buckets]
+            cols = [col for _, col in self.buckets]
+            self.extent = (min(rows), min(cols), max(rows), max(cols))
+        else:
+            self.extent = None
+
+    def __len__(self):
+        return len(self.edges)
+
+    def _ring(self, row, col, radius):
+        """Корзины на кольце radius вокруг (row, col), обрезанные по границам индекса"""
+        min_row, min_col, max_row, max_col = self.extent
+        for r in range(max(row - radius, min_row), min(row + radius, max_row) + 1):
+            if abs(r - row) == radius:
+                for c in range(max(col - radius, min_col), min(col + radius, max_col) + 1):
+                    yield r, c
+            else:
+                if min_col <= col - radius <= max_col:
+                    yield r, col - radius
+                if radius and min_col <= col + radius <= max_col:
+                    yield r, col + radius
+
+    def _search(self, lat, lon, done):
+        """
+        Обходит корзины кольцами и возвращает {id зоны: расстояние в км до ближайшего
+        просмотренного ребра}. done(best, bound) решает, можно ли остановиться, когда
+        все ребра ближе bound км уже просмотрены.
+        """
+        best = {}
+        if self.extent is None:
+            return best
+
+        px, py = lon * self.lon_scale, lat * self.lat_scale
+        row, col = cell_key(lat, lon, self.bucket_deg)
+        min_row, min_col, max_row, max_col = self.extent
+        first = max(0, min_row - row, row - max_row, min_col - col, col - max_col)
+        last = max(row - min_row, max_row - row, col - min_col, max_col - col)
+
+        seen = set()
+        for radius in range(first, last + 1):
+            for cell in self._ring(row, col, radius):
+                for edge_id in self.buckets.get(cell, ()):
+                    if edge_id in seen:
+                        continue
+                    seen.add(edge_id)
+                    zone_id, ax, ay, bx, by = self.edges[edge_id]
+                    distance = point_segment_distance(px, py, ax, ay, bx, by)
+                    if distance < best.get(zone_id, math.inf):
+                        best[zone_id] = distance
+            if done(best, radius * self.ring_step_km):
+                break
+        return best
+
+    def nearest(self, latitude, longitude):
+        """Ближайшая по границе зона и расстояние до нее в км: (зона, км) или (None, None)"""
+        best = self._search(
+            float(latitude), float(longitude),
+            lambda found, bound: bool(found) and min(found.values()) <= bound
+        )
+        if not best:
+            return None, None
+        zone_id = min(best, key=best.get)
+        return self.zones[zone_id], best[zone_id]
+
+    def distances(self, latitude, longitude):
+        """Расстояние в км от точки до границы каждой зоны индекса: {id зоны: км}"""
+        return self._search(
+            float(latitude), float(longitude),
+            lambda found, bound: len(found) == self.indexed_zones and max(found.values()) <= bound
+        )
@@ -0,0 +1,316 @@
+"""
+Скомпилированный индекс зон доставки.
+
+Полигоны активных зон один раз разбираются в массивы float с предвычисленными
+bounding box и нормализованным ключом города. Индекс живет в памяти процесса и
+перестраивается только когда меняется версия набора зон (количество зон и
+максимальный updated_at).
+
+Каждая зона дополнительно раскладывается по сетке фиксированного шага:
+ячейка целиком внутри полигона отвечает одним обращением к словарю, и
+только граничные ячейки проверяются точным ray casting.
+
+Расстояние до границ зон считает EdgeIndex (zone_distance), который
+строится по тем же скомпилированным зонам отдельно для каждого города.
+
+Для пакетных проверок (locate_many) ребра полигонов хранятся в массивах
+NumPy, и все точки проверяются против зоны за один векторный проход.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .zone_distance import EdgeIndex
+from .geometry import (
+    parse_polygon, bounding_box, point_in_ring, rasterize_polygon, cell_key,
+    ring_edges, points_in_ring, CELL_INSIDE,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - без NumPy locate_many проверяет точки по одной
+    np = None
+
+logger = logging.getLogger('api')
+
+ZONE_INDEX_VERSION_KEY = 'delivery_zones:version'
+
+
+def normalize_city(city):
+    """Ключ города без учета регистра и лишних пробелов"""
+    if not city:
+        return ''
+    return ' '.join(str(city).split()).casefold()
+
+
+class CompiledZone:
+    """Зона доставки, подготовленная для быстрых геометрических проверок"""
+    __slots__ = (
+        'id', 'name', 'city', 'city_key', 'delivery_fee', 'min_order_amount',
+        'center_latitude', 'center_longitude', 'radius_km', 'lats', 'lons', 'bbox',
+        'cell_size', 'cells', 'edges',
+    )
+
+    def __init__(self, zone, cell_size=None, max_cells=None):
+        self.id = zone.id
+        self.name = zone.name
+        self.city = zone.city
+        self.city_key = normalize_city(zone.city)
+        self.delivery_fee = zone.delivery_fee
+        self.min_order_amount = zone.min_order_amount
+        self.center_latitude = float(zone.center_latitude) if zone.center_latitude is not None else None
+        self.center_longitude = float(zone.center_longitude) if zone.center_longitude is not None else None
+        self.radius_km = zone.radius_km
+        self.lats, self.lons = parse_polygon(zone.membership_polygon)
+        self.bbox = bounding_box(self.lats, self.lons)
+        self.cell_size = cell_size
+        self.cells = rasterize_polygon(self.lats, self.lons, cell_size, max_cells) if cell_size else None
+        self.edges = ring_edges(self.lats, self.lons)
+
+    def __repr__(self):
+        return f"<CompiledZone {self.id}: {self.name} ({self.city})>"
+
+    def bbox_contains(self, lat, lon):
+        if self.bbox is None:
+            return False
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    def contains(self, lat, lon):
+        """Проверяет точку: bounding box, затем ячейка сетки, и только для граничных ячеек ray casting"""
+        if len(self.lats) < 3 or not self.bbox_contains(lat, lon):
+            return False
+        if self.cells is not None:
+            state = self.cells.get(cell_key(lat, lon, self.cell_size))
+            if state is None:
+                return False
+            if state == CELL_INSIDE:
+                return True
+        return point_in_ring(lat, lon, self.lats, self.lons)
+
+    def distance_to_center(self, lat, lon):
+        """Расстояние до центра зоны в км или None, если центр не задан"""
+        if self.center_latitude is None or self.center_longitude is None:
+            return None
+        from .models import calculate_distance
+        return calculate_distance(self.center_latitude, self.center_longitude, lat, lon)
+
+
+class ZoneIndex:
+    """Набор скомпилированных активных зон, сгруппированных по городу"""
+
+    def __init__(self, zones, version):
+        self.version = version
+        cell_size = getattr(settings, 'DELIVERY_ZONE_GRID_CELL_DEG', 0.001)
+        max_cells = getattr(settings, 'DELIVERY_ZONE_GRID_MAX_CELLS', 500_000)
+        self.zones = [CompiledZone(zone, cell_size, max_cells) for zone in zones]
+        self.by_id = {zone.id: zone for zone in self.zones}
+        self.by_city = {}
+        for zone in self.zones:
+            self.by_city.setdefault(zone.city_key, []).append(zone)
+        self.edge_bucket_deg = getattr(settings, 'DELIVERY_ZONE_EDGE_BUCKET_DEG', 0.005)
+        self._edge_indexes = {}
+
+    def __len__(self):
+        return len(self.zones)
+
+    def get(self, zone_id):
+        return self.by_id.get(zone_id)
+
+    def zones_for_city(self, city):
+        return self.by_city.get(normalize_city(city), [])
+
+    def edge_index(self, city=None):
+        """Индекс ребер зон города (или всех зон), строится при первом обращении"""
+        key = None if city is None else normalize_city(city)
+        edge_index = self._edge_indexes.get(key)
+        if edge_index is None:
+            zones = self.zones if key is None else self.by_city.get(key, [])
+            edge_index = EdgeIndex(zones, self.edge_bucket_deg)
+            self._edge_indexes[key] = edge_index
+        return edge_index
+
+    def locate(self, latitude, longitude, city=None):
+        """
+        Возвращает зону, содержащую точку, или None.
+        Если передан city, проверяются только зоны этого города.
+        """
+        if not latitude or not longitude:
+            return None
+        lat, lon = float(latitude), float(longitude)
+        candidates = self.zones if city is None else self.zones_for_city(city)
+        for zone in candidates:
+            if zone.contains(lat, lon):
+                return zone
+        return None
+
+    def locate_many(self, points):
+        """
+        Пакетная версия locate.
+        points - последовательность (широта, долгота, город или None).
+        Возвращает список зон (или None) в порядке точек.
+        """
+        results = [None] * len(points)
+        groups = {}
+        for position, (latitude, longitude, city) in enumerate(points):
+            if not latitude or not longitude:
+                continue
+            key = None if city is None else normalize_city(city)
+            groups.setdefault(key, []).append((position, float(latitude), float(longitude)))
+
+        for key, group in groups.items():
+            candidates = self.zones if key is None else self.by_city.get(key, [])
+            if not candidates:
+                continue
+
+            if np is None:
+                for position, lat, lon in group:
+                    for zone in candidates:
+                        if zone.contains(lat, lon):
+                            results[position] = zone
+                            break
+                continue
+
+            positions = [position for position, _, _ in group]
+            lats = np.fromiter((lat for _, lat, _ in group), dtype=np.float64, count=len(group))
+            lons = np.fromiter((lon for _, _, lon in group), dtype=np.float64, count=len(group))
+            pending = np.ones(len(group), dtype=bool)
+            for zone in candidates:
+                if zone.edges is None:
+                    continue
+                min_lat, min_lon, max_lat, max_lon = zone.bbox
+                candidates_idx = np.flatnonzero(
+                    pending & (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+                )
+                if not candidates_idx.size:
+                    continue
+                hits = candidates_idx[points_in_ring(lats[candidates_idx], lons[candidates_idx], zone.edges)]
+                for i in hits.tolist():
+                    results[positions[i]] = zone
+                pending[hits] = False
+                if not pending.any():
+                    break
+
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+_version_checked_at = 0.0
+_checked_version = None
+
+
+def _compute_zones_version():
+    """Версия набора зон по данным БД: количество зон и последний updated_at"""
+    from .models import DeliveryZone
+
+    stats = DeliveryZone.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    last_updated = stats['last_updated']
+    timestamp = int(last_updated.timestamp() * 1_000_000) if last_updated else 0
+    return f"{stats['count']}-{timestamp}"
+
+
+def get_zones_version():
+    """
+    Текущая версия набора зон.
+    Берется из кэша; при промахе вычисляется одним агрегирующим запросом.
+    """
+    global _version_checked_at, _checked_version
+
+    check_interval = getattr(settings, 'DELIVERY_ZONE_INDEX_CHECK_INTERVAL', 1.0)
+    now = time.monotonic()
+    if _checked_version is not None and now - _version_checked_at < check_interval:
+        return _checked_version
+
+    version = None
+    try:
+        version = cache.get(ZONE_INDEX_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Cache error reading delivery zones version: {str(e)}")
+
+    if version is None:
+        version = _compute_zones_version()
+        try:
+            cache.set(ZONE_INDEX_VERSION_KEY, version, getattr(settings, 'DELIVERY_ZONE_INDEX_VERSION_TTL', 60))
+        except Exception as e:
+            logger.warning(f"Cache error storing delivery zones version: {str(e)}")
+
+    _checked_version = version
+    _version_checked_at = now
+    return version
+
+
+def get_zone_index():
+    """Возвращает индекс зон процесса, перестраивая его при смене версии"""
+    global _index
+
+    version = get_zones_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or index.version != version:
+            from .models import DeliveryZone
+
+            zones = DeliveryZone.objects.filter(is_active=True).order_by('city', 'name', 'id')
+            index = ZoneIndex(zones, version)
+            _index = index
+            logger.info(f"Delivery zone index rebuilt: {len(index)} zones, version={version}")
+    return index
+
+
+def refresh_zone_stamps(queryset, prefix='', batch_size=2000):
+    """
+    Пересчитывает delivery_zone у записей queryset, сохраненных по устаревшей версии зон.
+    prefix - путь к полям адреса (например 'address__' для заказов).
+    Возвращает количество обновленных записей.
+    """
+    index = get_zone_index()
+    model = queryset.model
+    stale = queryset.exclude(delivery_zone_version=index.version).order_by('id').values_list(
+        'id', f'{prefix}latitude', f'{prefix}longitude', f'{prefix}city'
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(stale.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        zones = index.locate_many([(lat, lon, city) for _, lat, lon, city in batch])
+        by_zone = {}
+        for (row_id, _, _, _), zone in zip(batch, zones):
+            by_zone.setdefault(zone.id if zone else None, []).append(row_id)
+        for zone_id, ids in by_zone.items():
+            model.objects.filter(id__in=ids).update(delivery_zone_id=zone_id, delivery_zone_version=index.version)
+        updated += len(batch)
+        last_id = batch[-1][0]
+
+    if updated:
+        logger.info(f"Delivery zone stamps refreshed: {updated} {model._meta.model_name} rows, version={index.version}")
+    return updated
+
+
+def _drop_shared_version():
+    try:
+        cache.delete(ZONE_INDEX_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Cache error invalidating delivery zones version: {str(e)}")
+
+
+def invalidate_zone_index():
+    """Сбрасывает индекс процесса и общую версию зон (вызывается из сигналов)"""
+    global _index, _checked_version
+
+    _index = None
+    _checked_version = None
+    _drop_shared_version()
+    # Повторяем после коммита, чтобы другие процессы не закэшировали версию до фиксации транзакции
+    transaction.on_commit(_drop_shared_version)
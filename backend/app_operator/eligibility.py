@@ -0,0 +1,71 @@
+"""
+Матрица допуска операторов к зонам доставки.
+
+Для каждой активной зоны хранится множество ID активных операторов, которым
+она назначена. Матрица строится одним запросом по таблице связи
+Operator.assigned_zones и кэшируется; сигналы сбрасывают ее при изменении
+назначенных зон, флага is_active_operator или самих зон.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+ELIGIBILITY_CACHE_KEY = 'operator_eligibility:matrix'
+
+
+def _build_matrix():
+    """Строит матрицу {id зоны: frozenset(id операторов)} одним запросом"""
+    from .models import Operator
+
+    Through = Operator.assigned_zones.through
+    rows = Through.objects.filter(
+        operator__is_active_operator=True,
+        deliveryzone__is_active=True
+    ).values_list('deliveryzone_id', 'operator_id')
+
+    matrix = {}
+    for zone_id, operator_id in rows:
+        matrix.setdefault(zone_id, set()).add(operator_id)
+    return {zone_id: frozenset(operator_ids) for zone_id, operator_ids in matrix.items()}
+
+
+def get_eligibility_matrix():
+    """Матрица допуска из кэша; при промахе строится заново"""
+    matrix = None
+    try:
+        matrix = cache.get(ELIGIBILITY_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"Cache error reading operator eligibility matrix: {str(e)}")
+
+    if matrix is None:
+        matrix = _build_matrix()
+        try:
+            cache.set(ELIGIBILITY_CACHE_KEY, matrix, getattr(settings, 'OPERATOR_ELIGIBILITY_CACHE_TTL', 300))
+        except Exception as e:
+            logger.warning(f"Cache error storing operator eligibility matrix: {str(e)}")
+    return matrix
+
+
+def eligible_operator_ids(zone_id):
+    """ID активных операторов, которым назначена зона"""
+    if not zone_id:
+        return frozenset()
+    return get_eligibility_matrix().get(zone_id, frozenset())
+
+
+def _drop_matrix():
+    try:
+        cache.delete(ELIGIBILITY_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"Cache error invalidating operator eligibility matrix: {str(e)}")
+
+
+def invalidate_eligibility_matrix():
+    """Сбрасывает матрицу допуска (вызывается из сигналов)"""
+    _drop_matrix()
+    # Повторяем после коммита, чтобы не закэшировать матрицу до фиксации транзакции
+    transaction.on_commit(_drop_matrix)
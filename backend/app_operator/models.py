@@ -10,6 +10,8 @@ from django.db.models import Avg, Count, Sum, Q
 from datetime import datetime, timedelta
 import re
 
+from .eligibility import eligible_operator_ids
+
 def validate_uzbek_phone_number(value):
     """
     Валидатор для узбекских номеров телефонов
@@ -111,6 +113,13 @@ class Operator(AbstractUser):
             models.Index(fields=['phone']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженный статус, чтобы сигналы могли заметить его изменение
+        instance._loaded_is_active_operator = instance.__dict__.get('is_active_operator')
+        return instance
+
     def __str__(self):
         if self.phone:
             return f"{self.get_full_name()} ({self.phone})"
@@ -141,16 +150,15 @@ class Operator(AbstractUser):
         if not self.is_active_operator:
             return False, "Оператор неактивен"
         
+        # Проверяем, входит ли зона заказа в зоны оператора
+        zone = order.resolve_delivery_zone()
+        if zone and self.pk in eligible_operator_ids(zone.id):
+            return True, f"Заказ в зоне '{zone.name}'"
+        
         # Проверяем, есть ли у оператора назначенные зоны
         if not self.assigned_zones.exists():
             return False, "У оператора нет назначенных зон доставки"
         
-        # Проверяем, находится ли адрес заказа в зонах оператора
-        order_address = order.address
-        for zone in self.assigned_zones.filter(is_active=True):
-            if zone.is_address_in_zone(order_address.latitude, order_address.longitude):
-                return True, f"Заказ в зоне '{zone.name}'"
-        
         return False, "Адрес заказа не в зонах оператора"
 
 class OperatorSession(models.Model):
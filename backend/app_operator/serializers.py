@@ -451,18 +451,12 @@ class OrderMapLocationSerializer(serializers.ModelSerializer):
 
     def get_delivery_zone(self, obj):
         """Информация о зоне доставки"""
-        address = obj.address
-        zones = DeliveryZone.objects.filter(
-            city__iexact=address.city,
-            is_active=True
-        )
-        
-        for zone in zones:
-            if zone.is_address_in_zone(address.latitude, address.longitude):
-                return {
-                    'id': zone.id,
-                    'name': zone.name,
-                    'delivery_fee': float(zone.delivery_fee)
-                }
+        zone = obj.resolve_delivery_zone()
+        if zone:
+            return {
+                'id': zone.id,
+                'name': zone.name,
+                'delivery_fee': float(zone.delivery_fee)
+            }
         
         return None 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from django.db import transaction
@@ -8,7 +8,8 @@ from .models import (
     Operator, OperatorSession, OrderAssignment, OrderStatusHistory, 
     OperatorNotification, OperatorAnalytics
 )
-from api.models import Order
+from .eligibility import eligible_operator_ids, invalidate_eligibility_matrix
+from api.models import Order, DeliveryZone
 
 logger = logging.getLogger(__name__)
 
@@ -18,34 +19,25 @@ def notify_operators_new_order(sender, instance, created, **kwargs):
     Уведомляет операторов о новом заказе
     """
     if created and instance.status == 'pending':
-        # Находим операторов, которые могут обработать заказ
-        available_operators = Operator.objects.filter(
-            is_active_operator=True,
-            assigned_zones__is_active=True
-        ).distinct()
+        # Операторы, допущенные к зоне заказа (зона сохраняется в заказе при создании)
+        operator_ids = eligible_operator_ids(instance.delivery_zone_id)
+        if not operator_ids:
+            return
         
-        # Фильтруем операторов по зонам доставки
-        order_address = instance.address
-        suitable_operators = []
-        
-        for operator in available_operators:
-            can_handle, message = operator.can_handle_order(instance)
-            if can_handle:
-                suitable_operators.append(operator)
-        
-        # Создаем уведомления для подходящих операторов
-        for operator in suitable_operators:
-            try:
-                OperatorNotification.objects.create(
-                    operator=operator,
+        try:
+            OperatorNotification.objects.bulk_create([
+                OperatorNotification(
+                    operator_id=operator_id,
                     notification_type='new_order',
                     title='Новый заказ',
                     message=f'Поступил новый заказ #{instance.id} на сумму {instance.total_price} UZS',
                     order=instance
                 )
-                logger.info(f"Уведомление о новом заказе #{instance.id} отправлено оператору {operator.username}")
-            except Exception as e:
-                logger.error(f"Ошибка при создании уведомления для оператора {operator.username}: {e}")
+                for operator_id in sorted(operator_ids)
+            ])
+            logger.info(f"Уведомления о новом заказе #{instance.id} отправлены операторам: {len(operator_ids)}")
+        except Exception as e:
+            logger.error(f"Ошибка при создании уведомлений о новом заказе #{instance.id}: {e}")
 
 @receiver(post_save, sender=OrderAssignment)
 def notify_order_assignment(sender, instance, created, **kwargs):
@@ -196,4 +188,31 @@ def create_initial_analytics(sender, instance, created, **kwargs):
         except Exception as e:
             logger.error(f"Ошибка при создании начальной аналитики: {e}")
 
- 
\ No newline at end of file
+ 
+
+@receiver(m2m_changed, sender=Operator.assigned_zones.through)
+def invalidate_eligibility_on_zones_change(sender, action, **kwargs):
+    """
+    Сбрасывает матрицу допуска при изменении назначенных зон оператора
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_eligibility_matrix()
+
+@receiver(post_save, sender=Operator)
+def invalidate_eligibility_on_operator_change(sender, instance, created, **kwargs):
+    """
+    Сбрасывает матрицу допуска при создании оператора или смене is_active_operator
+    """
+    if created or instance.is_active_operator != getattr(instance, '_loaded_is_active_operator', None):
+        invalidate_eligibility_matrix()
+    instance._loaded_is_active_operator = instance.is_active_operator
+
+@receiver(post_delete, sender=Operator)
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+def invalidate_eligibility_on_delete_or_zone_change(sender, instance, **kwargs):
+    """
+    Сбрасывает матрицу допуска при удалении оператора и изменении зон доставки
+    """
+    invalidate_eligibility_matrix()
+
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
@@ -13,6 +13,9 @@ from .models import (
     OrderStatusHistory, OperatorNotification, OperatorAnalytics
 )
 from api.models import Order, DeliveryZone, Address, User, MenuItem, Category
+from api.models import User as Customer
+from api.tasks import refresh_delivery_zone_stamps
+from .eligibility import eligible_operator_ids
 
 User = get_user_model()
 
@@ -553,3 +556,98 @@ class OperatorIntegrationTest(TestCase):
         self.assertEqual(analytics.total_orders, 5)
         self.assertEqual(analytics.completed_orders, 5)
         self.assertGreater(analytics.avg_delivery_time, 0)
+
+
+class OperatorZoneFeedTest(APITestCase):
+    """
+    Тесты ленты заказов оператора по сохраненной зоне доставки
+    """
+
+    def setUp(self):
+        self.zone = DeliveryZone.objects.create(
+            name='Центр', city='Бухара', delivery_fee=5000, is_active=True,
+            polygon_coordinates=[[39.76, 64.41], [39.76, 64.43], [39.78, 64.43], [39.78, 64.41]]
+        )
+        self.other_zone = DeliveryZone.objects.create(
+            name='Север', city='Бухара', delivery_fee=7000, is_active=True,
+            polygon_coordinates=[[39.80, 64.41], [39.80, 64.43], [39.82, 64.43], [39.82, 64.41]]
+        )
+        self.operator = Operator.objects.create_user(
+            username='zone_operator', password='testpass123', phone='901234568', is_active_operator=True
+        )
+        self.operator.assigned_zones.add(self.zone)
+
+        customer = Customer.objects.create(telegram_id=555, first_name='Клиент')
+        self.orders = {}
+        for name, lat in (('center', '39.770000'), ('north', '39.810000')):
+            address = Address.objects.create(
+                user=customer, street=name, house_number='1', city='Бухара',
+                latitude=lat, longitude='64.420000', phone_number='901234567'
+            )
+            self.orders[name] = Order.objects.create(user=customer, address=address, total_price=10000)
+        self.client.force_authenticate(self.operator)
+
+    def order_ids(self, url):
+        return {order['id'] for order in self.client.get(url).json()}
+
+    def test_feed_limited_to_operator_zones(self):
+        self.assertEqual(self.order_ids('/api/operator/orders/'), {self.orders['center'].id})
+        self.assertEqual(self.order_ids(f'/api/operator/orders/?zone={self.other_zone.id}'), set())
+
+    def test_feed_follows_zone_change(self):
+        # Полигон зоны оператора переносится на север: заказ из центра выпадает из ленты
+        self.zone.polygon_coordinates = [[39.805, 64.41], [39.805, 64.43], [39.815, 64.43], [39.815, 64.41]]
+        self.zone.save()
+        self.other_zone.is_active = False
+        self.other_zone.save()
+        # Лента только читает колонку delivery_zone - пересчет делает задача
+        self.assertEqual(self.order_ids('/api/operator/orders/'), {self.orders['center'].id})
+        refresh_delivery_zone_stamps.apply()
+        self.assertEqual(self.order_ids('/api/operator/orders/'), {self.orders['north'].id})
+
+    def test_orders_without_stamp_return_after_backfill(self):
+        # Выполненный заказ, созданный до появления колонки delivery_zone
+        Order.objects.filter(pk=self.orders['center'].pk).update(
+            status='completed', delivery_zone=None, delivery_zone_version=''
+        )
+        self.assertEqual(self.order_ids('/api/operator/orders/'), set())
+
+        refresh_delivery_zone_stamps.apply()
+        self.assertEqual(self.order_ids('/api/operator/orders/'), {self.orders['center'].id})
+        self.assertEqual(self.order_ids(f'/api/operator/orders/?zone={self.zone.id}'), {self.orders['center'].id})
+
+    def test_new_order_notifies_eligible_operators(self):
+        notified = OperatorNotification.objects.filter(notification_type='new_order')
+        self.assertEqual(
+            list(notified.values_list('operator_id', 'order_id')),
+            [(self.operator.id, self.orders['center'].id)]
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OperatorEligibilityTest(TestCase):
+    """
+    Тесты кэшированной матрицы допуска операторов к зонам
+    """
+
+    def setUp(self):
+        self.zone = DeliveryZone.objects.create(name='Центр', city='Бухара', is_active=True)
+        self.operator = Operator.objects.create_user(
+            username='eligible_operator', password='testpass123', phone='901234569', is_active_operator=True
+        )
+
+    def test_matrix_follows_assigned_zones(self):
+        self.assertEqual(eligible_operator_ids(self.zone.id), frozenset())
+        self.operator.assigned_zones.add(self.zone)
+        self.assertEqual(eligible_operator_ids(self.zone.id), {self.operator.id})
+        self.operator.assigned_zones.remove(self.zone)
+        self.assertEqual(eligible_operator_ids(self.zone.id), frozenset())
+
+    def test_matrix_follows_operator_status(self):
+        self.operator.assigned_zones.add(self.zone)
+        self.assertEqual(eligible_operator_ids(self.zone.id), {self.operator.id})
+        operator = Operator.objects.get(pk=self.operator.pk)
+        operator.is_active_operator = False
+        operator.save()
+        self.assertEqual(eligible_operator_ids(self.zone.id), frozenset())
+
@@ -26,6 +26,16 @@ from api.models import Order, DeliveryZone
 
 logger = logging.getLogger(__name__)
 
+
+def operator_zone_ids(operator):
+    """
+    ID активных зон оператора для фильтра по колонке delivery_zone.
+    Только чтение: зоны заказов после изменения полигонов пересчитывает
+    задача refresh_delivery_zone_stamps
+    """
+    return list(operator.assigned_zones.filter(is_active=True).values_list('id', flat=True))
+
+
 class OperatorAuthViewSet(viewsets.ViewSet):
     """
     ViewSet для аутентификации операторов
@@ -156,13 +166,8 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         """Получение заказов для оператора"""
         operator = self.request.user
         
-        # Получаем зоны оператора
-        operator_zones = operator.assigned_zones.filter(is_active=True)
-        
-        # Фильтруем заказы по зонам оператора
-        queryset = Order.objects.filter(
-            address__city__in=operator_zones.values_list('city', flat=True)
-        )
+        # Фильтруем заказы по сохраненной зоне доставки из зон оператора
+        queryset = Order.objects.filter(delivery_zone__in=operator_zone_ids(operator))
         
         # Фильтрация по статусу
         status_filter = self.request.query_params.get('status')
@@ -172,29 +177,10 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         # Фильтрация по зоне доставки
         zone_filter = self.request.query_params.get('zone')
         if zone_filter:
-            queryset = queryset.filter(
-                address__latitude__isnull=False,
-                address__longitude__isnull=False
-            ).extra(
-                where=[
-                    """
-                    EXISTS (
-                        SELECT 1 FROM api_deliveryzone dz 
-                        WHERE dz.id = %s 
-                        AND dz.is_active = 1
-                        AND (
-                            6371 * acos(
-                                cos(radians(dz.center_latitude)) * 
-                                cos(radians(api_address.latitude)) * 
-                                cos(radians(api_address.longitude) - radians(dz.center_longitude)) + 
-                                sin(radians(dz.center_latitude)) * 
-                                sin(radians(api_address.latitude))
-                            )
-                        ) <= dz.radius_km
-                    """
-                ],
-                params=[zone_filter]
-            )
+            try:
+                queryset = queryset.filter(delivery_zone_id=int(zone_filter))
+            except ValueError:
+                queryset = queryset.none()
         
         # Фильтрация по дате
         date_filter = self.request.query_params.get('date')
@@ -471,10 +457,9 @@ class OrderMapViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Получение заказов с координатами для карты"""
         operator = self.request.user
-        operator_zones = operator.assigned_zones.filter(is_active=True)
         
         return Order.objects.filter(
-            address__city__in=operator_zones.values_list('city', flat=True),
+            delivery_zone__in=operator_zone_ids(operator),
             address__latitude__isnull=False,
             address__longitude__isnull=False
         )
@@ -269,6 +269,58 @@ else:
     }
     SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
+# Настройки исходящих HTTP-запросов (Telegram, Яндекс Геокодер)
+HTTP_CLIENT_CONNECT_TIMEOUT = 3.05  # Таймаут подключения (сек)
+HTTP_CLIENT_READ_TIMEOUT = 10  # Таймаут чтения ответа (сек)
+HTTP_CLIENT_POOL_MAXSIZE = 10  # Keep-alive соединений на хост в одном процессе
+HTTP_CLIENT_RETRIES = 2  # Повторы при ошибках подключения и 429/5xx
+HTTP_CLIENT_BACKOFF_FACTOR = 0.3  # Базовая задержка между повторами (сек, растет экспоненциально)
+HTTP_CLIENT_BACKOFF_JITTER = 0.2  # Случайная добавка к задержке (сек)
+
+# Настройки фонового геокодирования адресов
+ADDRESS_GEOCODE_RETRY_AFTER = 60  # Через сколько секунд pending-адрес снова ставится в очередь (geocode_pending_addresses)
+ADDRESS_GEOCODE_RETRY_BATCH = 100  # Адресов за один запуск geocode_pending_addresses
+
+# Настройки кэша геокодирования (память процесса -> Redis -> таблица GeocodeCacheEntry)
+GEOCODE_MEMORY_CACHE_SIZE = 2048  # Записей в LRU одного процесса
+GEOCODE_MEMORY_CACHE_TTL = 3600  # Время жизни записи в памяти процесса (сек)
+GEOCODE_CACHE_TTL = 60 * 60 * 24  # Время жизни записи в Redis (сек)
+GEOCODE_REVERSE_GRID_M = 10  # Шаг сетки ключей обратного геокодирования (м)
+GEOCODE_REVERSE_NEIGHBOUR_M = 15  # Радиус поиска ближайшего сохраненного ответа (м), 0 - выключено
+GEOCODE_SINGLE_FLIGHT_WAIT_SECONDS = 5  # Сколько одинаковый запрос ждет ответа уже идущего запроса к Яндекс (сек)
+GEOCODE_SINGLE_FLIGHT_LOCK_TTL = 30  # Время жизни блокировки запроса и task_id общей задачи (сек)
+GAZETTEER_PATH = BASE_DIR / 'data' / 'gazetteer.bin'  # Локальный газеттир (manage.py build_gazetteer)
+GAZETTEER_CHECK_INTERVAL = 30  # Как часто (сек) процесс проверяет, не пересобран ли файл газеттира
+GEOCODE_INCLUDE_RAW = False  # Отладка: сохранять и отдавать полный GeoObject Яндекса в поле raw
+GEOCODE_RESULT_MAX_WAIT = 10  # Максимальное ожидание результата в GeocodeResultView с ?wait= (сек)
+
+# Настройки автодополнения адресов
+ADDRESS_AUTOCOMPLETE_TOP_K = 10  # Подсказок в узле дерева и максимум в ответе
+ADDRESS_AUTOCOMPLETE_MIN_CHARS = 2  # Минимальная длина запроса
+ADDRESS_AUTOCOMPLETE_REFRESH_INTERVAL = 5  # Как часто (сек) процесс досчитывает новые адреса в дерево
+ADDRESS_AUTOCOMPLETE_REBUILD_INTERVAL = 3600  # Полная пересборка дерева (сек)
+
+# Настройки готовых ответов каталога (меню и его синхронизация, категории, хиты, новинки, рекомендуемые)
+CATALOG_COMPRESS_MIN_BYTES = 512  # Ответы меньше этого размера не сжимаются
+CATALOG_GZIP_LEVEL = 9  # Сжатие выполняется один раз на поколение каталога, поэтому максимальное
+CATALOG_BROTLI_QUALITY = 11  # Используется, если установлен пакет brotli
+CATALOG_SYNC_MAX_CHANGES = 500  # Больше записей журнала после версии клиента - вместо дельты отдается полный снимок
+CATALOG_CHANGE_LOG_RETENTION_DAYS = 30  # Срок хранения журнала изменений (compact_catalog_changes)
+
+# Настройки поиска по меню
+MENU_SEARCH_BACKEND = 'memory'  # 'memory' - индекс в памяти процесса, 'fts5' - SQLite FTS5, 'icontains' - поиск в БД
+MENU_SEARCH_CHECK_INTERVAL = 1.0  # Как часто (сек) индекс сверяет версию каталога
+
+# Настройки индекса зон доставки
+DELIVERY_ZONE_INDEX_CHECK_INTERVAL = 1.0  # Как часто (сек) процесс сверяет версию зон с кэшем
+DELIVERY_ZONE_INDEX_VERSION_TTL = 60  # Время жизни версии зон в кэше (сек)
+DELIVERY_ZONE_GRID_CELL_DEG = 0.001  # Шаг сетки зон (~110 м по широте)
+DELIVERY_ZONE_GRID_MAX_CELLS = 500_000  # Больше ячеек - зона проверяется без сетки
+DELIVERY_ZONE_SIMPLIFY_TOLERANCE_M = 5.0  # Допуск упрощения полигонов зон для проверок принадлежности (м)
+DELIVERY_ZONE_EDGE_BUCKET_DEG = 0.005  # Шаг корзин индекса ребер для расстояния до границы зоны (~550 м)
+DELIVERY_ZONE_BATCH_MAX_POINTS = 1000  # Максимум точек в одном пакетном запросе проверки зон
+OPERATOR_ELIGIBILITY_CACHE_TTL = 300  # Время жизни матрицы допуска операторов к зонам в кэше (сек)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -326,6 +378,20 @@ CELERY_TASK_ROUTES = {
     'api.tasks.send_telegram_notification': {'queue': 'notifications'},
 }
 
+# Периодические задачи (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'geocode-pending-addresses': {
+        'task': 'api.tasks.geocode_pending_addresses',
+        'schedule': 60.0,
+    },
+    # Страховка на случай, если постановка после изменения зоны не удалась;
+    # без изменений зон задача делает один пустой запрос на таблицу
+    'refresh-delivery-zone-stamps': {
+        'task': 'api.tasks.refresh_delivery_zone_stamps',
+        'schedule': 300.0,
+    },
+}
+
 # Настройки очередей
 CELERY_TASK_DEFAULT_QUEUE = 'default'
 CELERY_TASK_QUEUES = {